@@ -0,0 +1,63 @@
+"""book full text search
+
+Revision ID: 3b7e5c1f92a4
+Revises: d40739d9a1a7
+Create Date: 2026-10-17 11:04:27.551903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7e5c1f92a4'
+down_revision: Union[str, None] = 'd40739d9a1a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# SQLite FTS5 table and sync triggers as of this revision, kept here so later
+# model changes do not alter what the migration creates
+BOOKS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE books_fts USING fts5(
+        title, author, content='books', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+    """CREATE TRIGGER books_fts_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END""",
+    """CREATE TRIGGER books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.create_index('ft_book_title_author', 'books', ['title', 'author'], unique=False, mysql_prefix='FULLTEXT')
+        op.create_index('ft_book_title', 'books', ['title'], unique=False, mysql_prefix='FULLTEXT')
+        op.create_index('ft_book_author', 'books', ['author'], unique=False, mysql_prefix='FULLTEXT')
+    elif dialect == 'sqlite':
+        for statement in BOOKS_FTS_DDL:
+            op.execute(statement)
+        # index the books that already exist
+        op.execute("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'mysql':
+        op.drop_index('ft_book_author', table_name='books')
+        op.drop_index('ft_book_title', table_name='books')
+        op.drop_index('ft_book_title_author', table_name='books')
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS books_fts_update')
+        op.execute('DROP TRIGGER IF EXISTS books_fts_delete')
+        op.execute('DROP TRIGGER IF EXISTS books_fts_insert')
+        op.execute('DROP TABLE IF EXISTS books_fts')
@@ -0,0 +1,42 @@
+"""book rating aggregates
+
+Revision ID: c6d18f0b4a57
+Revises: a91c3e5b7d20
+Create Date: 2026-10-17 17:05:51.662380
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6d18f0b4a57'
+down_revision: Union[str, None] = 'a91c3e5b7d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+AGGREGATE_COLUMNS = ['rating_sum', 'rating_count'] + [f'rating_{star}_count' for star in range(1, 6)]
+
+
+def upgrade() -> None:
+    for name in AGGREGATE_COLUMNS:
+        op.add_column('books', sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+
+    # backfill the aggregates from the existing reviews
+    histogram = ',\n'.join(
+        f'rating_{star}_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id AND reviews.rating = {star})'
+        for star in range(1, 6)
+    )
+    op.execute(f"""
+        UPDATE books SET
+        rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM reviews WHERE reviews.book_id = books.id),
+        rating_count = (SELECT COUNT(*) FROM reviews WHERE reviews.book_id = books.id),
+        {histogram}
+    """)
+
+
+def downgrade() -> None:
+    for name in reversed(AGGREGATE_COLUMNS):
+        op.drop_column('books', name)
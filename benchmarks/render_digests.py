@@ -0,0 +1,85 @@
+"""Microbenchmark for rendering notification digest emails.
+
+Renders 10k digests with the templates compiled once by EmailTemplates, and
+the first `--baseline` of them with a Jinja2 environment built for every email, the way a
+service that loads its templates per send would.
+
+Usage:
+    python -m benchmarks.render_digests [--emails 10000] [--baseline 1000] [--followers 12] [--books 3]
+"""
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+from book_api.services.notifications.templates import EmailTemplates, TEMPLATE_DIR
+import argparse
+import random
+import time
+
+MAX_LISTED = 10
+
+def make_digest(followers: int, books: int) -> dict:
+    return {
+        "followers": [
+            {"name": f"reader{i}", "profile_url": f"https://bookreads.example/users/{i}"}
+            for i in range(random.randint(0, followers))
+        ],
+        "reviews": [
+            {
+                "book_title": f"Book {book}",
+                "reviews": [
+                    {"reviewer_name": f"critic{i}", "review_url": f"https://bookreads.example/reviews/{book}-{i}"}
+                    for i in range(random.randint(1, 5))
+                ],
+            }
+            for book in range(random.randint(0, books))
+        ],
+        "max_listed": MAX_LISTED,
+    }
+
+def render_precompiled(templates: EmailTemplates, digests: list) -> int:
+    size = 0
+    for digest in digests:
+        rendered = templates.render("digest", digest)
+        size += len(rendered.html) + len(rendered.text)
+    return size
+
+def render_uncompiled(globals: dict, digests: list) -> int:
+    size = 0
+    for digest in digests:
+        env = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        env.globals.update(globals)
+        size += len(env.get_template("digest.html").render(digest))
+        size += len(env.get_template("digest.txt").render(digest))
+    return size
+
+def timed(label: str, count: int, render, *args):
+    start = time.perf_counter()
+    size = render(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28}{elapsed:8.3f}s {count / elapsed:10.0f} emails/s {elapsed / count * 1e6:8.1f} us/email ({size / 1e6:.1f} MB)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=10000)
+    parser.add_argument("--baseline", type=int, default=1000, help="Emails rendered with an environment per email, it is slow")
+    parser.add_argument("--followers", type=int, default=12, help="Most followers per digest")
+    parser.add_argument("--books", type=int, default=3, help="Most reviewed books per digest")
+    args = parser.parse_args()
+
+    random.seed(0)
+    digests = [make_digest(args.followers, args.books) for _ in range(args.emails)]
+    globals = {"frontend_url": "https://bookreads.example"}
+
+    start = time.perf_counter()
+    templates = EmailTemplates(globals=globals)
+    print(f"{'compile all templates':<28}{time.perf_counter() - start:8.3f}s")
+
+    timed("precompiled", args.emails, render_precompiled, templates, digests)
+    timed("environment per email", args.baseline, render_uncompiled, globals, digests[:args.baseline])
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,63 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
+from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from book_api.database import get_db
+from sqlalchemy import select, event, inspect
+from sqlalchemy.exc import MissingGreenlet
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.util import await_only
+from book_api.database import get_db, get_async_db
 from book_api.models import User
 from book_api import schemas
 from book_api.settings import config
+from book_api.core.cache import LRUCache, register_cache
+from book_api.core.redis_client import redis_client
+from book_api.core.password_hasher import password_hasher, PasswordHasherBusy
+from book_api.core.sessions import session_store
+import anyio
 import os 
+import time
 
 # congig variables
 SECRET_KEY = config.SECRET_KEY
 ALGORITHM = config.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = int(config.ACCESS_TOKEN_EXPIRE_MINUTES)
 
-# password context
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+# password context, with the bcrypt cost from BCRYPT_ROUNDS
+pwd_context = password_hasher.context
 
 # oauth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
+# verified claims by token, so a token's signature is checked once per TTL
+token_claims_cache = LRUCache(config.TOKEN_CACHE_SIZE, config.TOKEN_CACHE_TTL)
+
+# user principals by username, invalidated on logout and by every ORM write to a user's
+# principal fields, see drop_stale_principals. Writes that bypass the ORM, bulk UPDATE
+# statements or SQL run by hand, are only seen once the entry expires, within
+# PRINCIPAL_CACHE_TTL seconds
+principal_cache = register_cache(
+    "principals",
+    redis_client,
+    maxsize=config.PRINCIPAL_CACHE_SIZE,
+    ttl=config.PRINCIPAL_CACHE_TTL,
+    local_ttl=config.PRINCIPAL_CACHE_LOCAL_TTL
+)
+
+@dataclass(frozen=True)
+class UserPrincipal:
+    """The fields of the current user most endpoints need, cached so they can skip the users table"""
+    id: int
+    username: str
+    email: str
+    role: str
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserPrincipal":
+        return cls(id=user.id, username=user.username, email=user.email, role=user.role)
+
 # password functions 
 def verify_password(plain_password:str, hashed_password:str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -28,6 +65,26 @@ def verify_password(plain_password:str, hashed_password:str) -> bool:
 def get_password_hash(password:str) -> str:
     return pwd_context.hash(password)
 
+def get_hasher_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail='Too many sign ins at the moment, please try again shortly',
+        headers={'Retry-After': str(config.PASSWORD_HASH_RETRY_AFTER)}
+    )
+
+# async password functions, run on the password hasher's threads instead of the event loop
+async def verify_password_async(plain_password:str, hashed_password:str) -> bool:
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy:
+        raise get_hasher_busy_exception()
+
+async def get_password_hash_async(password:str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise get_hasher_busy_exception()
+
 # user functions
 def get_user(db: Session, username: str) -> User:
     return db.query(User).filter(User.username == username).first()
@@ -38,6 +95,16 @@ def authenticate_user(db: Session, username: str, password: str) -> User:
         return False
     return user
 
+async def get_user_async(db: AsyncSession, username: str) -> User:
+    result = await db.execute(select(User).filter(User.username == username))
+    return result.scalars().first()
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str) -> User:
+    user = await get_user_async(db, username)
+    if not user or not await verify_password_async(password, user.hashed_password):
+        return False
+    return user
+
 # token functions
 def get_access_token(data: dict, request: Request):
 
@@ -56,22 +123,43 @@ def get_access_token(data: dict, request: Request):
 
     return encoded_jwt
 
-# dependency for getting current user
-def get_current_user(
-    request: Request,
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    
-    credentials_exception = HTTPException(
+def get_credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail='Could not validate credentials',
         headers={'WWW-Authenticate': 'Bearer'}
     )
 
+def decode_token(token: str) -> dict:
+    """
+    Verify a token's signature and expiry and get its claims.
+
+    Claims of verified tokens are cached for TOKEN_CACHE_TTL seconds, or
+    until the token expires if that is sooner.
+
+    Raises:
+        JWTError: If the token is invalid or expired
+    """
+    claims = token_claims_cache.get(token)
+    if claims is not None and claims.get('exp', 0) > time.time():
+        return claims
+
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    token_claims_cache.set(token, claims)
+    return claims
+
+def forget_token(token: str):
+    """Drop a token's cached claims"""
+    token_claims_cache.delete(token)
+
+# token validation shared by the sync and async dependencies
+def get_token_claims(request: Request, token: str) -> dict:
+    
+    credentials_exception = get_credentials_exception()
+
     try:
 
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         
         # check ip address
         if payload.get('ip') != request.headers.get('Host', ''):
@@ -95,17 +183,132 @@ def get_current_user(
             )
 
         username: str = payload.get('sub')
-        if username is None:
-            raise credentials_exception
-            
-        user = get_user(db, username)
-        if user is None:
+        if username is None or payload.get('sid') is None:
             raise credentials_exception
             
-        return user
+        return payload
 
     except JWTError:
         raise credentials_exception
+
+# session revocation checks, the bloom filter answers most of them without Redis
+async def check_session(claims: dict):
+    if await session_store.is_revoked(claims['sid']):
+        raise get_credentials_exception()
+
+def check_session_sync(claims: dict):
+    # sync dependencies run in a worker thread, so the rare Redis confirmation goes back to the event loop
+    if session_store.might_be_revoked(claims['sid']) and anyio.from_thread.run(session_store.is_revoked, claims['sid']):
+        raise get_credentials_exception()
+
+# dependency for getting current user
+def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> User:
+    claims = get_token_claims(request, token)
+    check_session_sync(claims)
+    user = get_user(db, claims['sub'])
+    if user is None:
+        raise get_credentials_exception()
+    return user
+
+# async dependency for getting current user
+async def get_current_user_async(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    claims = get_token_claims(request, token)
+    await check_session(claims)
+    user = await get_user_async(db, claims['sub'])
+    if user is None:
+        raise get_credentials_exception()
+    return user
+
+async def get_user_principal(db: AsyncSession, username: str) -> UserPrincipal:
+    """Get a user's principal through principal_cache, None if the user does not exist"""
+    cached = await principal_cache.get(username)
+    if cached is not None:
+        return UserPrincipal(**cached)
+
+    user = await get_user_async(db, username)
+    if user is None:
+        return None
+    principal = UserPrincipal.from_user(user)
+    await principal_cache.set(username, asdict(principal))
+    return principal
+
+async def invalidate_principal(username: str):
+    """Drop a user's cached principal after their profile or role changed"""
+    await principal_cache.delete(username)
+
+async def invalidate_principals(usernames: set):
+    for username in usernames:
+        await invalidate_principal(username)
+
+# usernames whose principal a session's pending writes made stale
+STALE_PRINCIPALS = "stale_principals"
+
+def mark_principal_stale(target: User):
+    """Note the user's principal for invalidation once the session commits"""
+    stale = object_session(target).info.setdefault(STALE_PRINCIPALS, set())
+    stale.add(target.username)
+    # a renamed user's principal is cached under the old name
+    stale.update(inspect(target).attrs.username.history.deleted or ())
+
+@event.listens_for(User, "after_update")
+def user_updated(mapper, connection, target: User):
+    state = inspect(target)
+    if any(state.attrs[field].history.has_changes() for field in ("username", "email", "role")):
+        mark_principal_stale(target)
+
+@event.listens_for(User, "after_delete")
+def user_deleted(mapper, connection, target: User):
+    mark_principal_stale(target)
+
+@event.listens_for(Session, "after_commit")
+def drop_stale_principals(session: Session):
+    """Invalidate the principals of the users a committed session wrote.
+
+    Listeners cannot await, so an AsyncSession's commit, which runs them on
+    the event loop, awaits the invalidation through SQLAlchemy's greenlet
+    bridge, and a sync session on a worker thread hands it to the event loop.
+    A session used outside both, like a script's, drops the principals from
+    this process only.
+    """
+    stale = session.info.pop(STALE_PRINCIPALS, None)
+    if not stale:
+        return
+    invalidation = invalidate_principals(stale)
+    try:
+        await_only(invalidation)
+        return
+    except MissingGreenlet:
+        invalidation.close()
+    try:
+        anyio.from_thread.run(invalidate_principals, stale)
+    except RuntimeError:
+        for username in stale:
+            principal_cache.local.delete(username)
+
+@event.listens_for(Session, "after_rollback")
+def forget_stale_principals(session: Session):
+    session.info.pop(STALE_PRINCIPALS, None)
+
+# async dependency for getting the current user's principal, without a query on a cache hit
+async def get_current_principal(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> UserPrincipal:
+    claims = get_token_claims(request, token)
+    await check_session(claims)
+    principal = await get_user_principal(db, claims['sub'])
+    if principal is None:
+        raise get_credentials_exception()
+    return principal
     
 
 # dependency for getting current active user
@@ -116,9 +319,17 @@ def get_current_active_user(
         raise HTTPException(status_code=400, detail='Inactive user')
     return current_user
 
+# async dependency for getting current active user
+async def get_current_active_user_async(
+    current_user: User = Depends(get_current_user_async)
+) -> User:
+    if not current_user:
+        raise HTTPException(status_code=400, detail='Inactive user')
+    return current_user
+
 # for checking roles
 def check_role(allowed_roles: list) -> bool:
-    def check_role_decorator(current_user: User = Depends(get_current_active_user)) -> User:
+    async def check_role_decorator(current_user: UserPrincipal = Depends(get_current_principal)) -> UserPrincipal:
         if current_user.role not in allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Redis value of an invalidated key, never produced by json.dumps
+TOMBSTONE = "tombstone"
+
+class LRUCache:
+    """Bounded in-process cache that evicts the least recently used entry.
+
+    Attributes:
+        maxsize (int): Most entries kept
+        ttl (float): Seconds an entry stays valid
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class TieredCache:
+    """JSON value cache with an in-process LRU in front of Redis.
+
+    Reads try the local LRU, then Redis, and report a miss so the caller can
+    load the value and `set` it. Redis failures are logged and treated as
+    misses, so the cache never takes the endpoint down with it. Without a
+    Redis client it is a plain LRU.
+
+    The local TTL is kept short because invalidations only reach the LRU of
+    the process that made them, other processes see them once their local
+    entry expires.
+
+    A read that missed before a write can load the old value and `set` it
+    after the write invalidated the key. `delete` therefore leaves a
+    tombstone in both tiers for `tombstone_ttl` seconds, and `set` only
+    fills a key that has neither a value nor a tombstone, so such a late
+    fill is dropped instead of serving the old value for `ttl` seconds.
+
+    Attributes:
+        name (str): Cache name, used as the Redis key prefix and in metrics
+        redis (Optional[Redis]): Shared Redis client
+        ttl (int): Seconds an entry stays in Redis
+        tombstone_ttl (float): Seconds an invalidation keeps fills out, longer than a load takes
+        local (LRUCache): In-process cache
+        invalidated (LRUCache): In-process tombstones
+    """
+    def __init__(self, name: str, redis: Optional[Redis], maxsize: int, ttl: int, local_ttl: float, tombstone_ttl: float = 10.0):
+        self.name = name
+        self.redis = redis
+        self.ttl = ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.local = LRUCache(maxsize, local_ttl)
+        self.invalidated = LRUCache(maxsize, tombstone_ttl)
+        self.reset()
+
+    def reset(self):
+        self.local.clear()
+        self.invalidated.clear()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.name}:{key}"
+
+    async def get(self, key: Hashable) -> Optional[Any]:
+        """Get a cached value, None on a miss"""
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+
+        if self.redis is not None:
+            try:
+                cached = await self.redis.get(self._key(key))
+            except RedisError as e:
+                self.errors += 1
+                logger.warning(f"Cache '{self.name}' could not read {key} from Redis: {str(e)}")
+                cached = None
+            if cached is not None and cached != TOMBSTONE:
+                value = json.loads(cached)
+                self.local.set(key, value)
+                self.redis_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: Hashable, value: Any):
+        """Cache a JSON serializable value loaded after a miss, unless the key was invalidated or filled since"""
+        if self.invalidated.get(key) is not None:
+            return
+        if self.redis is not None:
+            try:
+                if not await self.redis.set(self._key(key), json.dumps(value), ex=self.ttl, nx=True):
+                    # another process invalidated or filled the key since the miss
+                    return
+            except RedisError as e:
+                self.errors += 1
+                logger.warning(f"Cache '{self.name}' could not write {key} to Redis: {str(e)}")
+        self.local.set(key, value)
+
+    async def delete(self, key: Hashable):
+        """Drop a value from both tiers and keep late fills out for tombstone_ttl seconds"""
+        self.invalidations += 1
+        self.local.delete(key)
+        self.invalidated.set(key, True)
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(self._key(key), TOMBSTONE, px=int(self.tombstone_ttl * 1000))
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Cache '{self.name}' could not invalidate {key} in Redis: {str(e)}")
+
+    def snapshot(self) -> dict:
+        """Get the hit/miss counters"""
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "backend": "redis" if self.redis is not None else "local",
+            "local_size": len(self.local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+# registry of every cache, read by the admin cache endpoint
+caches: Dict[str, TieredCache] = {}
+
+def register_cache(name: str, redis: Optional[Redis], maxsize: int, ttl: int, local_ttl: float) -> TieredCache:
+    """Create a TieredCache and register it for the admin cache endpoint"""
+    cache = TieredCache(name, redis, maxsize, ttl, local_ttl)
+    caches[name] = cache
+    return cache
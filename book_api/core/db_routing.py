@@ -0,0 +1,79 @@
+from typing import List, Optional
+import itertools
+import logging
+import threading
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+READ_ONLY_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+class ReplicaSet:
+    """Selects a read replica engine for a session.
+
+    Attributes:
+        engines (List[Engine]): Replica engines to choose from
+        strategy (str): "round_robin" cycles through the replicas,
+            "least_connections" picks the replica with the fewest checked out connections
+    """
+    STRATEGIES = ("round_robin", "least_connections")
+
+    def __init__(self, engines: List[Engine], strategy: str = "round_robin"):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown replica selection strategy '{strategy}'")
+        self.engines = engines
+        self.strategy = strategy
+        self._cycle = itertools.cycle(engines)
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> Optional[Engine]:
+        """Get the replica the next read-only session should use"""
+        if not self.engines:
+            return None
+        if self.strategy == "least_connections":
+            return min(self.engines, key=lambda engine: engine.pool.checkedout())
+        with self._lock:
+            return next(self._cycle)
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica and everything else to the primary.
+
+    A session only reads from a replica when `info["read_only"]` is set, which
+    `get_db`/`get_async_db` do for GET requests. The replica is chosen once per
+    session so every read in a request sees the same snapshot. As soon as the
+    session flushes or executes a write it pins itself to the primary, so reads
+    after a write in the same request always see that write.
+
+    Subclasses set `primary` and `replicas`.
+    """
+    primary: Engine = None
+    replicas: ReplicaSet = ReplicaSet([])
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing or is_write(clause):
+            self.info["wrote"] = True
+            return self.primary
+
+        if clause is None or not self.replicas or not self.info.get("read_only") or self.info.get("wrote"):
+            return self.primary
+
+        if "replica" not in self.info:
+            self.info["replica"] = self.replicas.choose()
+            logger.debug(f"Routing read-only session to replica {self.info['replica'].url.host}")
+        return self.info["replica"]
+
+def is_write(clause) -> bool:
+    """Check whether a statement has to run on the primary"""
+    if clause is None:
+        return False
+    # Anything that is not a plain SELECT (DML, text(), SELECT ... FOR UPDATE) is treated as a write
+    return not isinstance(clause, Select) or clause._for_update_arg is not None
+
+def routing_session_class(name: str, primary: Engine, replicas: ReplicaSet) -> type:
+    """Build a RoutingSession subclass bound to a primary engine and its replicas"""
+    return type(name, (RoutingSession,), {"primary": primary, "replicas": replicas})
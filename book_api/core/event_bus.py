@@ -1,16 +1,31 @@
-from typing import Dict, List, Any, Callable, Coroutine
+from typing import Dict, List, Any, Callable, Coroutine, Optional, Tuple
 from dataclasses import dataclass
+import asyncio
+import json
 import logging
-from sqlalchemy.orm import Session
+import time
+import uuid
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
 from book_api.services.notifications.email_service import email_service
-from book_api.database import SessionLocal
+from book_api.services.notifications.digest import DigestRouting, queue_for_digest
+from book_api.database import AsyncSessionLocal
+from book_api.settings import config
+from book_api.core.redis_client import redis_client
 from book_api.utils.book_utils import (
-    update_book_rating as update_book_rating_util, 
+    review_stats_cache,
     create_default_shelves as create_default_shelves_util
 ) 
 
 logger = logging.getLogger(__name__)
 
+# Upper bounds (in seconds) of the handler latency histogram buckets
+HANDLER_LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+def handler_name(callback: Callable) -> str:
+    """Stable name of an event handler, used for its metrics and outbox delivery state"""
+    return f"{callback.__module__}.{callback.__qualname__}"
+
 @dataclass
 class Event:
     """Event data container for the event bus system.
@@ -18,9 +33,188 @@ class Event:
     Attributes:
         name (str): The name of the event
         data (Dict[str, Any]): Dictionary containing event-related data
+        key (Optional[str]): Idempotency key of an event relayed from the outbox,
+            the same key can be delivered more than once
     """
     name: str
     data: Dict[str, Any]
+    key: Optional[str] = None
+
+class HandlerStats:
+    """Call counts and latencies of one handler for one event name.
+
+    Attributes:
+        buckets (Tuple[float, ...]): Upper bounds of the latency histogram buckets
+    """
+    def __init__(self, buckets: Tuple[float, ...] = HANDLER_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_counts = [0] * (len(self.buckets) + 1)  # Last bucket is +Inf
+
+    def record(self, seconds: float, error: bool = False, timed_out: bool = False):
+        """Record one handler call"""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self.calls += 1
+        self.errors += error
+        self.timeouts += timed_out
+        self.latency_counts[index] += 1
+        self.latency_total += seconds
+        self.latency_max = max(self.latency_max, seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "latency": {
+                "avg_seconds": self.latency_total / self.calls if self.calls else 0.0,
+                "max_seconds": self.latency_max,
+                "histogram": [
+                    {"le": bound, "count": count}
+                    for bound, count in zip(self.buckets + ("+Inf",), self.latency_counts)
+                ],
+            },
+        }
+
+def encode_stream_event(event: Event, attempts: int = 0, delivered: List[str] = ()) -> Dict[str, str]:
+    """Serialize an event to Redis stream fields, giving it an idempotency key if it has none"""
+    return {
+        "name": event.name,
+        "data": json.dumps(event.data, default=str),
+        "key": event.key or uuid.uuid4().hex,
+        "attempts": str(attempts),
+        "delivered": json.dumps(sorted(delivered)),
+    }
+
+def decode_stream_event(fields: Dict[str, str]) -> Tuple[Event, int, List[str]]:
+    """Get the event, its failed attempts and the handlers that already succeeded from stream fields"""
+    event = Event(name=fields["name"], data=json.loads(fields["data"]), key=fields.get("key") or None)
+    return event, int(fields.get("attempts", 0)), json.loads(fields.get("delivered") or "[]")
+
+class EventTransport:
+    """Carries published events from EventBus.publish to the handlers.
+
+    Subclasses decide where the handlers run, in the publishing process or
+    in consumers reading from a broker.
+    """
+    name = "base"
+
+    async def send(self, bus: "EventBus", event: Event):
+        raise NotImplementedError
+
+    async def hand_off(self, event: Event, delivered: List[str]) -> bool:
+        """Give an event to a broker that retries its handlers itself.
+
+        Args:
+            event (Event): Event to deliver
+            delivered (List[str]): Handlers that already handled the event
+
+        Returns:
+            bool: False if the transport has no broker and the caller has to run the handlers
+        """
+        return False
+
+    async def stats(self, event_names: List[str]) -> dict:
+        """Get broker side counters, empty for in-process transports"""
+        return {}
+
+class InMemoryTransport(EventTransport):
+    """Runs the handlers in the publishing process, inline or on the bus's worker queues"""
+    name = "memory"
+
+    async def send(self, bus: "EventBus", event: Event):
+        await bus.dispatch_local(event)
+
+class RedisStreamsTransport(EventTransport):
+    """Appends events to one Redis stream per event name.
+
+    The handlers run in RedisStreamConsumer tasks (see `book_api.worker`)
+    that read the streams through a consumer group, so every event is
+    handled once across all worker processes. When Redis cannot be reached
+    the event is handled in process instead of being dropped.
+
+    Attributes:
+        redis (Redis): Client the streams live on
+        prefix (str): Prefix of the stream, retry and dead-letter keys
+        group (str): Consumer group the workers read with
+        maxlen (int): Approximate number of entries kept per stream
+    """
+    name = "redis"
+
+    def __init__(self, redis: Redis, prefix: str = "events", group: str = "book_api", maxlen: int = 100000):
+        self.redis = redis
+        self.prefix = prefix
+        self.group = group
+        self.maxlen = maxlen
+
+    def stream(self, event_name: str) -> str:
+        return f"{self.prefix}:{event_name}"
+
+    @property
+    def retry_key(self) -> str:
+        """Sorted set of events waiting for a retry, scored by when they are due"""
+        return f"{self.prefix}:retry"
+
+    @property
+    def dead_letter_stream(self) -> str:
+        """Stream of events that failed every attempt"""
+        return f"{self.prefix}:dead"
+
+    async def add(self, stream: str, fields: Dict[str, str]):
+        await self.redis.xadd(stream, fields, maxlen=self.maxlen, approximate=True)
+
+    async def send(self, bus: "EventBus", event: Event):
+        if event.name not in bus.subscribers:
+            logger.warning(f"No handlers found for event: {event.name}")
+            return
+        try:
+            await self.add(self.stream(event.name), encode_stream_event(event))
+        except RedisError as e:
+            logger.error(f"Could not add event '{event.name}' to its stream, handling it in process: {str(e)}")
+            await bus.dispatch_local(event)
+
+    async def hand_off(self, event: Event, delivered: List[str]) -> bool:
+        # a RedisError propagates, the caller keeps the event and tries again later
+        await self.add(self.stream(event.name), encode_stream_event(event, delivered=delivered))
+        return True
+
+    async def stats(self, event_names: List[str]) -> dict:
+        streams = {}
+        for event_name in event_names:
+            stream = self.stream(event_name)
+            try:
+                pending = (await self.redis.xpending(stream, self.group))["pending"]
+            except ResponseError:
+                pending = 0  # no consumer has created the group yet
+            streams[event_name] = {"length": await self.redis.xlen(stream), "pending": pending}
+        return {
+            "streams": streams,
+            "retrying": await self.redis.zcard(self.retry_key),
+            "dead_letters": await self.redis.xlen(self.dead_letter_stream),
+        }
+
+def create_transport(name: str) -> EventTransport:
+    """Create the event transport configured by EVENT_TRANSPORT"""
+    if name == "memory":
+        return InMemoryTransport()
+    if name == "redis":
+        if redis_client is None:
+            raise ValueError("EVENT_TRANSPORT 'redis' needs REDIS_URL to be set")
+        return RedisStreamsTransport(
+            redis_client,
+            prefix=config.EVENT_STREAM_PREFIX,
+            group=config.EVENT_STREAM_GROUP,
+            maxlen=config.EVENT_STREAM_MAXLEN
+        )
+    raise ValueError(f"Unknown event transport '{name}'")
 
 class EventBus:
     """Event Bus implementation for handling asynchronous events and callbacks.
@@ -29,8 +223,31 @@ class EventBus:
     for asynchronous event handling. It allows components to subscribe to specific
     events and receive notifications when those events are published.
     
+    In "queued" dispatch mode `publish` only puts the event on a bounded queue
+    for its event name and returns, a pool of worker tasks per event name runs
+    the callbacks in the background. A full queue makes publishers wait up to
+    `enqueue_timeout` seconds, after that the event is handled inline so it
+    is never dropped. `drain` finishes the queued events on shutdown.
+
+    The callbacks of one event run one after another, or all at once with
+    `concurrent_handlers`, at most `max_concurrent_handlers` at a time across
+    the bus. Every call is timed per handler, and cancelled after
+    `handler_timeout` seconds when set.
+
+    Where the callbacks run is up to the transport. The in-memory transport
+    runs them in this process as described above, the Redis Streams
+    transport hands the event to worker processes.
+
     Attributes:
         subscribers (Dict[str, List[Callable]]): Dictionary mapping event names to lists of callback functions
+        dispatch (str): "inline" awaits the callbacks in publish, "queued" hands them to worker tasks
+        queue_size (int): Pending events per event name before publishers have to wait
+        workers_per_event (int): Worker tasks per event name
+        enqueue_timeout (float): Seconds a publisher waits on a full queue
+        concurrent_handlers (bool): Run the callbacks of an event concurrently
+        max_concurrent_handlers (int): Callbacks running at once in concurrent mode
+        handler_timeout (Optional[float]): Seconds before a callback is cancelled, no limit when None
+        transport (EventTransport): Carries published events to the callbacks, in-memory by default
     
     Example:
         event_bus = EventBus()
@@ -39,9 +256,39 @@ class EventBus:
         event_bus.subscribe("user_created", handle_user_created)
         await event_bus.publish(Event("user_created", {"id": 1, "name": "John"}))
     """
-    def __init__(self):
+    DISPATCH_MODES = ("inline", "queued")
+
+    def __init__(
+        self,
+        dispatch: str = "inline",
+        queue_size: int = 1000,
+        workers_per_event: int = 4,
+        enqueue_timeout: float = 1.0,
+        concurrent_handlers: bool = False,
+        max_concurrent_handlers: int = 10,
+        handler_timeout: Optional[float] = None,
+        transport: Optional[EventTransport] = None
+    ):
+        if dispatch not in self.DISPATCH_MODES:
+            raise ValueError(f"Unknown event dispatch mode '{dispatch}'")
         self.subscribers: Dict[str, List[Callable]] = {}
-        logger.info("EventBus initialized")
+        self.dispatch = dispatch
+        self.queue_size = queue_size
+        self.workers_per_event = workers_per_event
+        self.enqueue_timeout = enqueue_timeout
+        self.concurrent_handlers = concurrent_handlers
+        self.max_concurrent_handlers = max_concurrent_handlers
+        self.handler_timeout = handler_timeout
+        self.transport = transport or InMemoryTransport()
+        self._semaphore: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, List[asyncio.Task]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._draining = False
+        self.processed: Dict[str, int] = {}
+        self.overflows: Dict[str, int] = {}
+        self.handler_stats: Dict[str, Dict[str, HandlerStats]] = {}
+        logger.info(f"EventBus initialized with {dispatch} dispatch over the {self.transport.name} transport")
         
     def subscribe(self, event_name: str, callback: Callable[..., Coroutine]):
         """Subscribe a callback function to a specific event.
@@ -58,25 +305,184 @@ class EventBus:
         
     async def publish(self, event: Event):
         """Publish an event and execute all subscribed callbacks.
+
+        In queued dispatch mode, or with a broker transport, the callbacks run
+        in the background and this returns as soon as the event is handed off.
         
         Args:
             event (Event): Event instance containing the event name and data
         """
         logger.debug(f"Publishing event: {event.name} with data: {event.data}")
+        await self.transport.send(self, event)
+
+    async def dispatch_local(self, event: Event):
+        """Run the callbacks in this process, on the worker queues in queued dispatch mode"""
+        if self.dispatch == "queued" and not self._draining and event.name in self.subscribers:
+            if await self._enqueue(event):
+                return
+        await self._run_callbacks(event)
+
+    async def _run_callbacks(self, event: Event):
         if event.name in self.subscribers:
-            logger.info(f"Found {len(self.subscribers[event.name])} handler(s) for event '{event.name}'")
-            for callback in self.subscribers[event.name]:
-                try:
-                    await callback(event)
+            callbacks = list(self.subscribers[event.name])
+            logger.info(f"Found {len(callbacks)} handler(s) for event '{event.name}'")
+            errors = await self.run_handlers(event, callbacks)
+            for callback, error in zip(callbacks, errors):
+                if error is None:
                     logger.debug(f"Successfully executed handler '{callback.__name__}' for event '{event.name}'")
-                except Exception as e:
-                    logger.error(f"Error in event handler '{callback.__name__}' for event '{event.name}': {str(e)}")
+                else:
+                    logger.error(f"Error in event handler '{callback.__name__}' for event '{event.name}': {str(error)}")
         else:
             logger.warning(f"No handlers found for event: {event.name}")
 
+    async def run_handlers(self, event: Event, callbacks: List[Callable]) -> List[Optional[Exception]]:
+        """Run callbacks for an event, concurrently when concurrent_handlers is set.
+
+        Args:
+            event (Event): Event passed to every callback
+            callbacks (List[Callable]): Callbacks to run
+
+        Returns:
+            List[Optional[Exception]]: What each callback raised, None for the ones that succeeded
+        """
+        if not self.concurrent_handlers or len(callbacks) < 2:
+            return [await self._call_handler(callback, event) for callback in callbacks]
+
+        semaphore = self._get_semaphore()
+
+        async def bounded(callback: Callable) -> Optional[Exception]:
+            async with semaphore:
+                return await self._call_handler(callback, event)
+
+        return list(await asyncio.gather(*(bounded(callback) for callback in callbacks)))
+
+    async def _call_handler(self, callback: Callable, event: Event) -> Optional[Exception]:
+        """Run one callback with the handler timeout and record its latency"""
+        error = None
+        timed_out = False
+        start = time.perf_counter()
+        try:
+            if self.handler_timeout:
+                await asyncio.wait_for(callback(event), timeout=self.handler_timeout)
+            else:
+                await callback(event)
+        except asyncio.TimeoutError:
+            timed_out = True
+            error = asyncio.TimeoutError(f"timed out after {self.handler_timeout}s")
+        except Exception as e:
+            error = e
+
+        stats = self.handler_stats.setdefault(event.name, {})
+        name = handler_name(callback)
+        if name not in stats:
+            stats[name] = HandlerStats()
+        stats[name].record(time.perf_counter() - start, error=error is not None, timed_out=timed_out)
+        return error
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Get the semaphore bounding concurrent callbacks on the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore[0] is not loop:
+            self._semaphore = (loop, asyncio.Semaphore(self.max_concurrent_handlers))
+        return self._semaphore[1]
+
+    async def _enqueue(self, event: Event) -> bool:
+        """Queue an event for the workers, False if the queue stayed full"""
+        queue = self._get_queue(event.name)
+        try:
+            await asyncio.wait_for(queue.put(event), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.overflows[event.name] = self.overflows.get(event.name, 0) + 1
+            logger.warning(f"Queue for event '{event.name}' is full, handling it inline")
+            return False
+        return True
+
+    def _get_queue(self, event_name: str) -> asyncio.Queue:
+        """Get the queue for an event name, starting its workers on first use"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # queues and tasks belong to one event loop, start over on a new one
+            self._loop = loop
+            self._queues = {}
+            self._workers = {}
+
+        if event_name not in self._queues:
+            queue = asyncio.Queue(maxsize=self.queue_size)
+            self._queues[event_name] = queue
+            self._workers[event_name] = [
+                loop.create_task(self._worker(event_name, queue), name=f"event-worker-{event_name}-{i}")
+                for i in range(self.workers_per_event)
+            ]
+            logger.info(f"Started {self.workers_per_event} worker(s) for event '{event_name}'")
+        return self._queues[event_name]
+
+    async def _worker(self, event_name: str, queue: asyncio.Queue):
+        while True:
+            event = await queue.get()
+            try:
+                await self._run_callbacks(event)
+                self.processed[event_name] = self.processed.get(event_name, 0) + 1
+            finally:
+                queue.task_done()
+
+    async def drain(self, timeout: float = 30):
+        """Wait for queued events to be handled, then stop the workers.
+
+        Events published while draining are handled inline.
+
+        Args:
+            timeout (float): Seconds to wait before giving up on the remaining events
+        """
+        if not self._queues or self._loop is not asyncio.get_running_loop():
+            return
+
+        self._draining = True
+        try:
+            pending = sum(queue.qsize() for queue in self._queues.values())
+            logger.info(f"Draining {pending} queued event(s)")
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues.values())),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            pending = sum(queue.qsize() for queue in self._queues.values())
+            logger.error(f"Gave up draining the event queues with {pending} event(s) left")
+        finally:
+            workers = [task for tasks in self._workers.values() for task in tasks]
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self._queues = {}
+            self._workers = {}
+            self._draining = False
+
+    def snapshot(self) -> dict:
+        """Get queue depths, counters and handler latencies for every event name"""
+        names = set(self._queues) | set(self.processed) | set(self.overflows) | set(self.handler_stats)
+        return {
+            "dispatch": self.dispatch,
+            "transport": self.transport.name,
+            "concurrent_handlers": self.concurrent_handlers,
+            "events": {
+                name: {
+                    "queued": self._queues[name].qsize() if name in self._queues else 0,
+                    "workers": len(self._workers.get(name, [])),
+                    "processed": self.processed.get(name, 0),
+                    "overflows": self.overflows.get(name, 0),
+                    "handlers": {
+                        handler: stats.snapshot()
+                        for handler, stats in self.handler_stats.get(name, {}).items()
+                    },
+                }
+                for name in sorted(names)
+            }
+        }
+
 async def handle_update_book_rating(event: Event):
-    """Handle the update_book_rating event by updating a book's rating.
+    """Handle the update_book_rating event by invalidating the book's cached review statistics.
     
+    The rating aggregates themselves are updated with the review change.
+
     Args:
         event (Event): Event containing book_id in its data
     """
@@ -85,15 +491,11 @@ async def handle_update_book_rating(event: Event):
         book_id = event.data.get('book_id')
         if not book_id:
             raise ValueError("book_id missing from event data")
-            
-        db = SessionLocal()
-        try:
-            await update_book_rating_util(db, book_id)
-            logger.info(f"Successfully updated rating for book: {book_id}")
-        finally:
-            db.close()
+
+        await review_stats_cache.delete(book_id)
+        logger.info(f"Invalidated review statistics for book: {book_id}")
     except Exception as e:
-        logger.error(f"Failed to update book rating: {str(e)}", exc_info=True)
+        logger.error(f"Failed to invalidate review statistics: {str(e)}", exc_info=True)
 
 async def handle_user_created(event: Event):
     """Handle the user_created event by creating default shelves for the user.
@@ -107,24 +509,25 @@ async def handle_user_created(event: Event):
         if not user_id:
             raise ValueError("user_id missing from event data")
             
-        db = SessionLocal()
-        try:
+        async with AsyncSessionLocal() as db:
             await create_default_shelves_util(db, user_id)
-            logger.info(f"Successfully created default shelves for user: {user_id}")
-            await email_service.send_welcome_email(event.data.get('email'))
-        finally:
-            db.close()
+        logger.info(f"Successfully created default shelves for user: {user_id}")
+        await email_service.send_welcome_email(event.data.get('email'))
     except Exception as e:
         logger.error(f"Failed to create default shelves: {str(e)}", exc_info=True)
+        raise
 
 async def handle_new_follower(event: Event):
     """
-    Handle the new_follower event by sending an email notification to the user
+    Handle the new_follower event by sending an email notification to the user,
+    or by adding it to their digest
     Args:
         event (Event): Event containing follower_id in its data
     """
     logging.info(f"Processing new_follower event for follower: {event.data.get('follower_id')}")
     try:
+        if await queue_for_digest(event.name, event.data, event.key) is not DigestRouting.SEND:
+            return
         await email_service.follower_notification(
             event.data.get('email'), 
             event.data.get('follower_name'),
@@ -133,15 +536,19 @@ async def handle_new_follower(event: Event):
 
     except Exception as e:
         logging.error(f"Failed to send follower notification: {str(e)}", exc_info=True)
+        raise
 
 async def handle_new_review(event: Event):
     """
-    Handle the new_review event by sending an email notification to the user
+    Handle the new_review event by sending an email notification to the user,
+    or by adding it to their digest
     Args:
         event (Event): Event containing review_id in its data
     """
     logging.info(f"Processing new_review event for review: {event.data.get('review_id')}")
     try:
+        if await queue_for_digest(event.name, event.data, event.key) is not DigestRouting.SEND:
+            return
         await email_service.review_notification(
             event.data.get('email'), 
             event.data.get('book_title'),
@@ -151,9 +558,19 @@ async def handle_new_review(event: Event):
 
     except Exception as e:
         logging.error(f"Failed to send review notification: {str(e)}", exc_info=True)
+        raise
 
 # Create event bus instance
-event_bus = EventBus()
+event_bus = EventBus(
+    dispatch=config.EVENT_DISPATCH,
+    queue_size=config.EVENT_QUEUE_SIZE,
+    workers_per_event=config.EVENT_WORKERS_PER_TYPE,
+    enqueue_timeout=config.EVENT_ENQUEUE_TIMEOUT,
+    concurrent_handlers=config.EVENT_CONCURRENT_HANDLERS,
+    max_concurrent_handlers=config.EVENT_MAX_CONCURRENT_HANDLERS,
+    handler_timeout=config.EVENT_HANDLER_TIMEOUT,
+    transport=create_transport(config.EVENT_TRANSPORT)
+)
 
 # Register event handlers
 event_bus.subscribe("update_book_rating", handle_update_book_rating)
@@ -0,0 +1,119 @@
+from typing import Any, Callable, Dict, Optional
+from fastapi import Request
+from fastapi.routing import APIRoute
+import functools
+import inspect
+
+# scope key of the lazy async sessions a request handed out
+SESSIONS_SCOPE_KEY = "book_api.lazy_sessions"
+
+class LazySession:
+    """Stands in for a session until the request first uses it.
+
+    `get_db`/`get_async_db` hand out this proxy instead of a session. The
+    real session is only created, and a connection only checked out, when
+    the request first uses it, so requests that fail validation, are
+    answered from a cache or never query skip the pool entirely. Options
+    set on `info` before that are copied onto the session when it is
+    created. After `close` the next use creates a fresh session.
+
+    Attributes:
+        factory (Callable): Session maker the session is created from
+        created (int): Sessions created so far
+    """
+    def __init__(self, factory: Callable, info: Optional[Dict[str, Any]] = None):
+        self.factory = factory
+        self.created = 0
+        self._info = dict(info or {})
+        self._session = None
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        if self._session is not None:
+            return self._session.info
+        return self._info
+
+    @property
+    def session(self):
+        """The real session, created on first access"""
+        if self._session is None:
+            self._session = self.factory()
+            self._session.info.update(self._info)
+            self.created += 1
+        return self._session
+
+    @property
+    def is_open(self) -> bool:
+        """Whether a session was created and not closed since"""
+        return self._session is not None
+
+    def __getattr__(self, name: str):
+        return getattr(self.session, name)
+
+    def __contains__(self, instance) -> bool:
+        return instance in self.session
+
+    def __iter__(self):
+        return iter(self.session)
+
+    def _detach(self):
+        session, self._session = self._session, None
+        if session is not None:
+            self._info = dict(session.info)
+        return session
+
+    def close(self):
+        """Close the session and return its connection to the pool, if one was created"""
+        session = self._detach()
+        if session is not None:
+            session.close()
+
+class LazyAsyncSession(LazySession):
+    """LazySession for async session makers, `close` is awaited"""
+
+    async def close(self):
+        session = self._detach()
+        if session is not None:
+            await session.close()
+
+def track_session(request: Request, db: LazyAsyncSession):
+    """Remember a request's async session so ReleasingRoute can close it early"""
+    request.scope.setdefault(SESSIONS_SCOPE_KEY, []).append(db)
+
+async def release_sessions(request: Request):
+    """Close the async sessions a request used, their connections go back to the pool"""
+    for db in request.scope.get(SESSIONS_SCOPE_KEY, ()):
+        await db.close()
+
+class ReleasingRoute(APIRoute):
+    """Route that closes the request's async sessions as soon as the endpoint returns.
+
+    FastAPI closes yield dependencies only after the response model has been
+    validated and serialized, so a session would hold its connection for the
+    whole serialization. Async sessions cannot lazy load while a response is
+    serialized anyway and `AsyncSessionLocal` keeps loaded attributes after
+    commit, so their connections go back to the pool before serialization
+    starts, including the ones only the auth dependencies used. Sync sessions
+    stay open until the dependency exits, their relationships may still lazy
+    load during serialization.
+    """
+    def get_route_handler(self):
+        endpoint = self.dependant.call
+        if not inspect.iscoroutinefunction(endpoint):
+            return super().get_route_handler()
+
+        # the wrapper needs the request even when the endpoint does not declare it
+        declared = self.dependant.request_param_name
+        request_param = declared or "_releasing_request"
+
+        @functools.wraps(endpoint)
+        async def releasing_endpoint(**kwargs):
+            request = kwargs[request_param] if declared else kwargs.pop(request_param)
+            try:
+                return await endpoint(**kwargs)
+            finally:
+                await release_sessions(request)
+
+        self.dependant.call = releasing_endpoint
+        self.dependant.request_param_name = request_param
+        return super().get_route_handler()
@@ -0,0 +1,233 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import select, delete, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from book_api.models import OutboxEvent
+from book_api.database import AsyncSessionLocal
+from book_api.settings import config
+from book_api.core.event_bus import Event, event_bus, handler_name
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+def add_outbox_event(db, name: str, data: dict, idempotency_key: Optional[str] = None) -> OutboxEvent:
+    """
+    Add an event to the outbox in the session's current transaction.
+
+    The event is only delivered if the transaction commits, and it is
+    delivered even if the process dies right after the commit.
+
+    Args:
+        db (Session | AsyncSession): Session holding the domain change
+        name (str): Event name
+        data (dict): JSON serializable event data
+        idempotency_key (Optional[str]): Key handlers can deduplicate on, random when not given
+
+    Returns:
+        OutboxEvent: The pending outbox row
+    """
+    row = OutboxEvent(
+        event_name=name,
+        payload=data,
+        idempotency_key=idempotency_key or uuid.uuid4().hex
+    )
+    db.add(row)
+    return row
+
+@dataclass
+class ClaimedEvent:
+    """An outbox row claimed by a relay, detached from the claiming transaction"""
+    id: int
+    event: Event
+    attempts: int
+    delivered: Set[str]
+
+class OutboxRelay:
+    """Delivers outbox rows to the subscribers of an EventBus.
+
+    Every pass claims a batch of due rows with SELECT ... FOR UPDATE SKIP LOCKED,
+    so several relays can run side by side. The claim counts the attempt and
+    moves the rows' `available_at` `lease` seconds ahead, then commits, so
+    no row lock, transaction or pooled connection is held while the events
+    are delivered. A relay that dies mid-batch leaves its rows to be claimed
+    again once the lease runs out.
+
+    With a broker transport the event is handed to the broker, which runs
+    and retries the handlers in its consumers. Otherwise the relay calls
+    each subscriber that has not handled the row yet. The outcome is
+    written in a second short transaction: a row is marked dispatched once
+    every subscriber succeeded or the broker took it, otherwise it is
+    retried with exponential backoff until `max_attempts`. Delivery is at
+    least once and handlers should deduplicate on `Event.key`, the row's
+    idempotency key. Up to `concurrency` events of a batch are delivered at
+    once, so the emails their handlers wait on are queued together and go
+    out in shared delivery batches instead of one send per event.
+
+    Attributes:
+        session_factory (async_sessionmaker): Factory for the relay's sessions
+        bus (EventBus): Event bus whose subscribers receive the events
+        batch_size (int): Rows claimed per pass
+        poll_interval (float): Seconds to sleep when the outbox is empty
+        max_attempts (int): Delivery attempts before a row is given up on
+        retry_delay (float): Seconds before the first retry, doubled on every attempt
+        retention (timedelta): How long dispatched rows are kept
+        lease (float): Seconds a claimed row is left alone by other relays
+        concurrency (int): Claimed events delivered at once
+    """
+    MAX_RETRY_DELAY = 3600
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        bus,
+        batch_size: int = 100,
+        poll_interval: float = 1.0,
+        max_attempts: int = 10,
+        retry_delay: float = 5.0,
+        retention: timedelta = timedelta(days=7),
+        lease: float = 300.0,
+        concurrency: int = 10
+    ):
+        self.session_factory = session_factory
+        self.bus = bus
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retention = retention
+        self.lease = lease
+        self.concurrency = concurrency
+
+    async def relay_once(self) -> int:
+        """
+        Deliver one batch of due outbox rows.
+
+        Returns:
+            int: Number of rows attempted
+        """
+        claimed = await self._claim()
+        if not claimed:
+            return 0
+
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def deliver(claim: ClaimedEvent) -> List[str]:
+            async with slots:
+                return await self._deliver(claim)
+
+        errors = await asyncio.gather(*(deliver(claim) for claim in claimed))
+        await self._record(list(zip(claimed, errors)))
+        return len(claimed)
+
+    async def _claim(self) -> List[ClaimedEvent]:
+        async with self.session_factory() as db:
+            now = datetime.utcnow()
+            rows = (await db.scalars(
+                select(OutboxEvent)
+                .where(
+                    OutboxEvent.dispatched_at.is_(None),
+                    OutboxEvent.available_at <= now,
+                    OutboxEvent.attempts < self.max_attempts
+                )
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )).all()
+
+            claimed = []
+            for row in rows:
+                # counted up front, so an event that kills the relay is still given up on
+                row.attempts += 1
+                row.available_at = now + timedelta(seconds=self.lease)
+                claimed.append(ClaimedEvent(
+                    id=row.id,
+                    event=Event(name=row.event_name, data=row.payload, key=row.idempotency_key),
+                    attempts=row.attempts,
+                    delivered=set(row.delivered_handlers or [])
+                ))
+            await db.commit()
+            return claimed
+
+    async def _deliver(self, claim: ClaimedEvent) -> List[str]:
+        """Deliver a claimed event, returning the errors of the handlers that failed"""
+        try:
+            if await self.bus.transport.hand_off(claim.event, sorted(claim.delivered)):
+                return []
+        except Exception as e:
+            return [f"{self.bus.transport.name} transport: {str(e)}"]
+
+        pending = [
+            callback for callback in self.bus.subscribers.get(claim.event.name, [])
+            if handler_name(callback) not in claim.delivered
+        ]
+        errors = []
+        for callback, error in zip(pending, await self.bus.run_handlers(claim.event, pending)):
+            if error is None:
+                claim.delivered.add(handler_name(callback))
+            else:
+                errors.append(f"{handler_name(callback)}: {str(error)}")
+        return errors
+
+    async def _record(self, outcomes: List[Tuple[ClaimedEvent, List[str]]]):
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            for claim, errors in outcomes:
+                values = {"delivered_handlers": sorted(claim.delivered)}
+                if not errors:
+                    values.update(dispatched_at=now, last_error=None)
+                else:
+                    values["last_error"] = "; ".join(errors)
+                    delay = min(self.retry_delay * 2 ** (claim.attempts - 1), self.MAX_RETRY_DELAY)
+                    values["available_at"] = now + timedelta(seconds=delay)
+                    if claim.attempts >= self.max_attempts:
+                        logger.error(f"Giving up on outbox event {claim.id} '{claim.event.name}' after {claim.attempts} attempts: {values['last_error']}")
+                    else:
+                        logger.warning(f"Outbox event {claim.id} '{claim.event.name}' failed, retrying in {delay}s: {values['last_error']}")
+                await db.execute(update(OutboxEvent).where(OutboxEvent.id == claim.id).values(**values))
+            await db.commit()
+
+    async def purge(self, db: AsyncSession) -> int:
+        """Delete dispatched rows older than the retention period"""
+        result = await db.execute(
+            delete(OutboxEvent).where(OutboxEvent.dispatched_at < datetime.utcnow() - self.retention)
+        )
+        await db.commit()
+        return result.rowcount
+
+    async def run(self, stop: asyncio.Event):
+        """
+        Relay batches until `stop` is set, sleeping while the outbox is empty.
+
+        Args:
+            stop (asyncio.Event): Set to stop after the current batch
+        """
+        logger.info("Outbox relay started")
+        while not stop.is_set():
+            try:
+                delivered = await self.relay_once()
+                if delivered:
+                    continue
+                async with self.session_factory() as db:
+                    await self.purge(db)
+            except Exception as e:
+                logger.error(f"Outbox relay pass failed: {str(e)}", exc_info=True)
+
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.info("Outbox relay stopped")
+
+outbox_relay = OutboxRelay(
+    AsyncSessionLocal,
+    event_bus,
+    batch_size=config.OUTBOX_BATCH_SIZE,
+    poll_interval=config.OUTBOX_POLL_INTERVAL,
+    max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+    retention=timedelta(days=config.OUTBOX_RETENTION_DAYS),
+    lease=config.OUTBOX_CLAIM_LEASE,
+    concurrency=config.OUTBOX_DELIVERY_CONCURRENCY
+)
@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+from passlib.context import CryptContext
+from book_api.settings import config
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the queue wait time histogram buckets
+QUEUE_WAIT_BUCKETS: Tuple[float, ...] = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a dedicated, bounded thread pool.
+
+    A bcrypt call takes 100-300 ms of CPU at the default cost. Run on the
+    event loop it stalls every other request of the worker, so calls go to
+    `workers` threads instead, bcrypt releases the GIL while it hashes. At
+    most `max_queue` calls wait for a thread, further calls raise
+    PasswordHasherBusy right away so a login burst is shed instead of
+    piling up behind the pool.
+
+    Attributes:
+        context (CryptContext): Passlib context with the configured bcrypt cost
+        workers (int): Threads running bcrypt
+        max_queue (int): Calls that may wait for a thread
+        buckets (Tuple[float, ...]): Upper bounds of the queue wait time histogram buckets
+
+    Example:
+        hasher = PasswordHasher(rounds=12, workers=2, max_queue=32)
+        hashed = await hasher.hash("secret")
+        assert await hasher.verify("secret", hashed)
+    """
+    def __init__(self, rounds: int = 12, workers: int = 2, max_queue: int = 32, buckets: Tuple[float, ...] = QUEUE_WAIT_BUCKETS):
+        self.context = CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__rounds=rounds)
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self.buckets = tuple(sorted(buckets))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.reset()
+
+    def reset(self):
+        """Reset every counter and the wait time histogram"""
+        self.pending = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.wait_time_counts = [0] * (len(self.buckets) + 1)  # Last bucket is +Inf
+        self.run_time_total = 0.0
+
+    @property
+    def queued(self) -> int:
+        """Calls waiting for a thread"""
+        return max(self.pending - self.workers, 0)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hasher")
+        return self._executor
+
+    async def _run(self, func: Callable, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Password hashing queue is full with {self.queued} call(s) waiting, shedding load")
+            raise PasswordHasherBusy()
+
+        self.pending += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        submitted = time.monotonic()
+        try:
+            started, result = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), self._timed, func, *args
+            )
+        finally:
+            self.pending -= 1
+        self._record(started - submitted, time.monotonic() - started)
+        return result
+
+    @staticmethod
+    def _timed(func: Callable, *args):
+        return time.monotonic(), func(*args)
+
+    def _record(self, waited: float, ran: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if waited <= bound:
+                index = i
+                break
+        self.completed += 1
+        self.wait_time_counts[index] += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.run_time_total += ran
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password on the pool.
+
+        Raises:
+            PasswordHasherBusy: If the queue is full
+        """
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Check a password against its hash on the pool.
+
+        Raises:
+            PasswordHasherBusy: If the queue is full
+        """
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    def shutdown(self):
+        """Stop the threads once the running calls finish, a later call starts new ones"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def snapshot(self) -> dict:
+        """Get queue depth, shed calls and wait times"""
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_progress": min(self.pending, self.workers),
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "run_time_avg_seconds": self.run_time_total / self.completed if self.completed else 0.0,
+            "wait_time": {
+                "avg_seconds": self.wait_time_total / self.completed if self.completed else 0.0,
+                "max_seconds": self.wait_time_max,
+                "histogram": [
+                    {"le": bound, "count": count}
+                    for bound, count in zip(self.buckets + ("+Inf",), self.wait_time_counts)
+                ],
+            },
+        }
+
+password_hasher = PasswordHasher(
+    rounds=config.BCRYPT_ROUNDS,
+    workers=config.PASSWORD_HASH_WORKERS,
+    max_queue=config.PASSWORD_HASH_QUEUE_SIZE
+)
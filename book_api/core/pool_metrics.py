@@ -0,0 +1,163 @@
+from typing import Dict, Optional, Tuple, Type
+import logging
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the checkout wait time histogram buckets
+WAIT_TIME_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+class PoolMetrics:
+    """Connection pool statistics for a single database engine.
+
+    Checkout, checkin and connect counts are collected through SQLAlchemy pool
+    event listeners. Checkout wait times and pool timeouts are reported by the
+    instrumented pool class returned from `instrumented_pool_class`.
+
+    Attributes:
+        name (str): Name the engine is reported under
+        buckets (Tuple[float, ...]): Upper bounds of the wait time histogram buckets
+        engine (Optional[Engine]): Engine the listeners are attached to
+
+    Example:
+        metrics = PoolMetrics("primary")
+        engine = create_engine(url, poolclass=instrumented_pool_class(QueuePool, metrics))
+        metrics.attach(engine)
+        metrics.snapshot()
+    """
+    def __init__(self, name: str, buckets: Tuple[float, ...] = WAIT_TIME_BUCKETS):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self.engine: Optional[Engine] = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset every counter and the wait time histogram"""
+        with self._lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.timeouts = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+            self.wait_time_counts = [0] * (len(self.buckets) + 1)  # Last bucket is +Inf
+
+    def attach(self, engine: Engine):
+        """Register the pool event listeners on an engine.
+
+        Args:
+            engine (Engine): Sync engine, or the `sync_engine` of an async engine
+        """
+        self.engine = engine
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        logger.info(f"Pool metrics attached to engine '{self.name}'")
+
+    def record_wait(self, seconds: float):
+        """Record how long a checkout waited for a connection"""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        with self._lock:
+            self.wait_time_counts[index] += 1
+            self.wait_time_total += seconds
+            self.wait_time_max = max(self.wait_time_max, seconds)
+
+    def record_timeout(self):
+        """Record a checkout that gave up after pool_timeout"""
+        with self._lock:
+            self.timeouts += 1
+        logger.warning(f"Connection pool '{self.name}' timed out waiting for a connection")
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checkins += 1
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        """Get the live pool status together with the collected counters"""
+        pool = self.engine.pool if self.engine is not None else None
+        status = {}
+        if pool is not None and hasattr(pool, "checkedout"):
+            status = {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+            }
+
+        with self._lock:
+            waits = sum(self.wait_time_counts)
+            histogram = [
+                {"le": bound, "count": count}
+                for bound, count in zip(self.buckets + ("+Inf",), self.wait_time_counts)
+            ]
+            return {
+                **status,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_time": {
+                    "count": waits,
+                    "avg_seconds": self.wait_time_total / waits if waits else 0.0,
+                    "max_seconds": self.wait_time_max,
+                    "histogram": histogram,
+                },
+            }
+
+def instrumented_pool_class(base: Type[Pool], metrics: PoolMetrics) -> Type[Pool]:
+    """Build a pool class that times every checkout and reports it to `metrics`.
+
+    The metrics are bound on the class so they survive `Pool.recreate()`.
+
+    Args:
+        base (Type[Pool]): Pool class to instrument, e.g. QueuePool
+        metrics (PoolMetrics): Metrics the wait times and timeouts are reported to
+
+    Returns:
+        Type[Pool]: Subclass of `base` to pass as `poolclass`
+    """
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = base.connect(self)
+        except PoolTimeoutError:
+            metrics.record_timeout()
+            raise
+        metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    return type(f"Instrumented{base.__name__}", (base,), {"connect": connect})
+
+# Pool metrics for every engine, keyed by the name they are reported under
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+def register_pool_metrics(name: str) -> PoolMetrics:
+    """Create and register the pool metrics for an engine"""
+    metrics = PoolMetrics(name)
+    pool_metrics[name] = metrics
+    return metrics
@@ -1,4 +1,235 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from typing import Callable, Dict, List, Optional, Tuple
+from fastapi import Request
+from jose import JWTError
+from limits import RateLimitItem, parse_many
+from limits.aio.storage import Storage
+from limits.aio.strategies import STRATEGIES, RateLimiter
+from limits.storage import storage_from_string
+from book_api.auth import decode_token
+from book_api.core.cache import LRUCache
+from book_api.settings import config
+import asyncio
+import logging
+import threading
+import time
 
-limiter = Limiter(key_func=get_remote_address)
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """In-process token bucket.
+
+    Tokens refill continuously at `rate` per second up to `capacity`, so
+    bursts up to the capacity pass at once and the long run average is
+    held at the rate.
+
+    Attributes:
+        rate (float): Tokens added per second
+        capacity (float): Most tokens the bucket holds, defaults to one second of tokens
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens if the bucket has them.
+
+        Args:
+            tokens (float): Tokens to take
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1):
+        """Wait until the tokens are available and take them"""
+        while (wait := self.try_acquire(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+def get_remote_address(request: Request) -> str:
+    """Client address of a request, 127.0.0.1 when the server does not know it"""
+    if not request.client or not request.client.host:
+        return "127.0.0.1"
+    return request.client.host
+
+def get_rate_limit_key(request: Request) -> str:
+    """Key limits by the authenticated user, and by client address for anonymous requests"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            # only a verified token names the user, anything else counts against the address
+            return f"user:{decode_token(token)['sub']}"
+        except (JWTError, KeyError):
+            pass
+    return f"ip:{get_remote_address(request)}"
+
+def async_storage(uri: str) -> Storage:
+    """limits asyncio storage for a storage URI, Redis is reached through redis-py like everywhere else"""
+    options = {"implementation": "redispy"} if uri.startswith("redis") else {}
+    return storage_from_string(f"async+{uri}", **options)
+
+class PrecheckedRateLimiter:
+    """A shared rate limiter with an in-process token bucket in front of it.
+
+    Every limit and key gets a bucket holding the limit's amount and
+    refilling at amount per window. Within any window the bucket never
+    runs dry before this process alone used up the whole limit, so a
+    request the bucket turns away is over the shared limit too, and it is
+    rejected without a round trip to the shared storage. Only requests
+    the bucket lets through are counted in the shared storage.
+
+    Attributes:
+        shared (RateLimiter): limits asyncio rate limiter on the shared storage
+        buckets (LRUCache): Token buckets by limit and key
+    """
+    def __init__(self, shared: RateLimiter, max_buckets: int = 10000):
+        self.shared = shared
+        # an evicted or expired bucket comes back full, which only lets more through
+        self.buckets = LRUCache(max_buckets, float("inf"))
+        self.local_rejections = 0
+        self.shared_checks = 0
+
+    def _bucket(self, item: RateLimitItem, identifiers: tuple) -> TokenBucket:
+        key = item.key_for(*identifiers)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(item.amount / item.get_expiry(), capacity=item.amount)
+            self.buckets.set(key, bucket)
+        return bucket
+
+    async def hit(self, item: RateLimitItem, *identifiers: str, cost: int = 1) -> bool:
+        if self._bucket(item, identifiers).try_acquire(cost) > 0:
+            self.local_rejections += 1
+            return False
+        self.shared_checks += 1
+        return await self.shared.hit(item, *identifiers, cost=cost)
+
+    async def test(self, item: RateLimitItem, *identifiers: str, cost: int = 1) -> bool:
+        return await self.shared.test(item, *identifiers, cost=cost)
+
+    async def get_window_stats(self, item: RateLimitItem, *identifiers: str):
+        return await self.shared.get_window_stats(item, *identifiers)
+
+    async def clear(self, item: RateLimitItem, *identifiers: str):
+        self.buckets.delete(item.key_for(*identifiers))
+        await self.shared.clear(item, *identifiers)
+
+    def snapshot(self) -> dict:
+        return {
+            "buckets": len(self.buckets),
+            "local_rejections": self.local_rejections,
+            "shared_checks": self.shared_checks,
+        }
+
+def endpoint_scope(endpoint: Callable) -> str:
+    """Name the limits of an endpoint are counted under"""
+    return f"{endpoint.__module__}.{endpoint.__name__}"
+
+class PrecheckedLimiter:
+    """Endpoint rate limits counted on limits' asyncio storage behind a PrecheckedRateLimiter.
+
+    `limit` only registers an endpoint's limits and returns the endpoint
+    unwrapped, they are counted once per request by `check`, which
+    RequestGateMiddleware awaits before routing. The storage is asyncio
+    throughout, so a check against Redis never blocks the event loop.
+
+    Attributes:
+        key_func (Callable[[Request], str]): Default key the requests are counted by
+        storage_uri (str): limits storage URI, like memory:// or redis://host:6379/1
+        strategy (str): limits strategy name, like moving-window
+        swallow_errors (bool): Let requests through when the storage fails, instead of raising
+        enabled (bool): Whether limits are checked at all
+        limiter (PrecheckedRateLimiter): The prechecked limiter on the storage
+        route_limits (Dict[str, List[Tuple[RateLimitItem, Callable]]]): Limits and their key
+            functions by endpoint scope
+    """
+    def __init__(
+        self,
+        key_func: Callable[[Request], str],
+        storage_uri: str = "memory://",
+        strategy: str = "fixed-window",
+        swallow_errors: bool = False,
+        precheck_size: int = 10000,
+        enabled: bool = True
+    ):
+        self.key_func = key_func
+        self.storage_uri = storage_uri
+        self.strategy = strategy
+        self.swallow_errors = swallow_errors
+        self.enabled = enabled
+        self.storage = async_storage(storage_uri)
+        self.limiter = PrecheckedRateLimiter(STRATEGIES[strategy](self.storage), precheck_size)
+        self.route_limits: Dict[str, List[Tuple[RateLimitItem, Callable]]] = {}
+
+    def limit(self, limit_value: str, key_func: Optional[Callable[[Request], str]] = None) -> Callable:
+        """
+        Register limits for an endpoint.
+
+        Args:
+            limit_value (str): Limits like "30/minute", separated by ";"
+            key_func (Optional[Callable]): Key the requests are counted by, defaults to the limiter's
+
+        Returns:
+            Callable: Decorator that registers the limits and returns the endpoint as is
+        """
+        items = [(item, key_func or self.key_func) for item in parse_many(limit_value)]
+
+        def decorator(endpoint: Callable) -> Callable:
+            self.route_limits.setdefault(endpoint_scope(endpoint), []).extend(items)
+            return endpoint
+        return decorator
+
+    async def check(self, request: Request, endpoint: Callable) -> Optional[RateLimitItem]:
+        """
+        Count a request against the limits of the endpoint it is routed to.
+
+        Returns:
+            Optional[RateLimitItem]: The limit the request is over, None if it may go on
+        """
+        if not self.enabled:
+            return None
+        scope = endpoint_scope(endpoint)
+        for item, key_func in self.route_limits.get(scope, ()):
+            try:
+                if not await self.limiter.hit(item, key_func(request), scope):
+                    return item
+            except Exception as e:
+                if not self.swallow_errors:
+                    raise
+                logger.warning(f"Could not check the rate limit of {scope}: {str(e)}")
+        return None
+
+    async def reset(self):
+        """Clear the shared storage and the token buckets"""
+        await self.storage.reset()
+        self.limiter.buckets.clear()
+
+    def snapshot(self) -> dict:
+        """Get the storage and the precheck counters"""
+        return {
+            "storage": self.storage_uri.split("://", 1)[0],
+            "strategy": self.strategy,
+            **self.limiter.snapshot(),
+        }
+
+# limits shared by every process through Redis when configured, Redis errors let requests through
+limiter = PrecheckedLimiter(
+    key_func=get_rate_limit_key,
+    storage_uri=config.RATE_LIMIT_STORAGE_URI or config.REDIS_URL or "memory://",
+    strategy=config.RATE_LIMIT_STRATEGY,
+    swallow_errors=True,
+    precheck_size=config.RATE_LIMIT_PRECHECK_SIZE
+)
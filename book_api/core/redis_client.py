@@ -0,0 +1,16 @@
+from typing import Optional
+from redis.asyncio import Redis
+from book_api.settings import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+def create_redis(url: Optional[str]) -> Optional[Redis]:
+    """Create an asyncio Redis client, None when Redis is not configured"""
+    if not url:
+        logger.info("REDIS_URL is not set, Redis backed features fall back to in-process state")
+        return None
+    return Redis.from_url(url, decode_responses=True)
+
+# shared client, connections are opened lazily on first use
+redis_client: Optional[Redis] = create_redis(config.REDIS_URL)
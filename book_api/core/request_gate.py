@@ -0,0 +1,86 @@
+from typing import Callable, Optional
+from jose import JWTError
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+from book_api.auth import decode_token
+from book_api.core.rate_limiter import limiter
+from book_api.core.sessions import session_store
+import logging
+
+logger = logging.getLogger(__name__)
+
+# paths that take no token, a stale one sent along must not lock the client out of logging in again
+PUBLIC_PATHS = {"/", "/health", "/token", "/users/login", "/users/refresh", "/docs", "/redoc", "/openapi.json"}
+
+# public routes sharing their path with routes that need a token, signing up shares /users/ with the user listing
+PUBLIC_ROUTES = {("POST", "/users/")}
+
+def find_endpoint(scope: Scope) -> Optional[Callable]:
+    """Get the endpoint the router will send a request to, None if no route matches"""
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "endpoint", None)
+    return None
+
+class RequestGateMiddleware:
+    """Rejects bad tokens and over-limit requests before routing.
+
+    Runs ahead of routing and dependency resolution, so a flood of bad
+    tokens or over-limit requests is turned away before any dependency
+    opens a database session. A bearer token must carry a valid signature,
+    must not be expired and its session must not be revoked. The token
+    binding and the user lookup stay in the auth dependencies. The
+    endpoint's `@limiter.limit` limits are then counted here, the
+    decorator only registers them.
+
+    Attributes:
+        app (ASGIApp): The wrapped application
+        public_paths (set): Paths whose token is not checked
+        public_routes (set): Method and path pairs whose token is not checked
+    """
+    def __init__(self, app: ASGIApp, public_paths: set = PUBLIC_PATHS, public_routes: set = PUBLIC_ROUTES):
+        self.app = app
+        self.public_paths = public_paths
+        self.public_routes = public_routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope, receive)
+        response = await self._check_token(request) or await self._check_limits(request)
+        if response is not None:
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+    def _is_public(self, request: Request) -> bool:
+        path = request.url.path
+        return path in self.public_paths or (request.method, path) in self.public_routes
+
+    async def _check_token(self, request: Request) -> Optional[JSONResponse]:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token or self._is_public(request):
+            return None
+        try:
+            claims = decode_token(token)
+            if claims.get("sub") is not None and claims.get("sid") is not None and not await session_store.is_revoked(claims["sid"]):
+                return None
+        except JWTError:
+            pass
+        return JSONResponse(
+            status_code=401,
+            content={"detail": "Could not validate credentials"},
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    async def _check_limits(self, request: Request) -> Optional[JSONResponse]:
+        endpoint = find_endpoint(request.scope)
+        if endpoint is None:
+            return None
+        exceeded = await limiter.check(request, endpoint)
+        if exceeded is None:
+            return None
+        return JSONResponse(status_code=429, content={"error": f"Rate limit exceeded: {exceeded}"})
@@ -0,0 +1,293 @@
+from typing import Dict, Iterable, Optional, Set, Tuple
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, WatchError
+from book_api.core.redis_client import redis_client
+from book_api.settings import config
+import asyncio
+import hashlib
+import logging
+import math
+import secrets
+import time
+
+logger = logging.getLogger(__name__)
+
+class BloomFilter:
+    """Fixed size set membership filter.
+
+    `in` can report items that were never added, at about `error_rate` once
+    `capacity` items are in, but never misses an item that was added.
+
+    Attributes:
+        size (int): Bits in the filter
+        hashes (int): Bits set per item
+        count (int): Items added
+    """
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        # double hashing, two 64 bit halves of one digest give every position
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+def hash_refresh_secret(secret: str) -> str:
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+class SessionStore:
+    """Login sessions, their refresh tokens and revoked sessions.
+
+    Every login creates a session. Access tokens carry the session id in
+    their `sid` claim and refresh tokens are `<sid>.<secret>`, only a hash
+    of the secret is stored. Refreshing rotates the secret, presenting an
+    old secret again revokes the whole session, since one of the two
+    parties holding it stole it.
+
+    Revoked session ids are kept until the last access token issued for
+    them has expired. Every process holds them in a bloom filter, so the
+    revocation check on an authenticated request costs no Redis round trip
+    unless the filter reports the session, which Redis then confirms. The
+    filter is rebuilt from Redis every `sync_interval` seconds by `run`,
+    so a revocation made by another process takes effect here within that
+    interval. Without a Redis client the store keeps everything in
+    process and drops expired sessions on every rebuild.
+
+    Attributes:
+        redis (Optional[Redis]): Shared Redis client
+        prefix (str): Redis key prefix
+        session_ttl (int): Seconds a session lives without being refreshed
+        revocation_ttl (int): Seconds a revocation is kept, the access token lifetime
+        capacity (int): Revocations the bloom filter is sized for
+        error_rate (float): Bloom filter false positive rate at capacity
+        sync_interval (float): Seconds between bloom filter rebuilds
+    """
+    def __init__(
+        self,
+        redis: Optional[Redis],
+        prefix: str = "sessions",
+        session_ttl: int = 30 * 24 * 3600,
+        revocation_ttl: int = 1800,
+        capacity: int = 100000,
+        error_rate: float = 0.001,
+        sync_interval: float = 5.0
+    ):
+        self.redis = redis
+        self.prefix = prefix
+        self.session_ttl = session_ttl
+        self.revocation_ttl = revocation_ttl
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.reset()
+
+    def reset(self):
+        self._sessions: Dict[str, Tuple[str, str, float]] = {}  # sid -> (username, refresh hash, expires at)
+        self._revoked: Dict[str, float] = {}  # sid -> expires at
+        self._rebuilding: Optional[Set[str]] = None
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.checks = 0
+        self.bloom_hits = 0
+        self.confirmed = 0
+        self.errors = 0
+
+    @property
+    def revoked_key(self) -> str:
+        return f"{self.prefix}:revoked"
+
+    def _session_key(self, sid: str) -> str:
+        return f"{self.prefix}:{sid}"
+
+    async def create(self, username: str) -> Tuple[str, str]:
+        """
+        Start a session for a user.
+
+        Returns:
+            Tuple[str, str]: The session id and its refresh token
+        """
+        sid = secrets.token_urlsafe(16)
+        secret = secrets.token_urlsafe(32)
+        if self.redis is None:
+            self._sessions[sid] = (username, hash_refresh_secret(secret), time.time() + self.session_ttl)
+        else:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(self._session_key(sid), mapping={"username": username, "refresh_hash": hash_refresh_secret(secret)})
+                pipe.expire(self._session_key(sid), self.session_ttl)
+                await pipe.execute()
+        return sid, f"{sid}.{secret}"
+
+    async def rotate(self, refresh_token: str) -> Optional[Tuple[str, str, str]]:
+        """
+        Exchange a refresh token for a new one of the same session.
+
+        Returns:
+            Optional[Tuple[str, str, str]]: The session id, the username and the new
+                refresh token, None if the token is not valid
+        """
+        sid, _, secret = refresh_token.partition(".")
+        if not sid or not secret:
+            return None
+        new_secret = secrets.token_urlsafe(32)
+
+        if self.redis is None:
+            session = self._sessions.get(sid)
+            if session is None or session[2] <= time.time():
+                return None
+            username, refresh_hash, _ = session
+            if not secrets.compare_digest(refresh_hash, hash_refresh_secret(secret)):
+                logger.warning(f"Refresh token of session {sid} was reused, revoking the session")
+                await self.revoke(sid)
+                return None
+            self._sessions[sid] = (username, hash_refresh_secret(new_secret), time.time() + self.session_ttl)
+            return sid, username, f"{sid}.{new_secret}"
+
+        key = self._session_key(sid)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                # a concurrent rotation of the same token changes the key and fails the transaction
+                await pipe.watch(key)
+                session = await pipe.hgetall(key)
+                if not session:
+                    return None
+                if not secrets.compare_digest(session["refresh_hash"], hash_refresh_secret(secret)):
+                    await pipe.unwatch()
+                    logger.warning(f"Refresh token of session {sid} was reused, revoking the session")
+                    await self.revoke(sid)
+                    return None
+                pipe.multi()
+                pipe.hset(key, "refresh_hash", hash_refresh_secret(new_secret))
+                pipe.expire(key, self.session_ttl)
+                await pipe.execute()
+        except WatchError:
+            return None
+        return sid, session["username"], f"{sid}.{new_secret}"
+
+    async def revoke(self, sid: str):
+        """End a session, its refresh token stops working and its access tokens are rejected"""
+        expires_at = time.time() + self.revocation_ttl
+        if self.redis is None:
+            self._sessions.pop(sid, None)
+            self._revoked[sid] = expires_at
+        else:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(self._session_key(sid))
+                pipe.zadd(self.revoked_key, {sid: expires_at})
+                await pipe.execute()
+        self.bloom.add(sid)
+        if self._rebuilding is not None:
+            self._rebuilding.add(sid)
+
+    def might_be_revoked(self, sid: str) -> bool:
+        """Check the bloom filter, False means the session is certainly not revoked"""
+        self.checks += 1
+        if sid not in self.bloom:
+            return False
+        self.bloom_hits += 1
+        return True
+
+    async def is_revoked(self, sid: str) -> bool:
+        """Check whether a session was revoked, Redis is only asked when the bloom filter reports it"""
+        if not self.might_be_revoked(sid):
+            return False
+        if self.redis is None:
+            revoked = self._revoked.get(sid, 0) > time.time()
+        else:
+            try:
+                expires_at = await self.redis.zscore(self.revoked_key, sid)
+            except RedisError as e:
+                # the filter reported the session, rejecting it is the safe side
+                self.errors += 1
+                logger.warning(f"Could not confirm revocation of session {sid}: {str(e)}")
+                return True
+            revoked = expires_at is not None and expires_at > time.time()
+        self.confirmed += revoked
+        return revoked
+
+    async def sync_revocations(self) -> int:
+        """
+        Rebuild the bloom filter from the revocations that have not expired.
+
+        Without Redis, expired sessions and revocations are dropped as well.
+
+        Returns:
+            int: Number of revoked sessions in the filter
+        """
+        now = time.time()
+        self._rebuilding = set()
+        try:
+            if self.redis is None:
+                self._sessions = {sid: session for sid, session in self._sessions.items() if session[2] > now}
+                self._revoked = {sid: expires_at for sid, expires_at in self._revoked.items() if expires_at > now}
+                revoked = list(self._revoked)
+            else:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.zremrangebyscore(self.revoked_key, 0, now)
+                    pipe.zrangebyscore(self.revoked_key, now, "+inf")
+                    _, revoked = await pipe.execute()
+
+            bloom = BloomFilter(max(self.capacity, 2 * len(revoked)), self.error_rate)
+            for sid in revoked:
+                bloom.add(sid)
+            # revocations made by this process while Redis was read
+            for sid in self._rebuilding:
+                bloom.add(sid)
+            self.bloom = bloom
+        finally:
+            self._rebuilding = None
+        return self.bloom.count
+
+    async def run(self, stop: asyncio.Event):
+        """
+        Rebuild the bloom filter every `sync_interval` seconds until `stop` is set.
+
+        Args:
+            stop (asyncio.Event): Set to stop after the current rebuild
+        """
+        logger.info("Session revocation sync started")
+        while not stop.is_set():
+            try:
+                await self.sync_revocations()
+            except RedisError as e:
+                self.errors += 1
+                logger.error(f"Session revocation sync failed: {str(e)}", exc_info=True)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.sync_interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.info("Session revocation sync stopped")
+
+    def snapshot(self) -> dict:
+        """Get the bloom filter size and the revocation check counters"""
+        return {
+            "backend": "redis" if self.redis is not None else "local",
+            "bloom_bits": self.bloom.size,
+            "bloom_hashes": self.bloom.hashes,
+            "revoked_in_bloom": self.bloom.count,
+            "checks": self.checks,
+            "bloom_hits": self.bloom_hits,
+            "confirmed": self.confirmed,
+            "false_positives": self.bloom_hits - self.confirmed,
+            "errors": self.errors,
+        }
+
+session_store = SessionStore(
+    redis_client,
+    session_ttl=config.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+    revocation_ttl=config.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    capacity=config.SESSION_BLOOM_CAPACITY,
+    error_rate=config.SESSION_BLOOM_ERROR_RATE,
+    sync_interval=config.SESSION_REVOCATION_SYNC_INTERVAL
+)
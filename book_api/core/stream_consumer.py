@@ -0,0 +1,202 @@
+from typing import Dict, List
+from redis.exceptions import RedisError, ResponseError
+from book_api.core.event_bus import (
+    Event,
+    EventBus,
+    RedisStreamsTransport,
+    encode_stream_event,
+    decode_stream_event,
+    handler_name
+)
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class RedisStreamConsumer:
+    """Runs the handlers for events added to Redis Streams by RedisStreamsTransport.
+
+    All consumers read through the transport's consumer group, so each event
+    is handled by one consumer across every worker process. An event is
+    acknowledged once it is handled. When a handler fails, the handlers that
+    have not succeeded yet are retried with exponential backoff through the
+    transport's retry set, and after `max_attempts` the event moves to the
+    dead-letter stream. Events a dead consumer left unacknowledged are claimed
+    after `claim_idle` seconds, so delivery is at least once and handlers
+    should deduplicate on `Event.key`.
+
+    Attributes:
+        bus (EventBus): Event bus whose subscribers handle the events
+        transport (RedisStreamsTransport): Transport the events were added with
+        consumer_name (str): Name of this consumer in the group, unique per task
+        batch_size (int): Events read per call
+        block (float): Seconds a read waits for new events
+        max_attempts (int): Attempts before an event is dead-lettered
+        retry_delay (float): Seconds before the first retry, doubled on every attempt
+        claim_idle (float): Seconds an event may stay unacknowledged before another consumer takes it
+    """
+    MAX_RETRY_DELAY = 3600
+
+    def __init__(
+        self,
+        bus: EventBus,
+        transport: RedisStreamsTransport,
+        consumer_name: str,
+        batch_size: int = 50,
+        block: float = 1.0,
+        max_attempts: int = 5,
+        retry_delay: float = 1.0,
+        claim_idle: float = 60.0
+    ):
+        self.bus = bus
+        self.transport = transport
+        self.redis = transport.redis
+        self.consumer_name = consumer_name
+        self.batch_size = batch_size
+        self.block = block
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.claim_idle = claim_idle
+        self._last_claim = 0.0
+        self._groups_ready = False
+
+    @property
+    def streams(self) -> List[str]:
+        return [self.transport.stream(event_name) for event_name in self.bus.subscribers]
+
+    async def ensure_groups(self):
+        """Create the consumer group on every stream, new groups start at the oldest entry"""
+        for stream in self.streams:
+            try:
+                await self.redis.xgroup_create(stream, self.transport.group, id="0", mkstream=True)
+                logger.info(f"Created consumer group '{self.transport.group}' on stream '{stream}'")
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    async def consume_once(self) -> int:
+        """
+        Read and handle one batch of new events.
+
+        Returns:
+            int: Number of events handled
+        """
+        response = await self.redis.xreadgroup(
+            self.transport.group,
+            self.consumer_name,
+            {stream: ">" for stream in self.streams},
+            count=self.batch_size,
+            block=int(self.block * 1000)
+        )
+        handled = 0
+        for stream, messages in response or []:
+            for message_id, fields in messages:
+                await self._handle(stream, message_id, fields)
+                handled += 1
+        return handled
+
+    async def claim_stale(self) -> int:
+        """
+        Take over events other consumers read but never acknowledged.
+
+        Returns:
+            int: Number of events handled
+        """
+        handled = 0
+        for stream in self.streams:
+            _, messages, *_ = await self.redis.xautoclaim(
+                stream,
+                self.transport.group,
+                self.consumer_name,
+                min_idle_time=int(self.claim_idle * 1000),
+                start_id="0-0",
+                count=self.batch_size
+            )
+            for message_id, fields in messages:
+                logger.warning(f"Claimed event {message_id} on '{stream}' from a stalled consumer")
+                await self._handle(stream, message_id, fields)
+                handled += 1
+        return handled
+
+    async def requeue_due_retries(self) -> int:
+        """
+        Add the retries that are due back to their streams.
+
+        Returns:
+            int: Number of events requeued
+        """
+        due = await self.redis.zrangebyscore(self.transport.retry_key, 0, time.time(), start=0, num=self.batch_size)
+        requeued = 0
+        for member in due:
+            # removing the entry claims it, only one consumer gets to requeue each retry
+            if not await self.redis.zrem(self.transport.retry_key, member):
+                continue
+            entry = json.loads(member)
+            await self.transport.add(entry["stream"], entry["fields"])
+            requeued += 1
+        return requeued
+
+    async def _handle(self, stream: str, message_id: str, fields: Dict[str, str]):
+        event, attempts, delivered = decode_stream_event(fields)
+        pending = [
+            callback for callback in self.bus.subscribers.get(event.name, [])
+            if handler_name(callback) not in delivered
+        ]
+        errors = []
+        for callback, error in zip(pending, await self.bus.run_handlers(event, pending)):
+            if error is None:
+                delivered.append(handler_name(callback))
+            else:
+                errors.append(f"{handler_name(callback)}: {str(error)}")
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if errors:
+                self._schedule_retry(pipe, stream, message_id, event, attempts + 1, delivered, "; ".join(errors))
+            pipe.xack(stream, self.transport.group, message_id)
+            await pipe.execute()
+
+    def _schedule_retry(self, pipe, stream: str, message_id: str, event: Event, attempts: int, delivered: List[str], error: str):
+        fields = encode_stream_event(event, attempts, delivered)
+        if attempts >= self.max_attempts:
+            logger.error(f"Giving up on event {message_id} '{event.name}' after {attempts} attempts: {error}")
+            pipe.xadd(
+                self.transport.dead_letter_stream,
+                {**fields, "stream": stream, "message_id": message_id, "error": error},
+                maxlen=self.transport.maxlen,
+                approximate=True
+            )
+            return
+
+        delay = min(self.retry_delay * 2 ** (attempts - 1), self.MAX_RETRY_DELAY)
+        logger.warning(f"Event {message_id} '{event.name}' failed, retrying in {delay}s: {error}")
+        member = json.dumps({"stream": stream, "message_id": message_id, "fields": fields})
+        pipe.zadd(self.transport.retry_key, {member: time.time() + delay})
+
+    async def run(self, stop: asyncio.Event):
+        """
+        Consume events until `stop` is set.
+
+        Args:
+            stop (asyncio.Event): Set to stop after the current batch
+        """
+        logger.info(f"Stream consumer '{self.consumer_name}' started")
+        while not stop.is_set():
+            try:
+                if not self._groups_ready:
+                    await self.ensure_groups()
+                    self._groups_ready = True
+                await self.requeue_due_retries()
+                if time.monotonic() - self._last_claim >= self.claim_idle / 2:
+                    self._last_claim = time.monotonic()
+                    await self.claim_stale()
+                await self.consume_once()
+            except RedisError as e:
+                logger.error(f"Stream consumer '{self.consumer_name}' failed: {str(e)}", exc_info=True)
+                self._groups_ready = False  # the streams may have been deleted with their groups
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=self.block)
+                except asyncio.TimeoutError:
+                    pass
+        logger.info(f"Stream consumer '{self.consumer_name}' stopped")
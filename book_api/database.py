@@ -1,31 +1,125 @@
+from fastapi import Depends, Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from book_api.core.pool_metrics import register_pool_metrics, instrumented_pool_class
+from book_api.core.lazy_session import LazySession, LazyAsyncSession, track_session
+from book_api.core.db_routing import ReplicaSet, routing_session_class, READ_ONLY_METHODS
 from book_api.models import Base
 from book_api.settings import config
 import os
 
+# async drivers to swap in for each sync driver
+ASYNC_DRIVERS = {
+    "mysql": "aiomysql",
+    "sqlite": "aiosqlite",
+}
+
+def get_async_database_url(url: str) -> str:
+    """Derive the async driver URL from a sync database URL"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
 # database url
 DATABASE_URL = config.DATABASE_URL
+ASYNC_DATABASE_URL = config.ASYNC_DATABASE_URL or get_async_database_url(DATABASE_URL)
+
+# pool sizing shared by the sync and async engines
+POOL_OPTIONS = {
+    "pool_size": config.DB_POOL_SIZE,  # Maximum number of database connections in the pool
+    "max_overflow": config.DB_MAX_OVERFLOW,  # Maximum number of connections that can be created beyond pool_size
+    "pool_timeout": config.DB_POOL_TIMEOUT,  # Timeout for getting a connection from the pool
+    "pool_recycle": config.DB_POOL_RECYCLE,  # Recycle connections after this many seconds
+    "pool_pre_ping": config.DB_POOL_PRE_PING,  # Test connections for liveness on checkout
+}
+
+def create_instrumented_engine(name: str, url: str):
+    """Create a sync engine whose pool reports to the pool metrics"""
+    metrics = register_pool_metrics(name)
+    new_engine = create_engine(
+        url,
+        poolclass=instrumented_pool_class(QueuePool, metrics),
+        **POOL_OPTIONS
+    )
+    metrics.attach(new_engine)
+    return new_engine
 
-# create the database engine and session maker
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=5,  # Maximum number of database connections in the pool
-    max_overflow=10,  # Maximum number of connections that can be created beyond pool_size
-    pool_timeout=30,  # Timeout for getting a connection from the pool
-    pool_recycle=1800,  # Recycle connections after 30 minutes
+def create_instrumented_async_engine(name: str, url: str):
+    """Create an async engine whose pool reports to the pool metrics"""
+    metrics = register_pool_metrics(name)
+    new_engine = create_async_engine(
+        url,
+        poolclass=instrumented_pool_class(AsyncAdaptedQueuePool, metrics),
+        **POOL_OPTIONS
+    )
+    metrics.attach(new_engine.sync_engine)
+    return new_engine
+
+# create the primary engines
+engine = create_instrumented_engine("primary", DATABASE_URL)
+async_engine = create_instrumented_async_engine("primary_async", ASYNC_DATABASE_URL)
+
+# create the read replica engines, if any are configured
+replica_engines = [
+    create_instrumented_engine(f"replica_{i}", url)
+    for i, url in enumerate(config.READ_REPLICA_URLS)
+]
+async_replica_engines = [
+    create_instrumented_async_engine(f"replica_{i}_async", get_async_database_url(url))
+    for i, url in enumerate(config.READ_REPLICA_URLS)
+]
+
+# sessions that send reads from read-only requests to the replicas
+ReadRoutingSession = routing_session_class(
+    "ReadRoutingSession",
+    engine,
+    ReplicaSet(replica_engines, config.READ_REPLICA_STRATEGY)
+)
+AsyncReadRoutingSession = routing_session_class(
+    "AsyncReadRoutingSession",
+    async_engine.sync_engine,
+    ReplicaSet([replica.sync_engine for replica in async_replica_engines], config.READ_REPLICA_STRATEGY)
 )
 
+# create the session makers
 SessionLocal = sessionmaker(
+    class_=ReadRoutingSession,
     autocommit=False,
     autoflush=False,
     bind=engine
 )
 
-# get a session
-def get_db():
-    db = SessionLocal()
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=AsyncReadRoutingSession,
+    autoflush=False,
+    expire_on_commit=False  # Responses are serialized after commit, so keep loaded attributes
+)
+
+# get the async session factory, for streaming responses that outlive the request's
+# get_async_db session and have to open their own
+def get_async_session_factory() -> async_sessionmaker:
+    return AsyncSessionLocal
+
+# get a session, it is only created once the request uses it
+def get_db(request: Request):
+    db = LazySession(SessionLocal, {"read_only": request.method in READ_ONLY_METHODS})
+    try:
+        yield db
+    finally:
+        db.close()
+
+# get an async session, it is only created once the request uses it and a
+# ReleasingRoute closes it before the response is serialized
+async def get_async_db(request: Request, factory: async_sessionmaker = Depends(get_async_session_factory)):
+    db = LazyAsyncSession(factory, {"read_only": request.method in READ_ONLY_METHODS})
+    track_session(request, db)
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        await db.close()
\ No newline at end of file
@@ -1,16 +1,57 @@
-from book_api.database import get_db
-from book_api.auth import get_current_active_user
+from book_api.database import get_db, get_async_db
+from book_api.auth import oauth2_scheme, get_token_claims, check_session, get_user, get_user_principal, get_credentials_exception
+from book_api.models import User
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from strawberry.fastapi import BaseContext
 from fastapi import Request, Depends
-from typing import Any, Dict
+from typing import Any
+
+class GraphQLContext(BaseContext):
+    """Context of a GraphQL operation, resolvers read it like a dict.
+
+    The token and its user are checked before the operation runs, so a
+    token of a deleted user is answered with a 401 like on the REST
+    routes. The check goes through the principal cache, the user itself is
+    only loaded when a resolver first reads `context["user"]`. Together with
+    the lazy `db` session an introspection query does not touch the
+    database while the user's principal is cached.
+
+    Attributes:
+        db (Session): The request's lazy session
+        claims (dict): Claims of the request's token
+    """
+    def __init__(self, db: Session, claims: dict):
+        super().__init__()
+        self.db = db
+        self.claims = claims
+        self._user = None
+
+    @property
+    def user(self) -> User:
+        if self._user is None:
+            self._user = get_user(self.db, self.claims['sub'])
+            if self._user is None:
+                raise get_credentials_exception()
+        return self._user
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
 
 async def get_context(
     request: Request,
+    token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db),
-    user: Any = Depends(get_current_active_user)
-) -> Dict[str, Any]:
-    return {
-        "request": request,
-        "db": db,
-        "user": user
-    }
\ No newline at end of file
+    async_db: AsyncSession = Depends(get_async_db)
+) -> GraphQLContext:
+    claims = get_token_claims(request, token)
+    await check_session(claims)
+    if await get_user_principal(async_db, claims['sub']) is None:
+        raise get_credentials_exception()
+    return GraphQLContext(db, claims)
@@ -0,0 +1,23 @@
+from strawberry.extensions import SchemaExtension
+from strawberry.types.graphql import OperationType
+from book_api.core.lazy_session import LazySession
+
+
+class ReadOnlyQueries(SchemaExtension):
+    """Let query operations read from a replica while mutations stay on the primary"""
+
+    def on_execute(self):
+        db = self.execution_context.context.get("db")
+        if db is not None:
+            db.info["read_only"] = self.execution_context.operation_type == OperationType.QUERY
+        yield
+
+
+class ReleaseSession(SchemaExtension):
+    """Close the operation's session once it has executed, before the result is encoded"""
+
+    def on_execute(self):
+        yield
+        db = self.execution_context.context.get("db")
+        if isinstance(db, LazySession):
+            db.close()
@@ -3,10 +3,12 @@ from strawberry.fastapi import GraphQLRouter
 from book_api.graphql_routes.queries import Query
 from book_api.graphql_routes.mutations import Mutation
 from book_api.graphql_routes.context import get_context
+from book_api.graphql_routes.extensions import ReadOnlyQueries, ReleaseSession
 
 schema = strawberry.Schema(
     query=Query,
-    mutation=Mutation
+    mutation=Mutation,
+    extensions=[ReadOnlyQueries, ReleaseSession]
 )
 
 router = GraphQLRouter(
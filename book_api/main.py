@@ -1,26 +1,52 @@
 from fastapi import FastAPI
 from fastapi.responses import RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
-from book_api.routers import users, books, reviews, shelves, files
-from book_api.core.rate_limiter import limiter
+from book_api.routers import users, books, reviews, shelves, files, admin, library
+from book_api.core.request_gate import RequestGateMiddleware
+from book_api.core.event_bus import event_bus
+from book_api.core.outbox import outbox_relay
+from book_api.core.password_hasher import password_hasher
+from book_api.core.sessions import session_store
+from book_api.services.notifications.delivery import email_delivery
+from book_api.services.notifications.digest import digest_flusher
+from book_api.settings import config
 from book_api.graphql_routes.schema import router as graphql_router
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
+from contextlib import asynccontextmanager
+import asyncio
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.EMAIL_DELIVERY_IN_PROCESS:
+        email_delivery.start()
+    stop_background = asyncio.Event()
+    # revocations made by the other processes reach this one's bloom filter
+    background_tasks = [asyncio.create_task(session_store.run(stop_background), name="session-revocation-sync")]
+    if config.OUTBOX_RELAY_IN_PROCESS:
+        background_tasks.append(asyncio.create_task(outbox_relay.run(stop_background), name="outbox-relay"))
+    if config.DIGEST_IN_PROCESS:
+        background_tasks.append(asyncio.create_task(digest_flusher.run(stop_background), name="digest-flusher"))
+    yield
+    # stop relaying and flushing digests before the queued events are drained
+    stop_background.set()
+    await asyncio.gather(*background_tasks)
+    # finish the events still queued for the background workers
+    await event_bus.drain(config.EVENT_DRAIN_TIMEOUT)
+    # send the emails the handlers queued
+    await email_delivery.stop(config.EMAIL_DRAIN_TIMEOUT)
+    password_hasher.shutdown()
+
 app = FastAPI(
     title="Book API",
     description="A simple API to manage books and reviews",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Add rate limiter to the application
-app.state.limiter = limiter
-
-# Add rate limit exceeded handler
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Reject bad tokens and over-limit requests before routing opens any database session
+app.add_middleware(RequestGateMiddleware)
 
-# Configure CORS
+# Configure CORS, added last so it wraps the gate's rejections too
 origins = [
     "http://localhost",
     "http://localhost:8080",
@@ -41,6 +67,8 @@ app.include_router(books.router)
 app.include_router(reviews.router)
 app.include_router(shelves.router)
 app.include_router(files.router)
+app.include_router(admin.router)
+app.include_router(library.router)
 app.include_router(graphql_router, prefix="/graphql")
 
 # Create a sub-application for the token endpoint
@@ -60,6 +88,8 @@ def root():
             "reviews": "/reviews",
             "shelves": "/shelves",
             "files": "/files",
+            "admin": "/admin",
+            "library": "/library",
             "graphql": "/graphql"
         }
     }
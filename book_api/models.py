@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Float, UniqueConstraint, Index, Boolean, Table
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, Float, UniqueConstraint, Index, Boolean, Table, JSON, DDL, event
 from sqlalchemy.orm import declarative_base, relationship
 from enum import Enum
 from datetime import datetime
@@ -25,7 +25,7 @@ followers_assoc = Table(
     Base.metadata,
     Column('follower_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
     Column('followed_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
-    Column('created_at', DateTime, nullable=False, default=datetime.utcnow()),
+    Column('created_at', DateTime, nullable=False, default=datetime.utcnow),
     UniqueConstraint('follower_id', 'followed_id', name='unique_follower_followed')
 )
 
@@ -35,7 +35,7 @@ review_likes = Table(
     Base.metadata,
     Column('review_id', Integer, ForeignKey('reviews.id', ondelete='CASCADE')),
     Column('user_id', Integer, ForeignKey('users.id', ondelete='CASCADE')),
-    Column('created_at', DateTime, nullable=False, default=datetime.utcnow()),
+    Column('created_at', DateTime, nullable=False, default=datetime.utcnow),
     UniqueConstraint('review_id', 'user_id', name='unique_review_like')
 )
 
@@ -62,10 +62,11 @@ class User(Base):
     bio = Column(Text, nullable=True)                          # Changed to Text type
     profile_picture = Column(String(255), nullable=True)
     last_login = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow())
-    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow(), onupdate=datetime.utcnow())
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     followers_count = Column(Integer, nullable=False, default=0)
     following_count = Column(Integer, nullable=False, default=0)
+    notification_frequency = Column(String(20), nullable=False, default='hourly', server_default='instant')  # instant, hourly, daily or off, rows from before digests stay instant
 
     # helper methods
     def is_following(self, user):
@@ -131,7 +132,13 @@ class Book(Base):
     __table_args__ = (
         Index('idx_book_author', 'author'),
         Index('idx_book_title', 'title'),
-        Index('idx_book_year', 'year')
+        Index('idx_book_year', 'year'),
+        Index('idx_book_user_year_id', 'user_id', 'year', 'id'),
+        Index('idx_book_user_rating_id', 'user_id', 'average_rating', 'id'),
+        # full-text indexes for book search, MATCH needs one per column set it searches
+        Index('ft_book_title_author', 'title', 'author', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        Index('ft_book_title', 'title', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+        Index('ft_book_author', 'author', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql')
     )
 
     id = Column(Integer, primary_key=True)
@@ -142,9 +149,18 @@ class Book(Base):
     genre = Column(String(50), nullable=False)
     page_count = Column(Integer, nullable=False)
     average_rating = Column(Float, nullable=True, default=0.0)  # Added to track average rating
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow())
-    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow(), onupdate=datetime.utcnow())
+    # review aggregates, kept in step with the reviews by book_utils.apply_rating_change
+    rating_sum = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_1_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_2_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_3_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_4_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rating_5_count = Column(Integer, nullable=False, default=0, server_default='0')
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     cover_url = Column(String(255), nullable=True)
+    insert_batch = Column(String(32), nullable=True)  # marks the rows of one set-based insert, see book_utils.insert_books
 
     # Foreign Keys
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -161,6 +177,28 @@ class Book(Base):
     def __repr__(self):
         return f'<Book(title={self.title}, author={self.author})>'
 
+# SQLite has no FULLTEXT indexes, so book search uses an external content FTS5
+# table that triggers keep in sync with the books table
+BOOKS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE books_fts USING fts5(
+        title, author, content='books', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+    """CREATE TRIGGER books_fts_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END""",
+    """CREATE TRIGGER books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END""",
+]
+
+for statement in BOOKS_FTS_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS books_fts').execute_if(dialect='sqlite'))
+
 class Review(Base):
 
     __tablename__ = 'reviews'
@@ -169,8 +207,8 @@ class Review(Base):
     rating = Column(Integer, nullable=False)
     content = Column(Text, nullable=True)
     likes_count = Column(Integer, nullable=False, default=0)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow())
-    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow(), onupdate=datetime.utcnow())
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Foreign Keys
     book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
@@ -191,6 +229,8 @@ class Review(Base):
     # Constraints
     __table_args__ = (
         UniqueConstraint('user_id', 'book_id', name='unique_user_book_review'),
+        Index('idx_review_book_created', 'book_id', 'created_at'),
+        Index('idx_review_user_created', 'user_id', 'created_at'),
     )
 
     def __repr__(self):
@@ -212,8 +252,8 @@ class Shelf(Base):
     description = Column(Text, nullable=True)
     is_public = Column(Boolean, nullable=False)
     is_default = Column(Boolean, nullable=False)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow())
-    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow(), onupdate=datetime.utcnow())
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     book_count = Column(Integer, nullable=False, default=0)
     
     def update_book_count(self):
@@ -244,8 +284,8 @@ class Comment(Base):
     content = Column(Text, nullable=False)
     path = Column(String(255), nullable=False)
     depth = Column(Integer, nullable=False, default=0)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow())
-    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow(), onupdate=datetime.utcnow())
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     likes_count = Column(Integer, nullable=False, default=0)
     is_deleted = Column(Boolean, nullable=False, default=False)
 
@@ -264,4 +304,67 @@ class Comment(Base):
         back_populates='comment_likes',
         lazy='dynamic',
         overlaps="comment_likes,likes"
-    )
\ No newline at end of file
+    )
+
+# table for library import jobs
+class ImportJob(Base):
+
+    __tablename__ = 'import_jobs'
+    __table_args__ = (
+        Index('idx_import_job_user', 'user_id'),
+    )
+
+    # main columns
+    id = Column(Integer, primary_key=True)
+    filename = Column(String(255), nullable=True)
+    status = Column(String(20), nullable=False, default='pending')  # pending, running, completed or failed
+    rows_processed = Column(Integer, nullable=False, default=0)
+    rows_failed = Column(Integer, nullable=False, default=0)
+    books_created = Column(Integer, nullable=False, default=0)
+    shelf_entries_created = Column(Integer, nullable=False, default=0)
+    errors = Column(JSON, nullable=True)  # the first rejected rows with their reasons
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Foreign Keys
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+
+# table for the transactional outbox, events written with the change that caused them
+class OutboxEvent(Base):
+
+    __tablename__ = 'outbox'
+    __table_args__ = (
+        Index('idx_outbox_pending', 'dispatched_at', 'available_at', 'id'),
+    )
+
+    # main columns
+    id = Column(Integer, primary_key=True)
+    event_name = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=False)
+    idempotency_key = Column(String(64), nullable=False, unique=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # delivery state, maintained by the relay
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # next delivery attempt
+    attempts = Column(Integer, nullable=False, default=0)
+    delivered_handlers = Column(JSON, nullable=True)  # handlers that already succeeded
+    last_error = Column(Text, nullable=True)
+    dispatched_at = Column(DateTime, nullable=True)
+
+# notifications waiting for the recipient's next digest email
+class NotificationDigestItem(Base):
+
+    __tablename__ = 'notification_digest_items'
+    __table_args__ = (
+        Index('idx_digest_item_user_created', 'user_id', 'created_at'),
+    )
+
+    # main columns
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)  # event name, new_follower or new_review
+    payload = Column(JSON, nullable=False)
+    idempotency_key = Column(String(64), nullable=True, unique=True)  # key of the event, drops redeliveries
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Foreign Keys
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
\ No newline at end of file
@@ -0,0 +1,105 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from book_api.core.rate_limiter import limiter
+from book_api.core.pool_metrics import pool_metrics
+from book_api.core.cache import caches
+from book_api.core.event_bus import event_bus
+from book_api.core.password_hasher import password_hasher
+from book_api.core.sessions import session_store
+from book_api.services.notifications.delivery import email_delivery
+from book_api.database import get_async_db
+from book_api.core.lazy_session import ReleasingRoute
+from book_api.utils.book_utils import reconcile_book_ratings
+from book_api import models, schemas
+from book_api.auth import check_role
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(check_role(['admin']))],
+    responses={404: {"description": "Not found"}},
+    route_class=ReleasingRoute
+)
+
+# get live connection pool statistics
+@router.get("/db/pool")
+@limiter.limit("30/minute")
+async def get_pool_stats(request: Request) -> dict:
+    """Get live connection pool statistics for every database engine"""
+    return {
+        name: metrics.snapshot()
+        for name, metrics in pool_metrics.items()
+    }
+
+# get cache hit/miss statistics
+@router.get("/cache")
+@limiter.limit("30/minute")
+async def get_cache_stats(request: Request) -> dict:
+    """Get hit/miss statistics for every cache"""
+    return {
+        name: cache.snapshot()
+        for name, cache in caches.items()
+    }
+
+# get event queue statistics
+@router.get("/events")
+@limiter.limit("30/minute")
+async def get_event_stats(request: Request) -> dict:
+    """Get queue depths, handler counters and transport backlog for the event bus"""
+    return {
+        **event_bus.snapshot(),
+        "transport_stats": await event_bus.transport.stats(list(event_bus.subscribers)),
+    }
+
+# get email delivery statistics
+@router.get("/email")
+@limiter.limit("30/minute")
+async def get_email_stats(request: Request) -> dict:
+    """Get queue depth, delivery counters and SMTP pool usage for email delivery"""
+    return email_delivery.snapshot()
+
+# get password hashing statistics
+@router.get("/passwords")
+@limiter.limit("30/minute")
+async def get_password_hashing_stats(request: Request) -> dict:
+    """Get queue depth, shed calls and wait times of the password hashing pool"""
+    return password_hasher.snapshot()
+
+# get session revocation statistics
+@router.get("/sessions")
+@limiter.limit("30/minute")
+async def get_session_stats(request: Request) -> dict:
+    """Get the revoked sessions bloom filter size and how often it sent a check to Redis"""
+    return session_store.snapshot()
+
+# get rate limiter statistics
+@router.get("/rate-limits")
+@limiter.limit("30/minute")
+async def get_rate_limit_stats(request: Request) -> dict:
+    """Get the rate limit storage and how many requests the in-process token buckets rejected"""
+    return limiter.snapshot()
+
+# repair denormalized book rating aggregates
+@router.post("/books/reconcile-ratings")
+@limiter.limit("5/minute")
+async def reconcile_ratings(request: Request, db: AsyncSession = Depends(get_async_db)) -> dict:
+    """Recompute book rating aggregates that drifted from the reviews table"""
+    return {"repaired": await reconcile_book_ratings(db)}
+
+# change a user's role
+@router.put("/users/{user_id}/role", response_model=schemas.UserResponse)
+@limiter.limit("30/minute")
+async def update_user_role(
+    request: Request,
+    user_id: int,
+    role_update: schemas.RoleUpdate,
+    db: AsyncSession = Depends(get_async_db)
+) -> models.User:
+    """Change a user's role, effective on their next request"""
+    user = await db.get(models.User, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.role = role_update.role
+    await db.commit()
+    await db.refresh(user)
+    return user
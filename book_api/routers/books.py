@@ -1,69 +1,120 @@
 # books.py
 from fastapi import APIRouter, HTTPException, Depends, Request, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import AsyncIterator, List, Optional
 from book_api.core.rate_limiter import limiter
 from book_api.core.event_bus import event_bus, Event
 from book_api import models, schemas
-from book_api.database import get_db
+from book_api.database import get_async_db, get_async_session_factory
+from book_api.core.lazy_session import ReleasingRoute
+from book_api.settings import config
+from book_api.utils.book_utils import insert_books
+from book_api.utils.pagination import encode_cursor, decode_cursor, seek_after_desc
+from book_api.services.search.book_search import get_book_search
 from book_api.auth import (
-    get_current_active_user
+    UserPrincipal,
+    get_current_principal
 )
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/books",
     tags=["books"],
-    responses={404: {"description": "Not found"}}
+    responses={404: {"description": "Not found"}},
+    route_class=ReleasingRoute
 )
 
+# columns GET /books/ can be ordered by, each paired with the id as tie breaker
+BOOK_ORDER_COLUMNS = {
+    "avg_rating": models.Book.average_rating,
+    "year": models.Book.year,
+    "id": models.Book.id,
+}
+
 @router.get("/", response_model=schemas.PaginatedBookResponse)
 @limiter.limit("30/minute")
 async def get_books(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
     from_year: Optional[int] = Query(None, description="Filter books published from this year"),
     to_year: Optional[int] = Query(None, description="Filter books published up to this year"),
     min_avg_rating: Optional[float] = Query(None, description="Filter books with average rating greater than or equal to this value"),
     max_avg_rating: Optional[float] = Query(None, description="Filter books with average rating less than or equal to this value"),
-    author_query: Optional[str] = Query(None, description="Filter books by author name"),
-    title_query: Optional[str] = Query(None, description="Filter books by title"),
+    q: Optional[str] = Query(None, description="Search books by title and author"),
+    author_query: Optional[str] = Query(None, description="Search books by author name"),
+    title_query: Optional[str] = Query(None, description="Search books by title"),
     genre: Optional[str] = Query(None, description="Filter books by genre"),
-    order_by: Optional[str] = Query(None, description="Order books by a specific column"),
-    page: int = Query(1, description="Page number")
+    order_by: Optional[str] = Query(None, description="Order books by a specific column, searches default to relevance"),
+    page: int = Query(1, gt=0, description="Page number, ignored when a cursor is given"),
+    per_page: int = Query(10, gt=0, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's next_cursor"),
+    include_total: bool = Query(True, description="Count all matching books, skip on deep pages")
 ) -> schemas.PaginatedBookResponse:
     """Get all books for the current user"""
-    books = db.query(models.Book).filter(models.Book.user_id == current_user.id)
+    books = select(models.Book).filter(models.Book.user_id == current_user.id)
 
     if from_year:
         books = books.filter(models.Book.year >= from_year)
     if to_year:
         books = books.filter(models.Book.year <= to_year)
     if min_avg_rating:
-        books = books.filter(models.Book.avg_rating >= min_avg_rating)
+        books = books.filter(models.Book.average_rating >= min_avg_rating)
     if max_avg_rating:
-        books = books.filter(models.Book.avg_rating <= max_avg_rating)
-    if author_query:
-        books = books.filter(models.Book.author.ilike(f"%{author_query}%"))
-    if title_query:
-        books = books.filter(models.Book.title.ilike(f"%{title_query}%"))
+        books = books.filter(models.Book.average_rating <= max_avg_rating)
     if genre:
         books = books.filter(models.Book.genre == genre)
 
-    if order_by == "avg_rating":
-        books = books.order_by(models.Book.avg_rating.desc())
-    elif order_by == "year":
-        books = books.order_by(models.Book.year.desc())
+    # full-text search, every term matches as a prefix
+    search = get_book_search(db.get_bind().dialect.name)
+    ranked = search.ranked_ids({"any": q, "title": title_query, "author": author_query})
+    if ranked is not None:
+        books = books.join(ranked, ranked.c.id == models.Book.id)
+
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count()).select_from(books.subquery()))
+
+    if ranked is not None and order_by is None:
+        order_key = "relevance"
+        order_column = ranked.c.score
     else:
+        order_key = order_by if order_by in BOOK_ORDER_COLUMNS else "id"
+        order_column = BOOK_ORDER_COLUMNS[order_key]
+
+    if order_column is models.Book.id:
         books = books.order_by(models.Book.id.desc())
+    else:
+        books = books.order_by(order_column.desc(), models.Book.id.desc())
+    books = books.add_columns(order_column.label("sort_key"))
+
+    # seek past the last row of the previous page instead of counting off rows
+    if cursor:
+        value, last_id = decode_cursor(cursor, order_key)
+        books = books.filter(seek_after_desc(order_column, models.Book.id, value, last_id))
+    else:
+        books = books.offset((page - 1) * per_page)
 
-    total = books.count()
-    books = books.offset((page - 1) * 10).limit(10).all()
+    # fetch one extra row to find out whether there is a next page
+    rows = (await db.execute(books.limit(per_page + 1))).all()
+    items = [row.Book for row in rows[:per_page]]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        next_cursor = encode_cursor(order_key, last.sort_key, last.Book.id)
 
     return schemas.PaginatedBookResponse(
         total=total,
         page=page,
-        items=books
+        items=items,
+        next_cursor=next_cursor
     )
 
 @router.get("/{book_id}", response_model=schemas.BookResponse)
@@ -71,14 +122,16 @@ async def get_books(
 async def get_book(
     request: Request,
     book_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Book:
     """Get a specific book by ID"""
-    book = db.query(models.Book).filter(
-        models.Book.id == book_id,
-        models.Book.user_id == current_user.id
-    ).first()
+    book = await db.scalar(
+        select(models.Book).filter(
+            models.Book.id == book_id,
+            models.Book.user_id == current_user.id
+        )
+    )
     
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
@@ -89,8 +142,8 @@ async def get_book(
 async def create_book(
     request: Request,
     book: schemas.BookCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Book:
     """Create a new book"""
     new_book = models.Book(
@@ -98,37 +151,53 @@ async def create_book(
         user_id=current_user.id
     )
     db.add(new_book)
-    db.commit()
-    db.refresh(new_book)
+    await db.commit()
+    await db.refresh(new_book)
 
     return new_book
 
+async def stream_bulk_insert(session_factory: async_sessionmaker, rows: List[dict]) -> AsyncIterator[str]:
+    """
+    Insert books chunk by chunk, committing each chunk, and yield the new IDs as NDJSON.
+
+    The status code is sent before the first insert, so a failure is reported
+    as a final {"error": ..., "created": n} line. The chunks before it stay committed.
+    """
+    chunk_size = config.BULK_CHUNK_SIZE
+    async with session_factory() as db:
+        for start in range(0, len(rows), chunk_size):
+            try:
+                ids = await insert_books(db, rows[start:start + chunk_size])
+                await db.commit()
+            except SQLAlchemyError as e:
+                await db.rollback()
+                logger.error(f"Bulk insert failed after {start} books: {str(e)}")
+                yield json.dumps({"error": "Failed to insert books", "created": start}) + "\n"
+                return
+            yield "".join(json.dumps({"id": book_id}) + "\n" for book_id in ids)
+
 # route to bulk create books
-@router.post("/bulk", response_model=List[schemas.BookResponse])
+@router.post("/bulk")
 @limiter.limit("30/minute")
 async def bulk_create_books(
     request: Request,
     books: List[schemas.BookCreate],
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
-) -> List[models.Book]:
-    """Bulk create books"""
-    try: 
-        new_books = []
-        for book in books:
-            new_book = models.Book(
-                **book.dict(),
-                user_id=current_user.id
-            )
-            db.add(new_book)
-            new_books.append(new_book)
-
-        db.commit()
-
-        return new_books
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+    current_user: UserPrincipal = Depends(get_current_principal)
+) -> StreamingResponse:
+    """Bulk create books, streaming back one {"id": ...} line per created book"""
+    # the whole payload is validated before anything is inserted
+    if len(books) > config.BULK_MAX_BOOKS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many books, at most {config.BULK_MAX_BOOKS} per request"
+        )
+
+    rows = [{**book.dict(), "user_id": current_user.id} for book in books]
+    return StreamingResponse(
+        stream_bulk_insert(session_factory, rows),
+        media_type="application/x-ndjson"
+    )
 
 # route to update a book
 @router.put("/{book_id}", response_model=schemas.BookResponse)
@@ -137,14 +206,16 @@ async def update_book(
     request: Request,
     book_id: int,
     book_update: schemas.BookUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Book:
     """Update a book"""
-    db_book = db.query(models.Book).filter(
-        models.Book.id == book_id,
-        models.Book.user_id == current_user.id
-    ).first()
+    db_book = await db.scalar(
+        select(models.Book).filter(
+            models.Book.id == book_id,
+            models.Book.user_id == current_user.id
+        )
+    )
     
     if not db_book:
         raise HTTPException(status_code=404, detail="Book not found")
@@ -152,8 +223,8 @@ async def update_book(
     for key, value in book_update.dict(exclude_unset=True).items():
         setattr(db_book, key, value)
     
-    db.commit()
-    db.refresh(db_book)
+    await db.commit()
+    await db.refresh(db_book)
 
     # Clear the cache for the current user
     event = Event(name="data_updated", data={"user_id": current_user.id})
@@ -167,19 +238,21 @@ async def update_book(
 async def delete_book(
     request: Request,
     book_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> dict:
     """Delete a book"""
-    db_book = db.query(models.Book).filter(
-        models.Book.id == book_id,
-        models.Book.user_id == current_user.id
-    ).first()
+    db_book = await db.scalar(
+        select(models.Book).filter(
+            models.Book.id == book_id,
+            models.Book.user_id == current_user.id
+        )
+    )
     
     if not db_book:
         raise HTTPException(status_code=404, detail="Book not found")
     
-    db.delete(db_book)
-    db.commit()
+    await db.delete(db_book)
+    await db.commit()
 
     return {"message": "Book deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,79 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, Request, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import Literal
+from book_api.core.rate_limiter import limiter
+from book_api import models, schemas
+from book_api.database import get_async_db, get_async_session_factory
+from book_api.core.lazy_session import ReleasingRoute
+from book_api.settings import config
+from book_api.services.library.export import EXPORT_WRITERS, stream_library_export
+from book_api.services.library.importer import spool_upload, run_library_import
+from book_api.auth import UserPrincipal, get_current_principal
+
+router = APIRouter(
+    prefix="/library",
+    tags=["library"],
+    responses={404: {"description": "Not found"}},
+    route_class=ReleasingRoute
+)
+
+# export the current user's library
+@router.get("/export")
+@limiter.limit("5/minute")
+async def export_library(
+    request: Request,
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format", description="Export file format"),
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+    current_user: UserPrincipal = Depends(get_current_principal)
+) -> StreamingResponse:
+    """Stream the user's books, shelves and reading statuses"""
+    writer = EXPORT_WRITERS[export_format]
+    return StreamingResponse(
+        stream_library_export(session_factory, current_user.id, export_format),
+        media_type=writer.media_type,
+        headers={"Content-Disposition": f'attachment; filename="library.{writer.extension}"'}
+    )
+
+# import a Goodreads library export
+@router.post("/import", response_model=schemas.ImportJobResponse, status_code=202)
+@limiter.limit("5/minute")
+async def import_library(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_session_factory),
+    current_user: UserPrincipal = Depends(get_current_principal)
+) -> models.ImportJob:
+    """Start importing a Goodreads CSV export, poll the returned job for progress"""
+    path = await spool_upload(file, config.IMPORT_MAX_UPLOAD_SIZE)
+
+    job = models.ImportJob(user_id=current_user.id, filename=file.filename, status="pending")
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+
+    background_tasks.add_task(run_library_import, session_factory, job.id, path)
+    return job
+
+# get the progress of an import
+@router.get("/import/{job_id}", response_model=schemas.ImportJobResponse)
+@limiter.limit("60/minute")
+async def get_import_job(
+    job_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
+) -> models.ImportJob:
+    """Get the status and progress of an import job"""
+    job = await db.scalar(
+        select(models.ImportJob).where(
+            models.ImportJob.id == job_id,
+            models.ImportJob.user_id == current_user.id
+        )
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
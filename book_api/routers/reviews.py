@@ -1,66 +1,111 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy import select, func
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from book_api import models, schemas
-from book_api.database import get_db
-from book_api.auth import get_current_active_user
+from book_api.database import get_async_db
+from book_api.core.lazy_session import ReleasingRoute
+from book_api.auth import UserPrincipal, get_current_principal
 from book_api.core.rate_limiter import limiter
-from book_api.utils.book_utils import get_review_statistics
+from book_api.utils.book_utils import get_cached_review_statistics, apply_rating_change
+from book_api.utils.pagination import encode_cursor, decode_cursor, seek_after_desc
 from book_api.core.event_bus import event_bus, Event
+from book_api.core.outbox import add_outbox_event
 
 router = APIRouter(
     prefix="/reviews",
     tags=["reviews"],
-    responses={404: {"description": "Not found"}}
+    responses={404: {"description": "Not found"}},
+    route_class=ReleasingRoute
 )
 
-@router.get("/", response_model=List[schemas.ReviewResponse])
+# columns GET /reviews/ can be ordered by, each paired with the id as tie breaker
+REVIEW_ORDER_COLUMNS = {
+    "newest": models.Review.created_at,
+    "rating": models.Review.rating,
+    "likes": models.Review.likes_count,
+}
+
+@router.get("/", response_model=schemas.PaginatedReviewResponse)
 @limiter.limit("30/minute")
 async def get_reviews(
     request: Request,
     book_id: Optional[int] = Query(None, description="Filter reviews by book ID"),
     user_id: Optional[int] = Query(None, description="Filter reviews by user ID"),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
-) -> List[models.Review]:
+    order_by: Literal["newest", "rating", "likes"] = Query("newest", description="Order by newest, highest rating or most liked"),
+    page: int = Query(1, gt=0, description="Page number, ignored when a cursor is given"),
+    per_page: int = Query(10, gt=0, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous page's next_cursor"),
+    include_total: bool = Query(True, description="Count all matching reviews, skip on deep pages"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
+) -> schemas.PaginatedReviewResponse:
     """
     Get reviews with optional filters.
     Any authenticated user can view any reviews.
     """
-    query = db.query(models.Review)
+    query = select(models.Review)
     
     if book_id:
         query = query.filter(models.Review.book_id == book_id)
     if user_id:
         query = query.filter(models.Review.user_id == user_id)
-    
-    return query.all()
+
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+
+    order_column = REVIEW_ORDER_COLUMNS[order_by]
+    query = query.order_by(order_column.desc(), models.Review.id.desc())
+
+    # seek past the last row of the previous page instead of counting off rows
+    if cursor:
+        value, last_id = decode_cursor(cursor, order_by)
+        query = query.filter(seek_after_desc(order_column, models.Review.id, value, last_id))
+    else:
+        query = query.offset((page - 1) * per_page)
+
+    # fetch one extra row to find out whether there is a next page
+    rows = (await db.scalars(query.limit(per_page + 1))).all()
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(order_by, getattr(last, order_column.key), last.id)
+
+    return schemas.PaginatedReviewResponse(
+        total=total,
+        page=page,
+        items=items,
+        next_cursor=next_cursor
+    )
 
 @router.get("/book/{book_id}/stats")
 @limiter.limit("30/minute")
 async def get_book_review_stats(
     request: Request,
     book_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> dict:
     """Get review statistics for a specific book"""
-    book = db.query(models.Book).filter(models.Book.id == book_id).first()
-    if not book:
+    stats = await get_cached_review_statistics(db, book_id)
+    if stats is None:
         raise HTTPException(status_code=404, detail="Book not found")
-    
-    return get_review_statistics(db, book_id)
+    return stats
 
 @router.get("/{review_id}", response_model=schemas.ReviewResponse)
 @limiter.limit("30/minute")
 async def get_review(
     request: Request,
     review_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Review:
     """Get a specific review by ID"""
-    review = db.query(models.Review).filter(models.Review.id == review_id).first()
+    review = await db.get(models.Review, review_id)
     
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
@@ -72,12 +117,16 @@ async def get_review(
 async def create_review(
     request: Request,
     review: schemas.ReviewCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Review:
     """Create a new review"""
     # Check if book exists
-    book = db.query(models.Book).filter(models.Book.id == review.book_id).first()
+    book = await db.scalar(
+        select(models.Book)
+        .options(selectinload(models.Book.user))
+        .filter(models.Book.id == review.book_id)
+    )
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
     
@@ -89,10 +138,12 @@ async def create_review(
         )
     
     # Check if user already reviewed this book
-    existing_review = db.query(models.Review).filter(
-        models.Review.book_id == review.book_id,
-        models.Review.user_id == current_user.id
-    ).first()
+    existing_review = await db.scalar(
+        select(models.Review).filter(
+            models.Review.book_id == review.book_id,
+            models.Review.user_id == current_user.id
+        )
+    )
     
     if existing_review:
         raise HTTPException(
@@ -105,26 +156,24 @@ async def create_review(
         user_id=current_user.id
     )
     db.add(new_review)
-    db.commit()
-    db.refresh(new_review)
+    await apply_rating_change(db, review.book_id, None, new_review.rating)
+    await db.flush()
+
+    # send review notification to book owner once the review is committed
+    add_outbox_event(db, "new_review", {
+        "user_id": book.user_id,
+        "email": book.user.email,
+        "book_title": book.title,
+        "reviewer_name": current_user.username,
+        "review_url": f"{request.base_url}/reviews/{new_review.id}"
+    })
+    await db.commit()
+    await db.refresh(new_review)
 
     # Update book's average rating
     event = Event(name="update_book_rating", data={"book_id": review.book_id})
     await event_bus.publish(event)
 
-    # send review notification to book owner
-    event = Event(
-        name="new_review",
-        data={
-            "email": book.user.email,
-            "book_title": book.title,
-            "reviewer_name": current_user.username,
-            "review_url": f"{request.base_url}/reviews/{new_review.id}"
-        }
-    )
-    await event_bus.publish(event)
-
-
     return new_review
 
 @router.put("/{review_id}", response_model=schemas.ReviewResponse)
@@ -133,11 +182,11 @@ async def update_review(
     request: Request,
     review_id: int,
     review_update: schemas.ReviewUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Review:
     """Update a review - users can only update their own reviews"""
-    db_review = db.query(models.Review).filter(models.Review.id == review_id).first()
+    db_review = await db.get(models.Review, review_id)
     
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
@@ -151,12 +200,14 @@ async def update_review(
     
     # Store book_id before update for cache clearing
     book_id = db_review.book_id
+    old_rating = db_review.rating
     
     for key, value in review_update.dict(exclude_unset=True).items():
         setattr(db_review, key, value)
     
-    db.commit()
-    db.refresh(db_review)
+    await apply_rating_change(db, book_id, old_rating, db_review.rating)
+    await db.commit()
+    await db.refresh(db_review)
 
     # Update book's average rating
     event = Event(name="update_book_rating", data={"book_id": book_id})
@@ -169,11 +220,11 @@ async def update_review(
 async def delete_review(
     request: Request,
     review_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> dict:
     """Delete a review - users can only delete their own reviews"""
-    db_review = db.query(models.Review).filter(models.Review.id == review_id).first()
+    db_review = await db.get(models.Review, review_id)
     
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
@@ -188,8 +239,9 @@ async def delete_review(
     # Store book_id before deletion for updating rating and cache
     book_id = db_review.book_id
     
-    db.delete(db_review)
-    db.commit()
+    await db.delete(db_review)
+    await apply_rating_change(db, book_id, db_review.rating, None)
+    await db.commit()
 
     # Update book's average rating
     event = Event(name="update_book_rating", data={"book_id": book_id})
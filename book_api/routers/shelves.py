@@ -1,13 +1,16 @@
 from fastapi import APIRouter, Depends, Request, HTTPException, Query, Body
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from typing import List, Optional
 from book_api import models, schemas
 from book_api.core.rate_limiter import limiter
 from book_api.core.event_bus import event_bus, Event
-from book_api.database import get_db
+from book_api.database import get_async_db
+from book_api.core.lazy_session import ReleasingRoute
 from book_api.auth import (
-    get_current_active_user
+    UserPrincipal,
+    get_current_principal
 )
 
 router = APIRouter(
@@ -15,19 +18,19 @@ router = APIRouter(
     tags=['shelves'],
     responses={
         404: {"description": "Not found"}
-    }
+    },
+    route_class=ReleasingRoute
 )
 
-def get_shelf_or_404(db: Session, shelf_id: int, user_id: int) -> models.Shelf:
+async def get_shelf_or_404(db: AsyncSession, shelf_id: int, user_id: int) -> models.Shelf:
     """Helper function to get shelf with proper error handling"""
     if shelf_id <= 0:
         raise HTTPException(status_code=404, detail="Shelf not found")
         
-    shelf = (
-        db.query(models.Shelf)
+    shelf = await db.scalar(
+        select(models.Shelf)
         .filter(models.Shelf.id == shelf_id)
         .filter(models.Shelf.user_id == user_id)
-        .first()
     )
     
     if not shelf:
@@ -35,21 +38,28 @@ def get_shelf_or_404(db: Session, shelf_id: int, user_id: int) -> models.Shelf:
     
     return shelf
 
+async def count_shelf_books(db: AsyncSession, shelf_id: int) -> int:
+    """Helper function to count the books on a shelf without loading them"""
+    return await db.scalar(
+        select(func.count())
+        .select_from(models.book_shelf)
+        .filter(models.book_shelf.c.shelf_id == shelf_id)
+    )
+
 # create a shelf
 @router.post('/', response_model=schemas.ShelfResponse)
 @limiter.limit('100/minute')
 async def create_shelf(
     request: Request,
     shelf: schemas.ShelfCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Shelf:
     # Check if shelf name already exists for this user
-    existing_shelf = (
-        db.query(models.Shelf)
+    existing_shelf = await db.scalar(
+        select(models.Shelf)
         .filter(models.Shelf.user_id == current_user.id)
         .filter(models.Shelf.name == shelf.name)
-        .first()
     )
     
     if existing_shelf:
@@ -64,8 +74,8 @@ async def create_shelf(
         is_default=False  # Explicitly set is_default
     )
     db.add(new_shelf)
-    db.commit()
-    db.refresh(new_shelf)
+    await db.commit()
+    await db.refresh(new_shelf)
     return new_shelf
 
 # get a user's shelves
@@ -73,14 +83,14 @@ async def create_shelf(
 @limiter.limit('100/minute')
 async def get_shelves(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
     name: Optional[str] = None,
     is_public: Optional[bool] = None,
     page: int = Query(1, gt=0)  # Ensure page is greater than 0
 ) -> schemas.PaginatedShelfResponse:
     # Build query
-    query = db.query(models.Shelf).filter(models.Shelf.user_id == current_user.id)
+    query = select(models.Shelf).filter(models.Shelf.user_id == current_user.id)
     
     # Apply filters
     if name:
@@ -89,14 +99,14 @@ async def get_shelves(
         query = query.filter(models.Shelf.is_public == is_public)
     
     # Get total count before pagination
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Apply pagination
-    shelves = query.offset((page - 1)*10).limit(10).all()
+    shelves = (await db.scalars(query.offset((page - 1)*10).limit(10))).all()
     
     # Add book count to each shelf
     for shelf in shelves:
-        shelf.book_count = len(shelf.books)
+        shelf.book_count = await count_shelf_books(db, shelf.id)
     
     return schemas.PaginatedShelfResponse(
         total=total,
@@ -110,10 +120,10 @@ async def get_shelves(
 async def get_shelf(
     request: Request,
     shelf_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Shelf:
-    return get_shelf_or_404(db, shelf_id, current_user.id)
+    return await get_shelf_or_404(db, shelf_id, current_user.id)
 
 # update a shelf
 @router.put('/{shelf_id}', response_model=schemas.ShelfResponse)
@@ -122,11 +132,11 @@ async def update_shelf(
     request: Request,
     shelf_id: int,
     shelf_update: schemas.ShelfUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> models.Shelf:
     # Get the shelf
-    shelf = get_shelf_or_404(db, shelf_id, current_user.id)
+    shelf = await get_shelf_or_404(db, shelf_id, current_user.id)
     
     # Prevent modification of default shelves
     if shelf.is_default:
@@ -137,12 +147,11 @@ async def update_shelf(
     
     # If name is being updated, check for uniqueness
     if shelf_update.name:
-        existing_shelf = (
-            db.query(models.Shelf)
+        existing_shelf = await db.scalar(
+            select(models.Shelf)
             .filter(models.Shelf.user_id == current_user.id)
             .filter(models.Shelf.name == shelf_update.name)
             .filter(models.Shelf.id != shelf_id)
-            .first()
         )
         if existing_shelf:
             raise HTTPException(
@@ -154,8 +163,8 @@ async def update_shelf(
     for key, value in shelf_update.dict(exclude_unset=True).items():
         setattr(shelf, key, value)
     
-    db.commit()
-    db.refresh(shelf)
+    await db.commit()
+    await db.refresh(shelf)
     
     return shelf
 
@@ -165,11 +174,11 @@ async def update_shelf(
 async def delete_shelf(
     request: Request,
     shelf_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> dict:
     # Get the shelf
-    shelf = get_shelf_or_404(db, shelf_id, current_user.id)
+    shelf = await get_shelf_or_404(db, shelf_id, current_user.id)
     
     # Prevent deletion of default shelves
     if shelf.is_default:
@@ -179,11 +188,14 @@ async def delete_shelf(
         )
     
     # Remove all book associations
-    shelf.books.clear()
+    await db.execute(
+        models.book_shelf.delete()
+        .where(models.book_shelf.c.shelf_id == shelf.id)
+    )
     
     # Delete the shelf
-    db.delete(shelf)
-    db.commit()
+    await db.delete(shelf)
+    await db.commit()
     
     return {"message": "Shelf deleted successfully"}
 
@@ -195,23 +207,25 @@ async def add_book_to_shelf(
     shelf_id: int,
     book_data: schemas.AddBookToShelf,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> schemas.ShelfBookResponse:
     
     # Get the shelf
-    shelf = get_shelf_or_404(db, shelf_id, current_user.id)
+    shelf = await get_shelf_or_404(db, shelf_id, current_user.id)
     
     # Get the book
-    book = db.query(models.Book).filter(models.Book.id == book_data.book_id).first()
+    book = await db.get(models.Book, book_data.book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
 
     # Check if the book is already in the shelf
-    existing = db.query(models.book_shelf).filter_by(
-        book_id=book.id,
-        shelf_id=shelf.id
-    ).first()
+    existing = (await db.execute(
+        select(models.book_shelf).filter_by(
+            book_id=book.id,
+            shelf_id=shelf.id
+        )
+    )).first()
     
     if existing:
         raise HTTPException(
@@ -220,7 +234,7 @@ async def add_book_to_shelf(
         )
 
     # Create the association with all required fields
-    db.execute(
+    await db.execute(
         models.book_shelf.insert().values(
             book_id=book.id,
             shelf_id=shelf.id,
@@ -231,7 +245,7 @@ async def add_book_to_shelf(
         )
     )
     
-    db.commit()
+    await db.commit()
 
     return {
         "book": book,
@@ -252,18 +266,18 @@ async def batch_move_books(
     shelf_id: int,
     target_shelf_id: int = Query(..., description="ID of the shelf to move the books to"),
     book_data: schemas.BatchMoveBooks= Body(...),  
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> dict:
     """
     Move multiple books from one shelf to another in a single operation.
     """
     try:
         # Start a nested transaction
-        with db.begin_nested():
+        async with db.begin_nested():
             # Validate source and target shelves exist and belong to user
-            source_shelf = get_shelf_or_404(db, shelf_id, current_user.id)
-            target_shelf = get_shelf_or_404(db, target_shelf_id, current_user.id)
+            source_shelf = await get_shelf_or_404(db, shelf_id, current_user.id)
+            target_shelf = await get_shelf_or_404(db, target_shelf_id, current_user.id)
             
             if source_shelf.id == target_shelf.id:
                 raise HTTPException(
@@ -272,11 +286,13 @@ async def batch_move_books(
                 )
 
             # Get all book associations for these books in source shelf
-            book_assocs = db.query(models.book_shelf).filter(
-                models.book_shelf.c.book_id.in_(book_data.book_ids),
-                models.book_shelf.c.shelf_id == source_shelf.id,
-                models.book_shelf.c.user_id == current_user.id
-            ).all()
+            book_assocs = (await db.execute(
+                select(models.book_shelf).filter(
+                    models.book_shelf.c.book_id.in_(book_data.book_ids),
+                    models.book_shelf.c.shelf_id == source_shelf.id,
+                    models.book_shelf.c.user_id == current_user.id
+                )
+            )).all()
 
             # Verify all books exist in source shelf
             found_book_ids = {assoc.book_id for assoc in book_assocs}
@@ -289,11 +305,13 @@ async def batch_move_books(
                 )
 
             # Check for existing books in target shelf
-            existing_books = db.query(models.book_shelf).filter(
-                models.book_shelf.c.book_id.in_(book_data.book_ids),
-                models.book_shelf.c.shelf_id == target_shelf.id,
-                models.book_shelf.c.user_id == current_user.id
-            ).all()
+            existing_books = (await db.execute(
+                select(models.book_shelf).filter(
+                    models.book_shelf.c.book_id.in_(book_data.book_ids),
+                    models.book_shelf.c.shelf_id == target_shelf.id,
+                    models.book_shelf.c.user_id == current_user.id
+                )
+            )).all()
 
             if existing_books:
                 existing_ids = {book.book_id for book in existing_books}
@@ -303,30 +321,30 @@ async def batch_move_books(
                 )
 
             # Move all books in one operation
-            move_count = db.execute(
+            move_count = (await db.execute(
                 models.book_shelf.update()
                 .where(models.book_shelf.c.book_id.in_(book_data.book_ids))
                 .where(models.book_shelf.c.shelf_id == source_shelf.id)
                 .where(models.book_shelf.c.user_id == current_user.id)
                 .values(shelf_id=target_shelf.id)
-            ).rowcount
+            )).rowcount
 
             # Update book counts
-            source_shelf.book_count = len(source_shelf.books) - move_count
-            target_shelf.book_count = len(target_shelf.books) + move_count
+            source_shelf.book_count = await count_shelf_books(db, source_shelf.id)
+            target_shelf.book_count = await count_shelf_books(db, target_shelf.id)
             
-            db.commit()
+        await db.commit()
 
-            return {
-                "message": f"Successfully moved {move_count} books to target shelf",
-                "moved_book_ids": book_data.book_ids
-            }
+        return {
+            "message": f"Successfully moved {move_count} books to target shelf",
+            "moved_book_ids": book_data.book_ids
+        }
 
     except HTTPException as he:
         # Re-raise HTTP exceptions
         raise he
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500,
             detail=f"Failed to move books: {str(e)}"
@@ -340,41 +358,47 @@ async def move_book(
     shelf_id: int,
     book_id: int,
     target_shelf_id: int = Query(..., description="ID of the shelf to move the book to"),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal)
 ) -> dict:
     try:
-        with db.begin_nested() as transaction:
+        async with db.begin_nested() as transaction:
             # Validate shelves exist
-            source_shelf = get_shelf_or_404(db, shelf_id, current_user.id)
-            target_shelf = get_shelf_or_404(db, target_shelf_id, current_user.id)
+            source_shelf = await get_shelf_or_404(db, shelf_id, current_user.id)
+            target_shelf = await get_shelf_or_404(db, target_shelf_id, current_user.id)
             
             # Check book exists in source shelf
-            book_assoc = db.query(models.book_shelf).filter(
-                models.book_shelf.c.book_id == book_id,
-                models.book_shelf.c.shelf_id == shelf_id
-            ).first()
+            book_assoc = (await db.execute(
+                select(models.book_shelf).filter(
+                    models.book_shelf.c.book_id == book_id,
+                    models.book_shelf.c.shelf_id == shelf_id
+                )
+            )).first()
             
             if not book_assoc:
                 raise HTTPException(status_code=404, detail="Book not found in source shelf")
                 
             # Check book doesn't exist in target shelf
-            existing = db.query(models.book_shelf).filter(
-                models.book_shelf.c.book_id == book_id,
-                models.book_shelf.c.shelf_id == target_shelf_id
-            ).first()
+            existing = (await db.execute(
+                select(models.book_shelf).filter(
+                    models.book_shelf.c.book_id == book_id,
+                    models.book_shelf.c.shelf_id == target_shelf_id
+                )
+            )).first()
             
             if existing:
                 raise HTTPException(status_code=400, detail="Book already exists in target shelf")
                 
             # Move the book
-            db.execute(
+            await db.execute(
                 models.book_shelf.update()
                 .where(models.book_shelf.c.book_id == book_id)
                 .where(models.book_shelf.c.shelf_id == shelf_id)
                 .values(shelf_id=target_shelf_id)
             )
             
+        await db.commit()
+
         return {"message": "Book moved successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -385,17 +409,17 @@ async def move_book(
 async def get_shelf_books(
     request: Request,
     shelf_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
     reading_status: Optional[str] = Query(None),
     sort_by: Optional[str] = Query(None),
     page: int = Query(1, gt=0)
 ) -> List[models.Book]:
     
-    shelf = get_shelf_or_404(db, shelf_id, current_user.id)
+    shelf = await get_shelf_or_404(db, shelf_id, current_user.id)
     
     query = (
-        db.query(
+        select(
             models.Book,
             models.book_shelf.c.reading_status,
             models.book_shelf.c.current_page,
@@ -419,7 +443,7 @@ async def get_shelf_books(
         query = query.order_by(models.book_shelf.c.current_page.desc())
         
     # Paginate results
-    results = query.offset((page - 1) * 10).limit(10).all()
+    results = (await db.execute(query.offset((page - 1) * 10).limit(10))).all()
     
     return [
         {
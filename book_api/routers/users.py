@@ -1,66 +1,93 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select, exists
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import datetime
 from book_api.core.rate_limiter import limiter
-from book_api.core.event_bus import event_bus, Event
+from book_api.core.outbox import add_outbox_event
+from book_api.core.sessions import session_store
 from book_api import models, schemas
-from book_api.database import get_db
+from book_api.database import get_async_db
+from book_api.core.lazy_session import ReleasingRoute
 from book_api.auth import (
-    get_password_hash,
-    get_user,
-    get_current_active_user,
-    authenticate_user,
+    get_password_hash_async,
+    get_user_async,
+    get_current_active_user_async,
+    authenticate_user_async,
     get_access_token,
-    check_role
+    get_current_principal,
+    get_user_principal,
+    get_credentials_exception,
+    invalidate_principal,
+    decode_token,
+    forget_token,
+    oauth2_scheme,
+    check_role,
+    UserPrincipal
 )
 
 router = APIRouter(
     prefix="/users",
     tags=["users"],
-    responses={404: {"description": "Not found"}}
+    responses={404: {"description": "Not found"}},
+    route_class=ReleasingRoute
 )
 
+async def is_following(db: AsyncSession, follower_id: int, followed_id: int) -> bool:
+    """Helper function to check for a row in the followers association table"""
+    return await db.scalar(
+        select(exists().where(
+            models.followers_assoc.c.follower_id == follower_id,
+            models.followers_assoc.c.followed_id == followed_id
+        ))
+    )
+
+async def has_liked_review(db: AsyncSession, user_id: int, review_id: int) -> bool:
+    """Helper function to check for a row in the review likes association table"""
+    return await db.scalar(
+        select(exists().where(
+            models.review_likes.c.user_id == user_id,
+            models.review_likes.c.review_id == review_id
+        ))
+    )
+
 # Create a user
 @router.post("/", response_model=schemas.UserResponse)
 @limiter.limit("100/minute")
 async def create_user(
     request: Request,
     user: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> models.User:
-    db_user = get_user(db, user.username)
+    db_user = await get_user_async(db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     new_user = models.User(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    # Publish user created event
-    event = Event(
-        name="user_created",
-        data={
-            "email": new_user.email,
-            "user_id": new_user.id,
-        }
-    )
-    await event_bus.publish(event)
+    await db.flush()
+
+    # Record the user created event in the same transaction as the user
+    add_outbox_event(db, "user_created", {
+        "email": new_user.email,
+        "user_id": new_user.id,
+    })
+    await db.commit()
+    await db.refresh(new_user)
 
     return new_user
 
 # Get all users (admin only)
 @router.get("/", response_model=List[schemas.UserResponse], dependencies=[Depends(check_role(['admin']))])
 @limiter.limit("100/minute")
-async def get_users(request: Request, db: Session = Depends(get_db)) -> List[models.User]:
-    users = db.query(models.User).all()
+async def get_users(request: Request, db: AsyncSession = Depends(get_async_db)) -> List[models.User]:
+    users = (await db.scalars(select(models.User))).all()
     return users
 
 # Login endpoints can be here too since they're user-related
@@ -69,18 +96,40 @@ async def get_users(request: Request, db: Session = Depends(get_db)) -> List[mod
 async def login_user(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> dict:
-    db_user = authenticate_user(db, form_data.username, form_data.password)
+    db_user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not db_user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
     
     db_user.last_login = datetime.datetime.utcnow()
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
-    access_token = get_access_token(data={'sub': db_user.username, 'role': db_user.role}, request=request)
-    return {"access_token": access_token, "token_type": "bearer"}
+    sid, refresh_token = await session_store.create(db_user.username)
+    access_token = get_access_token(data={'sub': db_user.username, 'role': db_user.role, 'sid': sid}, request=request)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+# Exchange a refresh token for a new access token, without a password check
+@router.post("/refresh", response_model=schemas.Token)
+@limiter.limit("100/minute")
+async def refresh_access_token(
+    request: Request,
+    refresh: schemas.RefreshRequest,
+    db: AsyncSession = Depends(get_async_db)
+) -> dict:
+    session = await session_store.rotate(refresh.refresh_token)
+    if session is None:
+        raise get_credentials_exception()
+    sid, username, refresh_token = session
+
+    principal = await get_user_principal(db, username)
+    if principal is None:
+        await session_store.revoke(sid)
+        raise get_credentials_exception()
+
+    access_token = get_access_token(data={'sub': principal.username, 'role': principal.role, 'sid': sid}, request=request)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 
 # Get current user profile
@@ -88,7 +137,7 @@ async def login_user(
 @limiter.limit("100/minute")
 async def get_current_user_profile(
     request: Request,
-    current_user: models.User = Depends(get_current_active_user)
+    current_user: models.User = Depends(get_current_active_user_async)
 ) -> models.User:
     return current_user
 
@@ -98,15 +147,28 @@ async def get_current_user_profile(
 async def update_user_profile(
     request: Request,
     user_update: schemas.UserUpdate,
-    current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(get_current_active_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ) -> models.User:
     for key, value in user_update.dict(exclude_unset=True).items():
         setattr(current_user, key, value)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
 
+# Log out, revoking the session of the token
+@router.post("/logout")
+@limiter.limit("100/minute")
+async def logout_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    current_user: UserPrincipal = Depends(get_current_principal)
+) -> dict:
+    await session_store.revoke(decode_token(token)['sid'])
+    forget_token(token)
+    await invalidate_principal(current_user.username)
+    return {"message": "Successfully logged out"}
+
 
 # Follow a user
 @router.post('/{user_id}/follow')
@@ -114,12 +176,12 @@ async def update_user_profile(
 async def follow_user(
     request: Request,
     user_id: int,
-    current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(get_current_active_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ) -> dict:
     try:
          # check if the user exists
-        user_to_follow = db.query(models.User).filter(models.User.id == user_id).first()
+        user_to_follow = await db.get(models.User, user_id)
         if not user_to_follow:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -127,7 +189,7 @@ async def follow_user(
         follower_name = current_user.username
         current_id = current_user.id
 
-        with db.begin_nested():
+        async with db.begin_nested():
             
             # do not allow the user to follow themselves
             if current_user.id == user_id:
@@ -137,31 +199,33 @@ async def follow_user(
                 )
 
             # check if the current user is not already following that user
-            if user_to_follow in current_user.followers:
+            if await is_following(db, current_id, user_id):
                 raise HTTPException(status_code=400, detail="Already following this user")
 
             # add a new row to the followers association table
-            current_user.followers.append(user_to_follow)
+            await db.execute(
+                models.followers_assoc.insert().values(
+                    follower_id=current_id,
+                    followed_id=user_id
+                )
+            )
             
             # update the current user's follows count and the user's followed_by count
             current_user.following_count += 1
             user_to_follow.followers_count += 1
+
+            # Record a new follower notification event with the follow
+            add_outbox_event(db, "new_follower", {
+                "user_id": user_id,
+                "email": follower_email,
+                "follower_name": follower_name,
+                "follower_profile_url": f"{request.base_url}/users/{current_id}"
+            })
             
-            # commit the changes to the database
-            db.commit()
-            
-            # Publish a new follower notification event
-            event = Event(
-                name="new_follower",
-                data={
-                    "email": follower_email,
-                    "follower_name": follower_name,
-                    "follower_profile_url": f"{request.base_url}/users/{current_id}"
-                }
-            )
-            await event_bus.publish(event)
+        # commit the changes to the database
+        await db.commit()
 
-            return {"message": f"Successfully followed user {user_id}"}
+        return {"message": f"Successfully followed user {user_id}"}
     except Exception as e:
         if not isinstance(e, HTTPException):
             raise e
@@ -182,30 +246,34 @@ async def follow_user(
 async def unfollow_user(
     request: Request,
     user_id: int,
-    current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: models.User = Depends(get_current_active_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ) -> dict:
     try:
-        with db.begin_nested():
+        async with db.begin_nested():
              # check if the user exists
-            user_to_unfollow = db.query(models.User).filter(models.User.id == user_id).first()
+            user_to_unfollow = await db.get(models.User, user_id)
             if not user_to_unfollow:
                 raise HTTPException(status_code=404, detail="User not found")
 
             # if the current user is not following the user to unfollow throw an exception
-            if user_to_unfollow not in current_user.followers:
+            if not await is_following(db, current_user.id, user_id):
                 raise HTTPException(status_code=400, detail="You are not following this user")
 
-            # add a new row to the followers association table
-            current_user.followers.remove(user_to_unfollow)
+            # remove the row from the followers association table
+            await db.execute(
+                models.followers_assoc.delete()
+                .where(models.followers_assoc.c.follower_id == current_user.id)
+                .where(models.followers_assoc.c.followed_id == user_id)
+            )
             
             # update the current user's follows count and the user's followed_by count
             current_user.following_count -= 1
             user_to_unfollow.followers_count -= 1
             
-            # commit the changes to the database
-            db.commit()
-            return {"message": f"Successfully unfollowed user {user_id}"}
+        # commit the changes to the database
+        await db.commit()
+        return {"message": f"Successfully unfollowed user {user_id}"}
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -217,12 +285,18 @@ async def unfollow_user(
 @limiter.limit('100/minute')
 async def get_following(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
     page: int = Query(1, gt=0, description="Page number"),
     per_page: int = Query(10, gt=0, le=100, description="Items per page")
 ) -> schemas.PaginatedUserResponse:
-    user_following = current_user.followers[(page-1) * per_page: page * per_page]
+    user_following = (await db.scalars(
+        select(models.User)
+        .join(models.followers_assoc, models.followers_assoc.c.followed_id == models.User.id)
+        .filter(models.followers_assoc.c.follower_id == current_user.id)
+        .offset((page-1) * per_page)
+        .limit(per_page)
+    )).all()
     count = len(user_following)
     
     return schemas.PaginatedUserResponse(
@@ -236,12 +310,18 @@ async def get_following(
 @limiter.limit('100/minute')
 async def get_followers(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
     page: int = Query(1, gt=0, description="Page number"),
     per_page: int = Query(10, gt=0, le=100, description="Items per page")
 ) -> schemas.PaginatedUserResponse:
-    user_followers = current_user.followed_by[(page-1) * per_page: page * per_page]
+    user_followers = (await db.scalars(
+        select(models.User)
+        .join(models.followers_assoc, models.followers_assoc.c.follower_id == models.User.id)
+        .filter(models.followers_assoc.c.followed_id == current_user.id)
+        .offset((page-1) * per_page)
+        .limit(per_page)
+    )).all()
     count = len(user_followers)
     
     return schemas.PaginatedUserResponse(
@@ -257,29 +337,34 @@ async def get_followers(
 async def like_review(
     request: Request,
     review_id: int,
-    current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ) -> dict:
     try:
-        with db.begin_nested():
+        async with db.begin_nested():
             # check if the review exists
-            review = db.query(models.Review).filter(models.Review.id == review_id).first()
+            review = await db.get(models.Review, review_id)
             if not review:
                 raise HTTPException(status_code=404, detail="Review not found")
             
             # check if the user has already liked the review
-            if current_user in review.liked_by:
+            if await has_liked_review(db, current_user.id, review_id):
                 raise HTTPException(status_code=400, detail="You have already liked this review")
             
-            # add the user to the review's liked_by list
-            review.liked_by.append(current_user)
+            # add a new row to the review likes association table
+            await db.execute(
+                models.review_likes.insert().values(
+                    review_id=review_id,
+                    user_id=current_user.id
+                )
+            )
 
             # update the review's like count
             review.likes_count += 1
             
-            # commit the changes to the database
-            db.commit()
-            return {"message": "Review liked successfully"}
+        # commit the changes to the database
+        await db.commit()
+        return {"message": "Review liked successfully"}
     except Exception as e:
         if e.status_code in [400, 404]:
             raise e
@@ -294,29 +379,33 @@ async def like_review(
 async def unlike_review(
     request: Request,
     review_id: int,
-    current_user: models.User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: UserPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ) -> dict:
     try:
-        with db.begin_nested():
+        async with db.begin_nested():
             # check if the review exists
-            review = db.query(models.Review).filter(models.Review.id == review_id).first()
+            review = await db.get(models.Review, review_id)
             if not review:
                 raise HTTPException(status_code=404, detail="Review not found")
             
             # check if the user has already liked the review
-            if current_user not in review.liked_by:
+            if not await has_liked_review(db, current_user.id, review_id):
                 raise HTTPException(status_code=400, detail="You have not liked this review")
             
-            # remove the user from the review's liked_by list
-            review.liked_by.remove(current_user)
+            # remove the row from the review likes association table
+            await db.execute(
+                models.review_likes.delete()
+                .where(models.review_likes.c.review_id == review_id)
+                .where(models.review_likes.c.user_id == current_user.id)
+            )
 
             # update the review's like count
             review.likes_count -= 1
             
-            # commit the changes to the database
-            db.commit()
-            return {"message": "Review unliked successfully"}
+        # commit the changes to the database
+        await db.commit()
+        return {"message": "Review unliked successfully"}
     except Exception as e:
         if e.status_code in [400, 404]:
             raise e
@@ -330,18 +419,17 @@ async def unlike_review(
 @limiter.limit('100/minute')
 async def get_liked_reviews(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
     page: int = Query(1, gt=0, description="Page number"),
     per_page: int = Query(10, gt=0, le=100, description="Items per page")
 ) -> schemas.PaginatedReviewResponse:
     # select all reviews from the review_likes association table where the user_id is the current user's id
-    liked_reviews = (
-        db.query(models.Review)
+    liked_reviews = (await db.scalars(
+        select(models.Review)
         .join(models.review_likes)
         .filter(models.review_likes.c.user_id == current_user.id)
-        .all()
-    )
+    )).all()
 
     # paginate the results
     count = len(liked_reviews)
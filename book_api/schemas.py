@@ -1,11 +1,15 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List, Literal, Dict
+from typing import Optional, List, Literal, Dict, Any
 from datetime import datetime
 
 # Token Schemas
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 # User Schemas
 class UserBase(BaseModel):
@@ -20,10 +24,16 @@ class UserCreate(BaseModel):
     email: EmailStr
     password: str = Field(..., min_length=6)
 
+NotificationFrequency = Literal["instant", "hourly", "daily", "off"]
+
 class UserUpdate(BaseModel):
     bio: Optional[str] = None
     profile_picture: Optional[str] = None
     email: Optional[EmailStr] = None
+    notification_frequency: Optional[NotificationFrequency] = None
+
+class RoleUpdate(BaseModel):
+    role: Literal["user", "admin"]
 
 class UserLogin(BaseModel):
     username: str
@@ -36,6 +46,7 @@ class UserResponse(UserBase):
     updated_at: datetime
     followers_count: int
     following_count: int
+    notification_frequency: NotificationFrequency = "hourly"
 
     class Config:
         from_attributes = True
@@ -73,9 +84,10 @@ class BookResponse(BookBase):
         from_attributes = True
 
 class PaginatedBookResponse(BaseModel):
-    total: int
+    total: Optional[int] = None  # None when the count was skipped
     page: int
     items: List[BookResponse]
+    next_cursor: Optional[str] = None
 
 
 # Review Schemas
@@ -101,9 +113,10 @@ class ReviewResponse(ReviewBase):
         from_attributes = True
 
 class PaginatedReviewResponse(BaseModel):
-    total: int
+    total: Optional[int] = None  # None when the count was skipped
     page: int
     items: List[ReviewResponse]
+    next_cursor: Optional[str] = None
 
 
 # Shelf schemas 
@@ -175,6 +188,23 @@ class UpdateBookStatus(BaseModel):
     reading_status: Literal["WANT_TO_READ", "CURRENTLY_READING", "READ"]
     current_page: Optional[int] = Field(None, ge=0)
 
+# import schemas
+
+class ImportJobResponse(BaseModel):
+    id: int
+    filename: Optional[str] = None
+    status: Literal["pending", "running", "completed", "failed"]
+    rows_processed: int
+    rows_failed: int
+    books_created: int
+    shelf_entries_created: int
+    errors: Optional[List[Dict[str, Any]]] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # other schemas
 
 class MessageResponse(BaseModel):
@@ -0,0 +1,134 @@
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict
+from sqlalchemy import select, and_, exists, null
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from book_api.models import Book, Shelf, book_shelf
+import csv
+import io
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# every export row has these columns, one row per book and shelf it is on
+EXPORT_COLUMNS = [
+    "book_id", "title", "author", "publisher", "year", "genre", "page_count", "average_rating",
+    "shelf_id", "shelf_name", "reading_status", "current_page", "started_at", "finished_at",
+]
+
+BOOK_COLUMNS = [
+    Book.id.label("book_id"), Book.title, Book.author, Book.publisher, Book.year,
+    Book.genre, Book.page_count, Book.average_rating,
+]
+
+PLACEMENT_COLUMNS = [
+    book_shelf.c.reading_status, book_shelf.c.current_page,
+    book_shelf.c.started_at, book_shelf.c.finished_at,
+]
+
+def library_book_rows(user_id: int):
+    """Select the user's books, once per shelf they are on and once if they are on none"""
+    return (
+        select(*BOOK_COLUMNS, Shelf.id.label("shelf_id"), Shelf.name.label("shelf_name"), *PLACEMENT_COLUMNS)
+        .select_from(Book)
+        .outerjoin(book_shelf, and_(book_shelf.c.book_id == Book.id, book_shelf.c.user_id == user_id))
+        .outerjoin(Shelf, Shelf.id == book_shelf.c.shelf_id)
+        .where(Book.user_id == user_id)
+        .order_by(Book.id, Shelf.id)
+    )
+
+def library_empty_shelf_rows(user_id: int):
+    """Select the user's shelves without books, so they survive a round trip through the export"""
+    has_books = exists().where(book_shelf.c.shelf_id == Shelf.id)
+    return (
+        select(
+            *(null().label(column.key) for column in BOOK_COLUMNS),
+            Shelf.id.label("shelf_id"),
+            Shelf.name.label("shelf_name"),
+            *(null().label(column.key) for column in PLACEMENT_COLUMNS)
+        )
+        .where(Shelf.user_id == user_id, ~has_books)
+        .order_by(Shelf.id)
+    )
+
+def _export_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+class NDJSONWriter:
+    """Format export rows as newline delimited JSON"""
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def header(self) -> str:
+        return ""
+
+    def rows(self, rows) -> str:
+        return "".join(
+            json.dumps({key: _export_value(value) for key, value in row.items()}) + "\n"
+            for row in rows
+        )
+
+class CSVWriter:
+    """Format export rows as CSV with a header line"""
+    media_type = "text/csv"
+    extension = "csv"
+
+    def _write(self, write) -> str:
+        buffer = io.StringIO()
+        write(csv.writer(buffer))
+        return buffer.getvalue()
+
+    def header(self) -> str:
+        return self._write(lambda writer: writer.writerow(EXPORT_COLUMNS))
+
+    def rows(self, rows) -> str:
+        return self._write(lambda writer: writer.writerows(
+            [_export_value(row[column]) for column in EXPORT_COLUMNS] for row in rows
+        ))
+
+EXPORT_WRITERS: Dict[str, type] = {
+    "ndjson": NDJSONWriter,
+    "csv": CSVWriter,
+}
+
+async def stream_library_export(
+    session_factory: async_sessionmaker,
+    user_id: int,
+    export_format: str = "ndjson",
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[str]:
+    """
+    Stream a user's books, shelves and reading statuses.
+
+    Rows are read through a server-side cursor and formatted one batch at a
+    time, so memory use does not grow with the size of the library.
+
+    Args:
+        session_factory (async_sessionmaker): Factory for the session the export reads with
+        user_id (int): ID of the user whose library is exported
+        export_format (str): "ndjson" or "csv"
+        batch_size (int): Rows fetched and written per chunk
+
+    Yields:
+        str: Formatted chunks of the export
+    """
+    writer = EXPORT_WRITERS[export_format]()
+    header = writer.header()
+    if header:
+        yield header
+
+    exported = 0
+    async with session_factory() as db:
+        db.info["read_only"] = True
+        for statement in (library_book_rows(user_id), library_empty_shelf_rows(user_id)):
+            result = await db.stream(statement, execution_options={"yield_per": batch_size})
+            async for partition in result.mappings().partitions():
+                exported += len(partition)
+                yield writer.rows(partition)
+
+    logger.info(f"Exported {exported} library rows for user {user_id} as {export_format}")
@@ -0,0 +1,256 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from fastapi import HTTPException, UploadFile
+from pydantic import ValidationError
+from sqlalchemy import select, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+from book_api import schemas
+from book_api.models import ImportJob, Shelf, book_shelf
+from book_api.settings import config
+from book_api.utils.book_utils import insert_books
+import csv
+import itertools
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# bytes copied per read when spooling an upload to disk
+UPLOAD_READ_SIZE = 1024 * 1024
+
+# rejected rows kept on the job, the rest are only counted
+MAX_JOB_ERRORS = 100
+
+# Goodreads has no genre column
+DEFAULT_GENRE = "Unknown"
+
+REQUIRED_COLUMNS = ("Title", "Author")
+
+# Goodreads exclusive shelves mapped to our default shelves and reading statuses
+EXCLUSIVE_SHELVES = {
+    "read": ("Read", "READ"),
+    "currently-reading": ("Currently Reading", "CURRENTLY_READING"),
+    "to-read": ("Want to Read", "WANT_TO_READ"),
+}
+
+@dataclass
+class ImportRow:
+    """A validated CSV row.
+
+    Attributes:
+        book (schemas.BookCreate): Book to create
+        reading_status (str): Reading status for every shelf the book goes on
+        shelves (List[str]): Names of the shelves to put the book on
+        finished_at (Optional[datetime]): When the book was read
+    """
+    book: schemas.BookCreate
+    reading_status: str = "WANT_TO_READ"
+    shelves: List[str] = field(default_factory=list)
+    finished_at: Optional[datetime] = None
+
+def _cell(row: Dict[str, Optional[str]], *columns: str) -> Optional[str]:
+    """Get the first non-empty value among columns, Goodreads leaves unknown values blank"""
+    for column in columns:
+        value = (row.get(column) or "").strip()
+        if value:
+            return value
+    return None
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    for date_format in ("%Y/%m/%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date '{value}'")
+
+def parse_import_row(row: Dict[str, Optional[str]]) -> ImportRow:
+    """
+    Map a Goodreads library export row to a book and its shelves.
+
+    Args:
+        row (Dict[str, Optional[str]]): Row from csv.DictReader
+
+    Returns:
+        ImportRow: The validated row
+
+    Raises:
+        ValidationError: If the book fails BookCreate validation
+        ValueError: If a date cannot be parsed
+    """
+    book = schemas.BookCreate(
+        title=_cell(row, "Title"),
+        author=_cell(row, "Author"),
+        publisher=_cell(row, "Publisher"),
+        year=_cell(row, "Year Published", "Original Publication Year"),
+        genre=_cell(row, "Genre") or DEFAULT_GENRE,
+        page_count=_cell(row, "Number of Pages"),
+    )
+    parsed = ImportRow(book=book)
+
+    exclusive = _cell(row, "Exclusive Shelf")
+    if exclusive in EXCLUSIVE_SHELVES:
+        shelf_name, parsed.reading_status = EXCLUSIVE_SHELVES[exclusive]
+        parsed.shelves.append(shelf_name)
+    if parsed.reading_status == "READ":
+        parsed.finished_at = _parse_date(_cell(row, "Date Read"))
+
+    # custom shelves, Goodreads lists the exclusive shelf here as well
+    for name in (_cell(row, "Bookshelves") or "").split(","):
+        name = name.strip()[:100]
+        if name and name not in EXCLUSIVE_SHELVES and name not in parsed.shelves:
+            parsed.shelves.append(name)
+    return parsed
+
+class ShelfResolver:
+    """Looks up shelf IDs by name for one user, creating missing shelves on first use"""
+
+    def __init__(self, db: AsyncSession, user_id: int):
+        self.db = db
+        self.user_id = user_id
+        self.shelf_ids: Dict[str, int] = {}
+
+    async def load(self):
+        rows = await self.db.execute(select(Shelf.name, Shelf.id).where(Shelf.user_id == self.user_id))
+        self.shelf_ids = {name: shelf_id for name, shelf_id in rows}
+
+    async def get_id(self, name: str) -> int:
+        if name not in self.shelf_ids:
+            shelf = Shelf(name=name, user_id=self.user_id, is_public=True, is_default=False)
+            self.db.add(shelf)
+            await self.db.flush()
+            self.shelf_ids[name] = shelf.id
+        return self.shelf_ids[name]
+
+async def spool_upload(upload: UploadFile, max_size: int) -> str:
+    """
+    Copy an upload to a temporary file so it can be imported after the request ends.
+
+    Args:
+        upload (UploadFile): Uploaded CSV file
+        max_size (int): Largest accepted upload in bytes
+
+    Returns:
+        str: Path of the temporary file, the caller is responsible for removing it
+
+    Raises:
+        HTTPException: If the upload is larger than max_size
+    """
+    size = 0
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as spooled:
+        while chunk := await upload.read(UPLOAD_READ_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                break
+            await run_in_threadpool(spooled.write, chunk)
+
+    if size > max_size:
+        os.remove(spooled.name)
+        raise HTTPException(status_code=413, detail=f"File too large, at most {max_size} bytes")
+    return spooled.name
+
+def _describe_error(error: ValueError) -> str:
+    """Summarize why a row was rejected"""
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+def _next_rows(reader: Iterator[Dict[str, Optional[str]]], count: int) -> List[Dict[str, Optional[str]]]:
+    return list(itertools.islice(reader, count))
+
+async def write_import_chunk(db: AsyncSession, job: ImportJob, shelves: ShelfResolver, rows: List[ImportRow]):
+    """
+    Insert a chunk of books and their shelf entries, one statement each, and count them on the job.
+
+    The shelf entries use the ids insert_books read back from the database,
+    a chunk whose ids cannot be matched to its rows fails the import before
+    any entry is written.
+    """
+    book_ids = await insert_books(db, [{**row.book.dict(), "user_id": job.user_id} for row in rows])
+
+    placements = []
+    for book_id, row in zip(book_ids, rows, strict=True):
+        for name in row.shelves:
+            placements.append({
+                "book_id": book_id,
+                "shelf_id": await shelves.get_id(name),
+                "user_id": job.user_id,
+                "reading_status": row.reading_status,
+                "current_page": 0,
+                "started_at": None,
+                "finished_at": row.finished_at,
+            })
+    if placements:
+        await db.execute(insert(book_shelf), placements)
+
+    job.books_created += len(book_ids)
+    job.shelf_entries_created += len(placements)
+
+async def run_library_import(session_factory: async_sessionmaker, job_id: int, path: str, chunk_size: Optional[int] = None):
+    """
+    Import a spooled Goodreads CSV export for an import job.
+
+    The file is parsed a chunk at a time in a worker thread and every chunk is
+    written and counted on the job in its own transaction, so progress is
+    visible while the import runs and memory use does not depend on the file
+    size. Invalid rows are skipped and recorded on the job. The file is
+    removed when the import ends.
+
+    Args:
+        session_factory (async_sessionmaker): Factory for the session the import writes with
+        job_id (int): ID of the ImportJob to run
+        path (str): Path of the spooled CSV file
+        chunk_size (Optional[int]): Rows per transaction, defaults to BULK_CHUNK_SIZE
+    """
+    chunk_size = chunk_size or config.BULK_CHUNK_SIZE
+    async with session_factory() as db:
+        job = await db.get(ImportJob, job_id)
+        job.status = "running"
+        await db.commit()
+
+        errors = list(job.errors or [])
+        try:
+            shelves = ShelfResolver(db, job.user_id)
+            await shelves.load()
+
+            with open(path, newline="", encoding="utf-8-sig") as csv_file:
+                reader = csv.DictReader(csv_file)
+                fieldnames = await run_in_threadpool(lambda: reader.fieldnames) or []
+                missing = [column for column in REQUIRED_COLUMNS if column not in fieldnames]
+                if missing:
+                    raise ValueError(f"Missing required columns: {', '.join(missing)}")
+
+                while rows := await run_in_threadpool(_next_rows, reader, chunk_size):
+                    parsed = []
+                    for number, row in enumerate(rows, start=job.rows_processed + 1):
+                        try:
+                            parsed.append(parse_import_row(row))
+                        except (ValidationError, ValueError) as e:
+                            job.rows_failed += 1
+                            if len(errors) < MAX_JOB_ERRORS:
+                                errors.append({"row": number, "error": _describe_error(e)})
+
+                    await write_import_chunk(db, job, shelves, parsed)
+                    job.rows_processed += len(rows)
+                    job.errors = list(errors)
+                    await db.commit()
+
+            job.status = "completed"
+            logger.info(f"Import job {job_id} created {job.books_created} books from {job.rows_processed} rows")
+        except Exception as e:
+            # the job goes back to the progress of the last committed chunk
+            await db.rollback()
+            await db.refresh(job)
+            logger.error(f"Import job {job_id} failed after {job.rows_processed} rows: {str(e)}")
+            job.status = "failed"
+            job.errors = errors + [{"row": None, "error": str(e)}]
+        finally:
+            os.remove(path)
+
+        job.finished_at = datetime.utcnow()
+        await db.commit()
@@ -0,0 +1,420 @@
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.message import EmailMessage, Message
+from email.utils import formataddr, formatdate, make_msgid
+from typing import AsyncIterator, Dict, List, Optional, Set
+from fastapi_mail import ConnectionConfig, MessageSchema
+from book_api.core.rate_limiter import TokenBucket
+from book_api.settings import config
+import aiosmtplib
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+class PooledConnection:
+    """An SMTP connection checked out of an SMTPConnectionPool"""
+
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    async def send(self, message: Message):
+        await self.smtp.send_message(message)
+        self.sent += 1
+
+class SMTPConnectionPool:
+    """Pool of persistent, logged in SMTP connections to one server.
+
+    Connections are reused across messages so only the first message on a
+    connection pays for the TCP and TLS handshakes and the login. Idle
+    connections older than `max_idle` seconds, or that sent `max_messages`
+    messages, are closed on checkout instead of reused, most servers drop
+    idle sessions on their own. A connection that failed is never reused.
+
+    Attributes:
+        settings (ConnectionConfig): SMTP server and credentials
+        size (int): Most connections open at once
+        max_idle (float): Seconds an idle connection is kept
+        max_messages (int): Messages sent over one connection before it is replaced
+    """
+    def __init__(self, settings: ConnectionConfig, size: int = 4, max_idle: float = 30.0, max_messages: int = 100):
+        self.settings = settings
+        self.size = size
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+        self._idle: List[PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.connects = 0
+        self.in_use = 0
+
+    async def _connect(self) -> PooledConnection:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.settings.MAIL_SERVER,
+            port=self.settings.MAIL_PORT,
+            timeout=self.settings.TIMEOUT,
+            use_tls=self.settings.MAIL_SSL_TLS,
+            start_tls=self.settings.MAIL_STARTTLS,
+            validate_certs=self.settings.VALIDATE_CERTS
+        )
+        await smtp.connect()
+        if self.settings.USE_CREDENTIALS:
+            await smtp.login(self.settings.MAIL_USERNAME, self.settings.MAIL_PASSWORD.get_secret_value())
+        self.connects += 1
+        logger.debug(f"Opened SMTP connection to {self.settings.MAIL_SERVER}:{self.settings.MAIL_PORT}")
+        return PooledConnection(smtp)
+
+    async def _close(self, connection: PooledConnection):
+        try:
+            if connection.smtp.is_connected:
+                await connection.smtp.quit()
+        except aiosmtplib.SMTPException:
+            connection.smtp.close()
+
+    def _reusable(self, connection: PooledConnection) -> bool:
+        return (
+            connection.smtp.is_connected
+            and connection.sent < self.max_messages
+            and time.monotonic() - connection.last_used < self.max_idle
+        )
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[PooledConnection]:
+        """Check out a connection, waiting while all `size` connections are in use"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            connection = None
+            while self._idle and connection is None:
+                candidate = self._idle.pop()
+                if self._reusable(candidate):
+                    connection = candidate
+                else:
+                    await self._close(candidate)
+            if connection is None:
+                connection = await self._connect()
+
+            self.in_use += 1
+            try:
+                yield connection
+            except BaseException:
+                # the session state is unknown after a failure
+                await self._close(connection)
+                raise
+            else:
+                connection.last_used = time.monotonic()
+                self._idle.append(connection)
+            finally:
+                self.in_use -= 1
+
+    async def close(self):
+        """Close every idle connection"""
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            await self._close(connection)
+        self._slots = None
+
+    def snapshot(self) -> dict:
+        return {"size": self.size, "idle": len(self._idle), "in_use": self.in_use, "connects": self.connects}
+
+@dataclass
+class OutgoingEmail:
+    """A queued email with its delivery attempts, `done` is set for a caller waiting on the send"""
+    message: MessageSchema
+    attempts: int = 0
+    done: Optional[asyncio.Future] = None
+
+    @property
+    def domain(self) -> str:
+        """Recipient domain the message is rate limited under"""
+        recipient = str(self.message.recipients[0])
+        return recipient.rsplit("@", 1)[-1].lower()
+
+def build_mime(message: MessageSchema, sender: str) -> EmailMessage:
+    """
+    Build the MIME message for a MessageSchema with the standard library email package.
+
+    The body goes out with the message's subtype and `alternative_body`, when
+    set, as its html alternative, which is everything EmailService sends.
+
+    Args:
+        message (MessageSchema): Message to build
+        sender (str): From address
+
+    Returns:
+        EmailMessage: Message ready for SMTP.send_message, which takes the Bcc header off
+
+    Raises:
+        ValueError: If the message has attachments
+    """
+    if message.attachments:
+        raise ValueError("Pooled email delivery does not send attachments")
+    mime = EmailMessage()
+    mime["Subject"] = message.subject
+    mime["From"] = sender
+    mime["To"] = ", ".join(str(recipient) for recipient in message.recipients)
+    for header, addresses in (("Cc", message.cc), ("Bcc", message.bcc), ("Reply-To", message.reply_to)):
+        if addresses:
+            mime[header] = ", ".join(str(address) for address in addresses)
+    mime["Date"] = formatdate(localtime=True)
+    mime["Message-ID"] = make_msgid()
+    for header, value in (message.headers or {}).items():
+        mime[header] = value
+    mime.set_content(message.body or "", subtype=message.subtype.value, charset=message.charset)
+    if message.alternative_body is not None:
+        mime.add_alternative(message.alternative_body, subtype="html", charset=message.charset)
+    return mime
+
+def is_transient(error: Exception) -> bool:
+    """Check whether a failed delivery is worth retrying"""
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return 400 <= error.code < 500
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return all(400 <= refused.code < 500 for refused in error.recipients)
+    return isinstance(error, (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError))
+
+class EmailDeliveryWorker:
+    """Sends queued emails in batches over pooled SMTP connections.
+
+    `submit` queues a message and returns, or with `wait` returns once the
+    message is sent. Worker tasks take up to `batch_size` queued messages at
+    a time and send them over one pooled connection. Every message waits
+    for its recipient domain's token bucket, so no provider gets more than
+    its rate, domains without a limit of their own share the "default" one.
+    Tokens are waited for before a connection is checked out, a batch hands
+    its connection back when none of its messages has a token, so a
+    throttled domain cannot starve the pool. Transient failures (4xx
+    replies, dropped connections, timeouts) are retried after an
+    exponential backoff with full jitter, up to `max_attempts`, so retries
+    after an outage do not arrive all at once. Permanent failures are
+    logged and dropped. A caller waiting on a message is answered once it
+    is sent or given up on, retries included, and gets the last error in
+    the second case. Waiting callers submitting at the same time, like the
+    outbox relay delivering a batch of events, share batches and
+    connections the same way queued messages do.
+
+    Attributes:
+        pool (SMTPConnectionPool): Connections the messages are sent over
+        sender (str): From address
+        rate_limits (Dict[str, float]): Messages per second by recipient domain, "default" for the others
+        workers (int): Worker tasks, at most the pool size is useful
+        batch_size (int): Messages sent per connection checkout
+        max_attempts (int): Delivery attempts before a message is dropped
+        retry_delay (float): Upper bound of the first retry delay, doubled on every attempt
+        queue_size (int): Queued messages before submit waits
+    """
+    MAX_RETRY_DELAY = 300
+
+    def __init__(
+        self,
+        pool: SMTPConnectionPool,
+        sender: str,
+        rate_limits: Optional[Dict[str, float]] = None,
+        workers: int = 2,
+        batch_size: int = 20,
+        max_attempts: int = 5,
+        retry_delay: float = 2.0,
+        queue_size: int = 10000
+    ):
+        self.pool = pool
+        self.sender = sender
+        self.rate_limits = rate_limits or {}
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._waiting: Set[asyncio.Future] = set()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"email-delivery-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Email delivery started with {self.workers} worker(s)")
+
+    async def stop(self, timeout: float = 30):
+        """
+        Send the queued messages, then stop the workers and close the connections.
+
+        Args:
+            timeout (float): Seconds to wait for the queue to empty
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Stopped email delivery with {self._queue.qsize()} message(s) unsent")
+        if self._retries:
+            logger.error(f"Stopped email delivery with {len(self._retries)} message(s) waiting for a retry")
+
+        tasks = self._tasks + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._retries = set()
+        # callers still waiting get an error they can retry on, instead of hanging
+        waiting, self._waiting = self._waiting, set()
+        for done in waiting:
+            if not done.done():
+                done.set_exception(RuntimeError("Email delivery stopped before the message was sent"))
+        await self.pool.close()
+
+    async def submit(self, message: MessageSchema, wait: bool = False):
+        """
+        Queue a message for delivery.
+
+        Args:
+            message (MessageSchema): Message to send
+            wait (bool): Return once the message is sent or given up on, for callers that
+                must not lose it, like the handlers the outbox relay runs
+
+        Raises:
+            Exception: With `wait`, the error the last delivery attempt failed with
+        """
+        email = OutgoingEmail(message)
+        if wait:
+            email.done = asyncio.get_running_loop().create_future()
+            self._waiting.add(email.done)
+            email.done.add_done_callback(self._waiting.discard)
+        await self._queue.put(email)
+        if wait:
+            await email.done
+
+    def _bucket(self, domain: str) -> Optional[TokenBucket]:
+        key = domain if domain in self.rate_limits else "default"
+        if key not in self.rate_limits:
+            return None
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(self.rate_limits[key])
+        return self._buckets[key]
+
+    async def _next_batch(self) -> List[OutgoingEmail]:
+        """Wait for a message, then take whatever else is queued up to the batch size"""
+        batch = [await self._queue.get()]
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._send_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _take_token(self, remaining: List[OutgoingEmail]) -> Optional[OutgoingEmail]:
+        """Take the first message whose domain has a token right now, None if none has"""
+        for index, email in enumerate(remaining):
+            bucket = self._bucket(email.domain)
+            if bucket is None or bucket.try_acquire() == 0:
+                return remaining.pop(index)
+        return None
+
+    async def _send_batch(self, batch: List[OutgoingEmail]):
+        self.batches += 1
+        remaining = list(batch)
+        while remaining:
+            # wait for a token without holding a connection
+            email = remaining.pop(0)
+            bucket = self._bucket(email.domain)
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                async with self.pool.connection() as connection:
+                    while email is not None:
+                        try:
+                            await connection.send(build_mime(email.message, self.sender))
+                        except (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused, ValueError) as e:
+                            # the server refused this message, the session itself is still usable
+                            self._failed(email, e)
+                        else:
+                            self._sent(email)
+                        email = self._take_token(remaining)
+            except Exception as e:
+                # the connection broke, everything not sent yet is retried
+                unsent = [email] + remaining if email is not None else remaining
+                logger.warning(f"SMTP connection failed with {len(unsent)} message(s) unsent: {str(e)}")
+                for email in unsent:
+                    self._failed(email, e)
+                return
+
+    def _sent(self, email: OutgoingEmail):
+        self.sent += 1
+        if email.done is not None and not email.done.done():
+            email.done.set_result(None)
+
+    def _failed(self, email: OutgoingEmail, error: Exception):
+        email.attempts += 1
+        recipients = ", ".join(str(recipient) for recipient in email.message.recipients)
+        if not is_transient(error) or email.attempts >= self.max_attempts:
+            self.failed += 1
+            logger.error(f"Giving up on email '{email.message.subject}' to {recipients} after {email.attempts} attempt(s): {str(error)}")
+            if email.done is not None and not email.done.done():
+                email.done.set_exception(error)
+            return
+
+        # full jitter keeps retries after an outage from arriving together
+        delay = random.uniform(0, min(self.retry_delay * 2 ** (email.attempts - 1), self.MAX_RETRY_DELAY))
+        logger.warning(f"Retrying email '{email.message.subject}' to {recipients} in {delay:.1f}s: {str(error)}")
+        self.retried += 1
+        task = asyncio.create_task(self._retry_later(email, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, email: OutgoingEmail, delay: float):
+        await asyncio.sleep(delay)
+        await self._queue.put(email)
+
+    def snapshot(self) -> dict:
+        """Get queue depth, delivery counters and pool usage"""
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "waiting_retry": len(self._retries),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "pool": self.pool.snapshot(),
+        }
+
+def email_sender(settings: ConnectionConfig) -> str:
+    """From address the same way FastMail formats it"""
+    if settings.MAIL_FROM_NAME is not None:
+        return formataddr((settings.MAIL_FROM_NAME, settings.MAIL_FROM))
+    return settings.MAIL_FROM
+
+email_delivery = EmailDeliveryWorker(
+    SMTPConnectionPool(config.email_config, size=config.EMAIL_POOL_SIZE, max_idle=config.EMAIL_POOL_MAX_IDLE),
+    sender=email_sender(config.email_config),
+    rate_limits=config.EMAIL_RATE_LIMITS,
+    workers=config.EMAIL_POOL_SIZE,
+    batch_size=config.EMAIL_BATCH_SIZE,
+    max_attempts=config.EMAIL_MAX_ATTEMPTS,
+    retry_delay=config.EMAIL_RETRY_DELAY,
+    queue_size=config.EMAIL_QUEUE_SIZE
+)
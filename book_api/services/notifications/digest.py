@@ -0,0 +1,251 @@
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Dict, List, Optional
+from sqlalchemy import select, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from book_api.models import NotificationDigestItem, User
+from book_api.database import AsyncSessionLocal
+from book_api.settings import config
+from book_api.services.notifications.email_service import email_service
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# how long notifications collect before a recipient's digest goes out
+DIGEST_WINDOWS = {
+    "hourly": timedelta(hours=1),
+    "daily": timedelta(days=1),
+}
+
+# notification kinds that can be digested
+DIGEST_KINDS = ("new_follower", "new_review")
+
+class DigestRouting(Enum):
+    """What to do with a notification after queue_for_digest"""
+    QUEUED = "queued"  # stored for the recipient's digest
+    SEND = "send"  # send it right away
+    SKIP = "skip"  # the recipient turned notifications off or no longer exists, send nothing
+
+async def queue_for_digest(
+    kind: str,
+    data: dict,
+    key: Optional[str] = None,
+    session_factory: async_sessionmaker = AsyncSessionLocal
+) -> DigestRouting:
+    """
+    Store a notification for the recipient's digest, following their preference.
+
+    Args:
+        kind (str): Notification kind, the name of the event
+        data (dict): Event data, with the recipient in "user_id"
+        key (Optional[str]): Idempotency key of the event, a redelivered event is stored once
+        session_factory (async_sessionmaker): Factory for the session the item is stored with
+
+    Returns:
+        DigestRouting: QUEUED if the notification was stored, SKIP if nothing should be sent,
+            SEND if it should be sent right away
+    """
+    user_id = data.get("user_id")
+    if kind not in DIGEST_KINDS or not user_id:
+        return DigestRouting.SEND
+
+    async with session_factory() as db:
+        recipient = (await db.execute(
+            select(User.notification_frequency).where(User.id == user_id)
+        )).one_or_none()
+        if recipient is None or recipient.notification_frequency == "off":
+            return DigestRouting.SKIP
+        if recipient.notification_frequency not in DIGEST_WINDOWS:
+            return DigestRouting.SEND
+
+        db.add(NotificationDigestItem(user_id=user_id, kind=kind, payload=data, idempotency_key=key))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # the event was delivered again and is already waiting
+            await db.rollback()
+        return DigestRouting.QUEUED
+
+def summarize_digest(items: List[NotificationDigestItem]) -> Dict[str, list]:
+    """Group digest items into the followers and the reviews per book a digest email lists"""
+    followers = []
+    reviews: Dict[str, list] = {}
+    for item in items:
+        if item.kind == "new_follower":
+            followers.append({
+                "name": item.payload.get("follower_name"),
+                "profile_url": item.payload.get("follower_profile_url"),
+            })
+        elif item.kind == "new_review":
+            reviews.setdefault(item.payload.get("book_title"), []).append({
+                "reviewer_name": item.payload.get("reviewer_name"),
+                "review_url": item.payload.get("review_url"),
+            })
+    return {
+        "followers": followers,
+        "reviews": [{"book_title": title, "reviews": book_reviews} for title, book_reviews in reviews.items()],
+    }
+
+class DigestFlusher:
+    """Sends one digest email per recipient once their window has passed.
+
+    A recipient is due when their oldest waiting notification is older than
+    the window of their notification frequency. Recipients who switched to
+    instant notifications are flushed right away, the items of recipients
+    who turned notifications off are dropped. A recipient's items are taken
+    in a short transaction that locks and deletes them, and the email is
+    sent after the commit, so no row lock or pooled connection is held
+    across the SMTP send. A failed send puts the items back for the next
+    pass. Up to `concurrency` recipients are flushed at once.
+
+    Attributes:
+        session_factory (async_sessionmaker): Factory for the flusher's sessions
+        batch_size (int): Recipients flushed per pass
+        poll_interval (float): Seconds between passes
+        concurrency (int): Recipients flushed at once
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        batch_size: int = 100,
+        poll_interval: float = 60.0,
+        concurrency: int = 10
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+
+    async def due_recipients(self, now: Optional[datetime] = None) -> List[int]:
+        """Get the IDs of the recipients whose digest is due"""
+        now = now or datetime.utcnow()
+        oldest = func.min(NotificationDigestItem.created_at)
+        recipients = []
+        async with self.session_factory() as db:
+            for frequency, window in DIGEST_WINDOWS.items():
+                rows = await db.scalars(
+                    select(NotificationDigestItem.user_id)
+                    .join(User, User.id == NotificationDigestItem.user_id)
+                    .where(User.notification_frequency == frequency)
+                    .group_by(NotificationDigestItem.user_id)
+                    .having(oldest <= now - window)
+                    .limit(self.batch_size)
+                )
+                recipients.extend(rows)
+
+            # preferences changed away from a digest since the items were stored
+            rows = await db.scalars(
+                select(NotificationDigestItem.user_id.distinct())
+                .join(User, User.id == NotificationDigestItem.user_id)
+                .where(User.notification_frequency.notin_(list(DIGEST_WINDOWS)))
+                .limit(self.batch_size)
+            )
+            recipients.extend(rows)
+        return recipients
+
+    async def _take_items(self, user_id: int):
+        """Delete a recipient's waiting items in one short transaction, returning them and the recipient"""
+        async with self.session_factory() as db:
+            items = (await db.scalars(
+                select(NotificationDigestItem)
+                .where(NotificationDigestItem.user_id == user_id)
+                .order_by(NotificationDigestItem.id)
+                .with_for_update(skip_locked=True)
+            )).all()
+            if not items:
+                return [], None
+
+            recipient = (await db.execute(
+                select(User.email, User.notification_frequency).where(User.id == user_id)
+            )).one_or_none()
+            await db.execute(delete(NotificationDigestItem).where(NotificationDigestItem.id.in_([item.id for item in items])))
+            await db.commit()
+            return items, recipient
+
+    async def _put_back(self, items: List[NotificationDigestItem]):
+        """Store items again after their digest failed to send"""
+        async with self.session_factory() as db:
+            for item in items:
+                db.add(NotificationDigestItem(
+                    user_id=item.user_id,
+                    kind=item.kind,
+                    payload=item.payload,
+                    idempotency_key=item.idempotency_key,
+                    created_at=item.created_at
+                ))
+            await db.commit()
+
+    async def flush_recipient(self, user_id: int) -> int:
+        """
+        Send one recipient's digest and remove its items.
+
+        Returns:
+            int: Number of notifications in the digest, 0 if there was nothing to send
+
+        Raises:
+            Exception: The error the send failed with, after the items were put back
+        """
+        items, recipient = await self._take_items(user_id)
+        if not items:
+            return 0
+
+        # the recipient may have been deleted since the items were queued
+        if recipient is not None and recipient.notification_frequency != "off":
+            summary = summarize_digest(items)
+            try:
+                await email_service.send_notification_digest(recipient.email, summary["followers"], summary["reviews"])
+            except Exception:
+                await self._put_back(items)
+                raise
+
+        logger.info(f"Flushed {len(items)} notification(s) for user {user_id}")
+        return len(items)
+
+    async def flush_due(self) -> int:
+        """
+        Flush every recipient whose digest is due, `concurrency` at a time.
+
+        Returns:
+            int: Number of digests sent
+        """
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def flush(user_id: int) -> bool:
+            async with slots:
+                try:
+                    return bool(await self.flush_recipient(user_id))
+                except Exception as e:
+                    logger.error(f"Failed to send the notification digest for user {user_id}: {str(e)}", exc_info=True)
+                    return False
+
+        flushed = await asyncio.gather(*(flush(user_id) for user_id in await self.due_recipients()))
+        return sum(flushed)
+
+    async def run(self, stop: asyncio.Event):
+        """
+        Flush due digests every `poll_interval` seconds until `stop` is set.
+
+        Args:
+            stop (asyncio.Event): Set to stop after the current pass
+        """
+        logger.info("Digest flusher started")
+        while not stop.is_set():
+            try:
+                await self.flush_due()
+            except Exception as e:
+                logger.error(f"Digest flush pass failed: {str(e)}", exc_info=True)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.info("Digest flusher stopped")
+
+digest_flusher = DigestFlusher(
+    AsyncSessionLocal,
+    batch_size=config.DIGEST_BATCH_SIZE,
+    poll_interval=config.DIGEST_FLUSH_INTERVAL,
+    concurrency=config.DIGEST_CONCURRENCY
+)
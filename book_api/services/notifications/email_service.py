@@ -1,7 +1,9 @@
 from fastapi_mail import FastMail, MessageSchema
 from book_api.settings import config
+from book_api.services.notifications.delivery import email_delivery
+from book_api.services.notifications.templates import EmailTemplates, RenderedEmail, TEMPLATE_DIR
 from pydantic import EmailStr
-from typing import List
+from typing import List, Dict
 from fastapi import HTTPException, status
 import logging
 
@@ -10,22 +12,36 @@ logger = logging.getLogger(__name__)
 class EmailService:
     def __init__(self):
         self.fastmail = FastMail(config.email_config)
+        self.templates = EmailTemplates(
+            TEMPLATE_DIR,
+            globals={"frontend_url": config.FRONTEND_URL},
+            cache_size=config.EMAIL_RENDER_CACHE_SIZE
+        )
 
     async def __send_email(
         self,
         subject: str,
         recipients: List[EmailStr],
-        body: str
+        rendered: RenderedEmail
     ):
         try: 
+            # plain text first, mail clients show the last alternative they support
             message = MessageSchema(
                 subject=subject,
                 recipients=recipients,
-                body=body,
-                subtype="html"
+                body=rendered.text,
+                alternative_body=rendered.html,
+                subtype="plain",
+                multipart_subtype="alternative"
             )
 
-            await self.fastmail.send_message(message)
+            # pooled delivery when its workers run, otherwise a session of its own. Either way
+            # this returns once the message is sent, so the outbox only marks an event handled
+            # after its email is out
+            if email_delivery.running:
+                await email_delivery.submit(message, wait=True)
+            else:
+                await self.fastmail.send_message(message)
         except Exception as e:
             logger.error(f"Error sending email: {e}")
             raise HTTPException(
@@ -36,22 +52,16 @@ class EmailService:
 
     async def send_welcome_email(self, email: EmailStr):
         subject = "Welcome to BookReads"
-        body = f"""
-        <h1>Welcome to BookReads</h1>
-        <p>Thank you for signing up for BookReads. We hope you enjoy the service.</p>
-        """
+        # the same for every user
+        rendered = self.templates.render("welcome", {}, cache_key="welcome")
 
-        await self.__send_email(subject, [email], body)
+        await self.__send_email(subject, [email], rendered)
 
     async def send_password_reset_email(self, email: EmailStr, token: str):
         subject = "Password Reset Request"
-        body = f"""
-        <h1>Password Reset Request</h1>
-        <p>You have requested a password reset. Click the link below to reset your password.</p>
-        <a href="{config.FRONTEND_URL}/reset-password?token={token}">Reset Password</a>
-        """
+        rendered = self.templates.render("password_reset", {"token": token})
 
-        await self.__send_email(subject, [email], body)
+        await self.__send_email(subject, [email], rendered)
 
     async def follower_notification(
         self, 
@@ -60,12 +70,11 @@ class EmailService:
         follower_profile_url: str  # Add more context
     ):
         subject = "New Follower"
-        body = f"""
-        <h1>New Follower</h1>
-        <p>You have a new follower: {follower}</p>
-        <p>View their profile: <a href="{follower_profile_url}">here</a></p>
-        """
-        await self.__send_email(subject, [email], body)
+        rendered = self.templates.render("new_follower", {
+            "follower": follower,
+            "follower_profile_url": follower_profile_url,
+        })
+        await self.__send_email(subject, [email], rendered)
 
     async def review_notification(
         self, 
@@ -75,12 +84,37 @@ class EmailService:
         review_url: str  # Add more context
     ):
         subject = "New Review"
-        body = f"""
-        <h1>New Review</h1>
-        <p>{reviewer} posted a new review for {book}</p>
-        <p>Read the review: <a href="{review_url}">here</a></p>
-        """
-        await self.__send_email(subject, [email], body)
+        rendered = self.templates.render("new_review", {
+            "book": book,
+            "reviewer": reviewer,
+            "review_url": review_url,
+        })
+        await self.__send_email(subject, [email], rendered)
+
+    async def send_notification_digest(
+        self,
+        email: EmailStr,
+        followers: List[Dict[str, str]],
+        reviews: List[Dict]
+    ):
+        """Send the summary of the followers and reviews since the last digest"""
+        await self.__send_email(digest_subject(followers, reviews), [email], self.render_digest(followers, reviews))
+
+    def render_digest(self, followers: List[Dict[str, str]], reviews: List[Dict]) -> RenderedEmail:
+        return self.templates.render("digest", {
+            "followers": followers,
+            "reviews": reviews,
+            "max_listed": config.DIGEST_MAX_LISTED,
+        })
+
+def digest_subject(followers: List[Dict[str, str]], reviews: List[Dict]) -> str:
+    review_count = sum(len(book["reviews"]) for book in reviews)
+    parts = []
+    if followers:
+        parts.append(f"{len(followers)} new follower{'s' if len(followers) != 1 else ''}")
+    if review_count:
+        parts.append(f"{review_count} new review{'s' if review_count != 1 else ''}")
+    return f"Your BookReads updates: {' and '.join(parts)}"
 
 
-email_service = EmailService()
+email_service = EmailService()
\ No newline at end of file
@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Optional
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template, select_autoescape
+from book_api.core.cache import LRUCache
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+# templates never change while the process runs
+RENDER_CACHE_TTL = float("inf")
+
+@dataclass(frozen=True)
+class RenderedEmail:
+    """The two bodies of a multipart/alternative email"""
+    html: str
+    text: str
+
+class EmailTemplates:
+    """Jinja2 email templates, compiled once when the application starts.
+
+    Every email has an HTML template `<name>.html` and a plain text template
+    `<name>.txt`. Both are compiled when the object is created, so a broken
+    template fails startup instead of the first send, and rendering never
+    touches the disk. HTML templates are autoescaped.
+
+    Renders of emails that look the same for every recipient can be kept in
+    an LRU cache by passing a `cache_key` that identifies the context.
+
+    Attributes:
+        directory (str): Directory the templates are loaded from
+        env (Environment): Jinja2 environment the templates are compiled in
+
+    Example:
+        templates = EmailTemplates(TEMPLATE_DIR, globals={"frontend_url": "https://bookreads.example"})
+        rendered = templates.render("welcome", {}, cache_key="welcome")
+    """
+    def __init__(self, directory: str = TEMPLATE_DIR, globals: Optional[Dict[str, Any]] = None, cache_size: int = 256):
+        self.directory = directory
+        self.env = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(["html"]),
+            undefined=StrictUndefined,
+            auto_reload=False,
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        self.env.globals.update(globals or {})
+        self._templates: Dict[str, Template] = {
+            name: self.env.get_template(name)
+            for name in self.env.list_templates(extensions=["html", "txt"])
+        }
+        self._cache = LRUCache(cache_size, RENDER_CACHE_TTL)
+        logger.info(f"Compiled {len(self._templates)} email templates from {directory}")
+
+    def render(self, name: str, context: Dict[str, Any], cache_key: Optional[Hashable] = None) -> RenderedEmail:
+        """
+        Render both bodies of an email.
+
+        Args:
+            name (str): Template name without extension
+            context (Dict[str, Any]): Template variables
+            cache_key (Optional[Hashable]): Identifies the context, renders with a key are cached
+
+        Returns:
+            RenderedEmail: The HTML and plain text bodies
+
+        Raises:
+            KeyError: If the email has no HTML or no text template
+        """
+        if cache_key is not None:
+            cached = self._cache.get((name, cache_key))
+            if cached is not None:
+                return cached
+
+        rendered = RenderedEmail(
+            html=self._templates[f"{name}.html"].render(context),
+            text=self._templates[f"{name}.txt"].render(context),
+        )
+        if cache_key is not None:
+            self._cache.set((name, cache_key), rendered)
+        return rendered
@@ -0,0 +1,128 @@
+from typing import Dict, List, Optional
+from sqlalchemy import select, func, literal, literal_column, bindparam, table, column, or_, and_
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.sql import Subquery
+from book_api.models import Book
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# fields a search can be restricted to, "any" searches title and author together
+SEARCH_FIELDS = ("any", "title", "author")
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def search_terms(query: Optional[str]) -> List[str]:
+    """Split user input into search terms, dropping any query syntax characters"""
+    return WORD_PATTERN.findall(query or "")
+
+class BookSearch:
+    """Ranked, prefix-matching book search over title and author.
+
+    Subclasses implement the search for one database dialect. Every search
+    returns a subquery of (id, score) rows for the matching books, where a
+    higher score is a better match, so callers can join it to their own
+    book query and order by relevance.
+
+    Example:
+        search = get_book_search(db.get_bind().dialect.name)
+        ranked = search.ranked_ids({"title": "hobbit", "author": "tolk"})
+        books = select(Book).join(ranked, ranked.c.id == Book.id).order_by(ranked.c.score.desc())
+    """
+
+    def ranked_ids(self, queries: Dict[str, Optional[str]]) -> Optional[Subquery]:
+        """Build the (id, score) subquery for the given field queries.
+
+        Args:
+            queries (Dict[str, Optional[str]]): Search text keyed by field ("any", "title" or "author")
+
+        Returns:
+            Optional[Subquery]: Matching book IDs with their score, None if no query has any terms
+        """
+        terms = {
+            field: search_terms(query)
+            for field, query in queries.items()
+            if field in SEARCH_FIELDS
+        }
+        terms = {field: field_terms for field, field_terms in terms.items() if field_terms}
+        if not terms:
+            return None
+        logger.debug(f"Searching books with {type(self).__name__} for {terms}")
+        return self._ranked_ids(terms).subquery("book_search")
+
+    def _ranked_ids(self, terms: Dict[str, List[str]]):
+        raise NotImplementedError
+
+class MySQLBookSearch(BookSearch):
+    """Book search backed by InnoDB FULLTEXT indexes in boolean mode"""
+
+    COLUMNS = {
+        "any": (Book.title, Book.author),
+        "title": (Book.title,),
+        "author": (Book.author,),
+    }
+
+    def _ranked_ids(self, terms: Dict[str, List[str]]):
+        # every term is required and matches as a prefix
+        matches = [
+            match(*self.COLUMNS[field], against=" ".join(f"+{term}*" for term in field_terms)).in_boolean_mode()
+            for field, field_terms in terms.items()
+        ]
+        score = matches[0]
+        for extra in matches[1:]:
+            score = score + extra
+        return (
+            select(Book.id.label("id"), score.label("score"))
+            .where(and_(*(m > 0 for m in matches)))
+        )
+
+# the FTS5 table created by the books table DDL in models.py
+BOOKS_FTS = table("books_fts", column("rowid"), column("title"), column("author"))
+
+class SQLiteBookSearch(BookSearch):
+    """Book search backed by the books_fts FTS5 table"""
+
+    COLUMN_FILTERS = {
+        "any": "{title author}",
+        "title": "title",
+        "author": "author",
+    }
+
+    def _ranked_ids(self, terms: Dict[str, List[str]]):
+        # every term is required and matches as a prefix, quoting keeps terms literal
+        expression = " AND ".join(
+            f'{self.COLUMN_FILTERS[field]} : "{term}"*'
+            for field, field_terms in terms.items()
+            for term in field_terms
+        )
+        fts = literal_column("books_fts")
+        return (
+            select(
+                BOOKS_FTS.c.rowid.label("id"),
+                (-func.bm25(fts)).label("score")  # bm25 is lower for better matches
+            )
+            .where(fts.op("MATCH")(bindparam("fts_query", expression)))
+        )
+
+class LikeBookSearch(BookSearch):
+    """Fallback for dialects without a full-text index, matches substrings without ranking"""
+
+    COLUMNS = MySQLBookSearch.COLUMNS
+
+    def _ranked_ids(self, terms: Dict[str, List[str]]):
+        conditions = [
+            or_(*(book_column.ilike(f"%{term}%") for book_column in self.COLUMNS[field]))
+            for field, field_terms in terms.items()
+            for term in field_terms
+        ]
+        return select(Book.id.label("id"), literal(0).label("score")).where(and_(*conditions))
+
+BOOK_SEARCH_BACKENDS = {
+    "mysql": MySQLBookSearch(),
+    "sqlite": SQLiteBookSearch(),
+}
+
+def get_book_search(dialect_name: str) -> BookSearch:
+    """Get the book search for a database dialect"""
+    return BOOK_SEARCH_BACKENDS.get(dialect_name, LikeBookSearch())
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, List, Dict
 from dotenv import load_dotenv
 from fastapi_mail import ConnectionConfig
 import os
@@ -20,10 +20,84 @@ class Settings(BaseSettings):
     # Security Settings
     SECRET_KEY: str
     ALGORITHM: str = "HS256"  # Default to HS256
-    ACCESS_TOKEN_EXPIRE_MINUTES: int = 5  # Default to 30 minutes
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30  # Revoked sessions are rejected before their tokens expire
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30  # Days a session lives without being refreshed
+
+    # Session Revocation Settings
+    SESSION_BLOOM_CAPACITY: int = 100000  # Revoked sessions the in-process bloom filter is sized for
+    SESSION_BLOOM_ERROR_RATE: float = 0.001  # Share of requests that ask Redis about a session that was not revoked
+    SESSION_REVOCATION_SYNC_INTERVAL: float = 5  # Seconds before revocations made by other processes take effect
+
+    # Authentication Cache Settings
+    TOKEN_CACHE_TTL: float = 60  # Seconds verified token claims are reused without checking the signature
+    TOKEN_CACHE_SIZE: int = 10000  # Tokens kept in the in-process LRU
+    PRINCIPAL_CACHE_TTL: int = 60  # Seconds a user principal stays in Redis
+    PRINCIPAL_CACHE_LOCAL_TTL: float = 5  # Seconds a user principal stays in the in-process LRU
+    PRINCIPAL_CACHE_SIZE: int = 10000  # Users kept in the in-process LRU
+
+    # Password Hashing Settings
+    BCRYPT_ROUNDS: int = 12  # bcrypt cost, every step doubles the time per hash, lower it in development and tests
+    PASSWORD_HASH_WORKERS: int = 2  # Threads hashing and verifying passwords, per worker process
+    PASSWORD_HASH_QUEUE_SIZE: int = 32  # Calls waiting for a thread before logins and sign ups get a 503
+    PASSWORD_HASH_RETRY_AFTER: int = 1  # Seconds shed clients are asked to wait
     
     # Database Settings (if you have any)
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: Optional[str] = None  # Derived from DATABASE_URL when unset
+
+    # Connection Pool Settings (per engine, per worker process)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30  # Seconds to wait for a connection before failing
+    DB_POOL_RECYCLE: int = 1800  # Recycle connections after 30 minutes
+    DB_POOL_PRE_PING: bool = False
+
+    # Read Replica Settings
+    READ_REPLICA_URLS: List[str] = []  # JSON list of replica DATABASE_URLs
+    READ_REPLICA_STRATEGY: str = "round_robin"  # round_robin or least_connections
+
+    # Bulk Insert Settings
+    BULK_MAX_BOOKS: int = 5000  # Most books accepted by one POST /books/bulk
+    BULK_CHUNK_SIZE: int = 500  # Rows per INSERT statement and transaction
+    IMPORT_MAX_UPLOAD_SIZE: int = 100 * 1024 * 1024  # 100MB CSV uploads for POST /library/import
+
+    # Redis Settings
+    REDIS_URL: Optional[str] = None  # e.g. redis://localhost:6379/0, caches stay in-process when unset
+
+    # Rate Limit Settings
+    RATE_LIMIT_STORAGE_URI: Optional[str] = None  # e.g. redis://localhost:6379/1, defaults to REDIS_URL, in-process when neither is set
+    RATE_LIMIT_STRATEGY: str = "moving-window"  # Sliding window, checked and counted atomically by a Lua script on Redis
+    RATE_LIMIT_PRECHECK_SIZE: int = 10000  # Keys with an in-process token bucket in front of the shared storage
+
+    # Review Stats Cache Settings
+    STATS_CACHE_TTL: int = 300  # Seconds an entry stays in Redis
+    STATS_CACHE_LOCAL_TTL: float = 5  # Seconds an entry stays in the in-process LRU
+    STATS_CACHE_SIZE: int = 1024  # Books kept in the in-process LRU
+
+    # Event Bus Settings
+    EVENT_DISPATCH: str = "inline"  # "inline" runs handlers inside publish, "queued" in background workers, opt in through the environment
+    EVENT_QUEUE_SIZE: int = 1000  # Pending events per event type before publishers wait
+    EVENT_WORKERS_PER_TYPE: int = 4
+    EVENT_ENQUEUE_TIMEOUT: float = 1  # Seconds a publisher waits on a full queue before handling the event inline
+    EVENT_DRAIN_TIMEOUT: float = 30  # Seconds shutdown waits for queued events
+    EVENT_CONCURRENT_HANDLERS: bool = False  # Run the handlers of one event concurrently
+    EVENT_MAX_CONCURRENT_HANDLERS: int = 10
+    EVENT_HANDLER_TIMEOUT: Optional[float] = None  # Seconds before a handler is cancelled, no limit when unset
+    EVENT_TRANSPORT: str = "memory"  # "memory" runs handlers in the API process, "redis" in book_api.worker via Redis Streams
+    EVENT_STREAM_PREFIX: str = "events"
+    EVENT_STREAM_GROUP: str = "book_api"
+    EVENT_STREAM_MAXLEN: int = 100000  # Approximate entries kept per event stream
+    EVENT_STREAM_CONSUMERS: int = 4  # Consumer tasks per worker process
+    EVENT_STREAM_MAX_ATTEMPTS: int = 5  # Attempts before an event goes to the dead-letter stream
+    EVENT_STREAM_RETRY_DELAY: float = 1  # Seconds before the first retry, doubled on every attempt
+    EVENT_STREAM_CLAIM_IDLE: float = 60  # Seconds before events left pending by a dead consumer are claimed
+    OUTBOX_RELAY_IN_PROCESS: bool = True  # Relay outbox events from the API process, disable when running book_api.worker
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 1  # Seconds the relay sleeps when the outbox is empty
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    OUTBOX_RETENTION_DAYS: int = 7  # Days dispatched outbox rows are kept
+    OUTBOX_CLAIM_LEASE: float = 300  # Seconds claimed rows are left to their relay before another may claim them
+    OUTBOX_DELIVERY_CONCURRENCY: int = 10  # Claimed events delivered at once, their emails share delivery batches
 
     # Email Settings
     MAIL_FROM: str
@@ -37,6 +111,25 @@ class Settings(BaseSettings):
     VALIDATE_CERTS: bool
     FRONTEND_URL: Optional[str] = None 
 
+    # Email Delivery Settings
+    EMAIL_DELIVERY_IN_PROCESS: bool = True  # Queue emails for the pooled delivery workers instead of one SMTP session per email
+    EMAIL_POOL_SIZE: int = 4  # Persistent SMTP connections, one delivery worker each
+    EMAIL_POOL_MAX_IDLE: float = 30  # Seconds an idle SMTP connection is kept
+    EMAIL_BATCH_SIZE: int = 20  # Emails sent per connection checkout
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_DELAY: float = 2  # Upper bound of the first retry delay in seconds, doubled on every attempt
+    EMAIL_QUEUE_SIZE: int = 10000
+    EMAIL_RATE_LIMITS: Dict[str, float] = {"default": 10}  # Emails per second by recipient domain, "default" for the rest
+    EMAIL_DRAIN_TIMEOUT: float = 30  # Seconds shutdown waits for queued emails
+    EMAIL_RENDER_CACHE_SIZE: int = 256  # Rendered emails kept for the ones that are the same for every recipient
+
+    # Notification Digest Settings
+    DIGEST_IN_PROCESS: bool = True  # Flush due digests from the API process, disable when running book_api.worker
+    DIGEST_FLUSH_INTERVAL: float = 60  # Seconds between checks for due digests
+    DIGEST_BATCH_SIZE: int = 100  # Recipients flushed per check and frequency
+    DIGEST_CONCURRENCY: int = 10  # Recipients whose digests are sent at once
+    DIGEST_MAX_LISTED: int = 10  # Followers and reviews per book named in a digest, the rest are counted
+
 
     class Config:
         env_file = ".env"
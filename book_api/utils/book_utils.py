@@ -1,95 +1,246 @@
 # book_utils.py
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, insert, update, cast, or_, Float
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from book_api.models import Book, Review, Shelf
 from book_api import models
+from book_api.core.cache import register_cache
+from book_api.core.redis_client import redis_client
+from book_api.settings import config
+from typing import Dict, List, Optional
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
-async def update_book_rating(db: Session, book_id: int) -> float:
+# review statistics by book_id, invalidated by the update_book_rating event
+review_stats_cache = register_cache(
+    "review_stats",
+    redis_client,
+    maxsize=config.STATS_CACHE_SIZE,
+    ttl=config.STATS_CACHE_TTL,
+    local_ttl=config.STATS_CACHE_LOCAL_TTL
+)
+
+# per-star review counts on books, indexed by rating
+RATING_STARS = range(1, 6)
+
+def rating_histogram_column(star: int):
+    """Get the books column counting reviews with the given rating"""
+    return Book.__table__.c[f"rating_{star}_count"]
+
+def _average(rating_sum, rating_count):
+    # the float cast keeps SQLite from doing integer division
+    return func.coalesce(func.round(cast(rating_sum, Float) / func.nullif(rating_count, 0), 2), 0.0)
+
+def rating_aggregate_values() -> Dict:
     """
-    Update the average rating for a book based on its reviews.
-    
+    Build SET values that recompute every rating aggregate of a book from its reviews.
+
+    Returns:
+        Dict: books columns mapped to correlated subqueries over reviews
+    """
+    def reviews_of_book(*conditions):
+        return select(func.count(Review.id)).where(Review.book_id == Book.id, *conditions).scalar_subquery()
+
+    rating_sum = select(func.coalesce(func.sum(Review.rating), 0))\
+        .where(Review.book_id == Book.id)\
+        .scalar_subquery()
+    rating_count = reviews_of_book()
+
+    values = {
+        Book.__table__.c.average_rating: _average(rating_sum, rating_count),
+        Book.__table__.c.rating_sum: rating_sum,
+        Book.__table__.c.rating_count: rating_count,
+    }
+    for star in RATING_STARS:
+        values[rating_histogram_column(star)] = reviews_of_book(Review.rating == star)
+    return values
+
+async def apply_rating_change(db: AsyncSession, book_id: int, old_rating: Optional[int], new_rating: Optional[int]):
+    """
+    Adjust a book's rating aggregates for one review change, in O(1).
+
+    Runs a single relative UPDATE, so concurrent review changes cannot lose
+    each other's counts. Call it in the same transaction as the review change
+    so both commit or roll back together.
+
     Args:
-        db (Session): Database session
-        book_id (int): ID of the book to update
-        
+        db (AsyncSession): Database session holding the review change
+        book_id (int): ID of the reviewed book
+        old_rating (Optional[int]): Rating before the change, None for a new review
+        new_rating (Optional[int]): Rating after the change, None for a deleted review
+    """
+    if old_rating == new_rating:
+        return
+
+    books = Book.__table__
+    sum_delta = (new_rating or 0) - (old_rating or 0)
+    count_delta = (new_rating is not None) - (old_rating is not None)
+
+    # MySQL evaluates SET assignments left to right, so the average goes first
+    # and is computed from the old values plus the deltas on every dialect
+    values = [
+        (books.c.average_rating, _average(books.c.rating_sum + sum_delta, books.c.rating_count + count_delta)),
+        (books.c.rating_sum, books.c.rating_sum + sum_delta),
+        (books.c.rating_count, books.c.rating_count + count_delta),
+    ]
+    if old_rating is not None:
+        values.append((rating_histogram_column(old_rating), rating_histogram_column(old_rating) - 1))
+    if new_rating is not None:
+        values.append((rating_histogram_column(new_rating), rating_histogram_column(new_rating) + 1))
+
+    logger.debug(f"Applying rating change {old_rating} -> {new_rating} to book_id: {book_id}")
+    await db.execute(update(books).where(books.c.id == book_id).ordered_values(*values))
+
+async def reconcile_book_ratings(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Repair rating aggregates that drifted from the reviews table.
+
+    Walks the books table in primary key batches, committing each batch, and
+    only rewrites books whose stored aggregates differ from their reviews.
+
+    Args:
+        db (AsyncSession): Database session
+        batch_size (int): Books checked per UPDATE
+
     Returns:
-        float: The new average rating
-        
+        int: Number of books that were repaired
+    """
+    values = rating_aggregate_values()
+    drifted = or_(*(column.is_distinct_from(expected) for column, expected in values.items()))
+
+    repaired = 0
+    last_id = 0
+    while True:
+        ids = (await db.scalars(
+            select(Book.id).where(Book.id > last_id).order_by(Book.id).limit(batch_size)
+        )).all()
+        if not ids:
+            break
+
+        result = await db.execute(
+            update(Book.__table__)
+            .where(Book.__table__.c.id.in_(ids), drifted)
+            .values(values)
+        )
+        await db.commit()
+        repaired += result.rowcount
+        last_id = ids[-1]
+
+    if repaired:
+        logger.warning(f"Repaired rating aggregates for {repaired} books")
+    return repaired
+
+async def insert_books(db: AsyncSession, rows: List[dict]) -> List[int]:
+    """
+    Insert books with one set-based statement and return their IDs.
+
+    Dialects with executemany RETURNING get multi-row INSERT ... RETURNING
+    statements. The others, MySQL among them, get a single multi-row
+    INSERT ... VALUES whose rows are marked with a token unique to the
+    statement, and the ids are read back by that token. Their ids need not
+    be consecutive: concurrent inserts can interleave auto-increment values
+    with innodb_autoinc_lock_mode=2, and auto_increment_increment can be
+    larger than 1. One statement's ids still grow in row order.
+
+    The caller controls the transaction and the chunk size, every row must
+    already be validated and have the same keys.
+
+    Args:
+        db (AsyncSession): Database session
+        rows (List[dict]): Column values for each book, including user_id
+
+    Returns:
+        List[int]: IDs of the new books, in the order of rows
+
     Raises:
-        Exception: If database operation fails
+        SQLAlchemyError: If the ids read back do not match the inserted rows
     """
-    try:
-        logger.info(f"Updating average rating for book_id: {book_id}")
-        avg_rating = db.query(func.avg(Review.rating))\
-            .filter(Review.book_id == book_id)\
-            .scalar()
-        
-        avg_rating = float(avg_rating) if avg_rating is not None else 0.0
-        avg_rating = round(avg_rating, 2)
-        
-        logger.debug(f"Calculated average rating: {avg_rating}")
-        
-        book = db.query(Book).filter(Book.id == book_id).first()
-        if book:
-            book.average_rating = avg_rating
-            db.commit()
-            db.refresh(book)
-            logger.info(f"Successfully updated rating for book_id {book_id} to {avg_rating}")
-            
-        return avg_rating
-            
-    except Exception as e:
-        logger.error(f"Failed to update rating for book_id {book_id}: {str(e)}")
-        db.rollback()
-        raise
+    if not rows:
+        return []
 
-def get_review_statistics(db: Session, book_id: int) -> dict:
+    dialect = db.get_bind().dialect
+    if dialect.insert_executemany_returning:
+        # SQLAlchemy batches the executemany into multi-row INSERT ... RETURNING
+        # statements, sorting by parameter order keeps the ids lined up with rows
+        result = await db.execute(
+            insert(Book.__table__).returning(Book.__table__.c.id, sort_by_parameter_order=True),
+            rows
+        )
+        return list(result.scalars())
+
+    batch = uuid.uuid4().hex
+    result = await db.execute(insert(Book.__table__).values([{**row, "insert_batch": batch} for row in rows]))
+    query = select(Book.id).where(Book.insert_batch == batch).order_by(Book.id)
+    if dialect.name == "mysql":
+        # LAST_INSERT_ID() is the statement's first id, the primary key range keeps the read back off a table scan
+        query = query.where(Book.id >= result.lastrowid)
+    ids = list(await db.scalars(query))
+    if len(ids) != len(rows):
+        raise SQLAlchemyError(f"Inserted {len(rows)} books but read back {len(ids)} ids")
+    return ids
+
+async def get_review_statistics(db: AsyncSession, book_id: int) -> Optional[dict]:
     """
-    Get detailed review statistics for a book.
+    Get detailed review statistics for a book from its precomputed aggregates.
     
     Args:
-        db (Session): Database session
+        db (AsyncSession): Async database session
         book_id (int): ID of the book to get statistics for
         
     Returns:
-        dict: Dictionary containing:
+        Optional[dict]: None if the book does not exist, otherwise a dictionary containing:
             - total_reviews: Total number of reviews
+            - average_rating: Average rating
             - rating_distribution: Distribution of ratings from 1-5
     """
     logger.info(f"Fetching review statistics for book_id: {book_id}")
     
-    total_reviews = db.query(models.Review)\
-        .filter(models.Review.book_id == book_id)\
-        .count()
-    
-    rating_distribution = db.query(
-        models.Review.rating,
-        func.count(models.Review.rating).label('count')
-    ).filter(
-        models.Review.book_id == book_id
-    ).group_by(
-        models.Review.rating
-    ).all()
-    
-    distribution = {i: 0 for i in range(1, 6)}
-    for rating, count in rating_distribution:
-        distribution[rating] = count
+    stats = (await db.execute(
+        select(
+            Book.rating_count,
+            Book.average_rating,
+            *(rating_histogram_column(star) for star in RATING_STARS)
+        ).where(Book.id == book_id)
+    )).first()
+    if stats is None:
+        return None
+
+    total_reviews, average_rating, *counts = stats
+    distribution = dict(zip(RATING_STARS, counts))
     
     logger.debug(f"Found {total_reviews} reviews with distribution: {distribution}")
     return {
         "total_reviews": total_reviews,
+        "average_rating": average_rating,
         "rating_distribution": distribution
     }
 
-async def create_default_shelves(db: Session, user_id: int) -> dict:
+async def get_cached_review_statistics(db: AsyncSession, book_id: int) -> Optional[dict]:
+    """
+    Get review statistics for a book through review_stats_cache.
+
+    Args:
+        db (AsyncSession): Async database session, only used on a cache miss
+        book_id (int): ID of the book to get statistics for
+
+    Returns:
+        Optional[dict]: Same as get_review_statistics, None if the book does not exist
+    """
+    stats = await review_stats_cache.get(book_id)
+    if stats is None:
+        stats = await get_review_statistics(db, book_id)
+        if stats is not None:
+            await review_stats_cache.set(book_id, stats)
+    return stats
+
+async def create_default_shelves(db: AsyncSession, user_id: int) -> dict:
     """
     Create default bookshelves for a new user.
     
     Args:
-        db (Session): Database session
+        db (AsyncSession): Async database session
         user_id (int): ID of the user to create shelves for
         
     Returns:
@@ -100,6 +251,14 @@ async def create_default_shelves(db: Session, user_id: int) -> dict:
     """
     logger.info(f"Creating default shelves for user_id: {user_id}")
     try:
+        # user_created can be delivered more than once by the outbox relay
+        existing = await db.scalar(
+            select(Shelf.id).where(Shelf.user_id == user_id, Shelf.is_default == True).limit(1)
+        )
+        if existing:
+            logger.info(f"Default shelves already exist for user {user_id}")
+            return {"message": "Default shelves already exist."}
+
         shelves = [
             Shelf(
                 name="Read",
@@ -126,13 +285,12 @@ async def create_default_shelves(db: Session, user_id: int) -> dict:
 
         # Add all shelves in a single operation
         db.add_all(shelves)
-        db.flush()  # Ensure IDs are generated
-        db.commit()
+        await db.commit()
         
         logger.info(f"Successfully created default shelves for user {user_id}")
         return {"message": "Default shelves created successfully."}
         
     except Exception as e:
         logger.error(f"Error creating default shelves for user {user_id}: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise
\ No newline at end of file
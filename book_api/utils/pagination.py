@@ -0,0 +1,92 @@
+# pagination.py
+from datetime import datetime
+from typing import Any, Tuple
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+import base64
+import binascii
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _dump_value(value: Any) -> Any:
+    """Make a sort key value JSON serializable"""
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+def _load_value(value: Any) -> Any:
+    """Restore a sort key value dumped by _dump_value"""
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+def encode_cursor(order_by: str, value: Any, row_id: int) -> str:
+    """
+    Encode the sort key of the last row on a page into an opaque cursor.
+
+    Args:
+        order_by (str): Ordering the cursor belongs to
+        value (Any): Value of the order column for the last row
+        row_id (int): ID of the last row, used as the tie breaker
+
+    Returns:
+        str: URL-safe cursor string
+    """
+    payload = json.dumps({"o": order_by, "v": _dump_value(value), "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, order_by: str) -> Tuple[Any, int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): Cursor from a previous page
+        order_by (str): Ordering of the current request
+
+    Returns:
+        Tuple[Any, int]: Order column value and ID of the last row of the previous page
+
+    Raises:
+        HTTPException: If the cursor is malformed or was issued for another ordering
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, row_id = _load_value(payload["v"]), int(payload["id"])
+        cursor_order = payload["o"]
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        logger.debug(f"Rejected malformed cursor {cursor!r}: {str(e)}")
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if cursor_order != order_by:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested ordering")
+    return value, row_id
+
+def seek_after_desc(column, id_column, value: Any, row_id: int):
+    """
+    Build the keyset condition for rows after (value, row_id) in
+    (column DESC, id DESC) order.
+
+    NULLs sort last in descending order on MySQL and SQLite, so rows with a NULL
+    order column come after every non-NULL row.
+
+    Args:
+        column: Order column
+        id_column: Primary key column used as the tie breaker
+        value (Any): Order column value of the last row seen
+        row_id (int): ID of the last row seen
+
+    Returns:
+        Filter expression for the next page
+    """
+    if column is id_column:
+        return id_column < row_id
+    if value is None:
+        return and_(column.is_(None), id_column < row_id)
+    return or_(
+        column < value,
+        and_(column == value, id_column < row_id),
+        column.is_(None)
+    )
@@ -0,0 +1,62 @@
+"""Background worker that runs event handlers outside the API process.
+
+Run it with `python -m book_api.worker`. It relays outbox events and sends
+notification digests, set OUTBOX_RELAY_IN_PROCESS=false and
+DIGEST_IN_PROCESS=false on the API, and with EVENT_TRANSPORT=redis it
+also consumes the event streams. Emails the handlers send go out through
+the pooled delivery workers. Any number of workers can run at once,
+they share the outbox batches and the stream consumer group.
+"""
+from book_api.core.event_bus import event_bus, RedisStreamsTransport
+from book_api.core.outbox import outbox_relay
+from book_api.core.stream_consumer import RedisStreamConsumer
+from book_api.services.notifications.delivery import email_delivery
+from book_api.services.notifications.digest import digest_flusher
+from book_api.settings import config
+import asyncio
+import logging
+import os
+import signal
+import socket
+
+logger = logging.getLogger(__name__)
+
+def create_stream_consumers() -> list:
+    """Create EVENT_STREAM_CONSUMERS stream consumers, none unless the Redis transport is configured"""
+    if not isinstance(event_bus.transport, RedisStreamsTransport):
+        return []
+    return [
+        RedisStreamConsumer(
+            event_bus,
+            event_bus.transport,
+            consumer_name=f"{socket.gethostname()}-{os.getpid()}-{i}",
+            max_attempts=config.EVENT_STREAM_MAX_ATTEMPTS,
+            retry_delay=config.EVENT_STREAM_RETRY_DELAY,
+            claim_idle=config.EVENT_STREAM_CLAIM_IDLE
+        )
+        for i in range(config.EVENT_STREAM_CONSUMERS)
+    ]
+
+async def run_worker():
+    """Relay outbox events, flush digests and consume event streams until SIGINT or SIGTERM"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    consumers = create_stream_consumers()
+    logger.info(f"Worker starting with {len(consumers)} stream consumer(s)")
+    email_delivery.start()
+    await asyncio.gather(
+        outbox_relay.run(stop),
+        digest_flusher.run(stop),
+        *(consumer.run(stop) for consumer in consumers)
+    )
+    await email_delivery.stop(config.EMAIL_DRAIN_TIMEOUT)
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker())
+
+if __name__ == "__main__":
+    main()
@@ -4,35 +4,60 @@ from typing import Generator
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from datetime import datetime
 from book_api.main import app
-from book_api.database import Base, get_db
+from book_api.database import Base, get_db, get_async_session_factory
+import tempfile
 import io 
 from PIL import Image
 from fastapi import UploadFile
 import boto3
 from moto import mock_aws
 from book_api.settings import config
+from book_api.core.cache import caches
+from book_api.core.event_bus import event_bus
+from book_api.core.sessions import session_store
 from book_api.services.storage.file_service import FileService
 import os
 import random
 import numpy as np
 
 # Test database configuration
-SQLALCHEMY_DATABASE_URL = "sqlite://"
+# The sync and async engines share one file database so the async routers
+# and the sync fixtures see the same rows
+TEST_DB_PATH = os.path.join(tempfile.mkdtemp(), "test.db")
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{TEST_DB_PATH}"
+ASYNC_SQLALCHEMY_DATABASE_URL = f"sqlite+aiosqlite:///{TEST_DB_PATH}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
+    connect_args={"check_same_thread": False, "timeout": 30},
+    poolclass=NullPool,
+)
+
+# NullPool keeps aiosqlite connections from outliving the event loop that opened them
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    connect_args={"timeout": 30},
+    poolclass=NullPool,
 )
 
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 # Create tables in test database
 Base.metadata.create_all(bind=engine)
 
+# Run event handlers inside publish so tests can assert on their side effects
+event_bus.dispatch = "inline"
+
+# Tests relay outbox rows themselves instead of a background task
+config.OUTBOX_RELAY_IN_PROCESS = False
+config.EMAIL_DELIVERY_IN_PROCESS = False
+config.DIGEST_IN_PROCESS = False
+
 # -------- Basic Fixtures --------
 
 @pytest.fixture(scope="session")
@@ -44,18 +69,22 @@ def event_loop():
 
 @pytest.fixture(autouse=True)
 def db() -> Generator:
-    """Get a TestingSessionLocal instance with transaction rollback"""
-    connection = engine.connect()
-    transaction = connection.begin()
-    session = TestingSessionLocal(bind=connection)
+    """Get a TestingSessionLocal instance and clear every table afterwards"""
+    session = TestingSessionLocal()
     
     session.execute(text("PRAGMA foreign_keys=ON;"))
     
     yield session
     
     session.close()
-    transaction.rollback()
-    connection.close()
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+    # row ids are reused once the tables are empty, so cached rows must go too
+    for cache in caches.values():
+        cache.reset()
+    session_store.reset()
 
 
 @pytest.fixture
@@ -70,7 +99,10 @@ def mock_request_headers() -> dict:
 @pytest.fixture
 def client(db: TestingSessionLocal, mock_request_headers: dict) -> TestClient:
     """Get test client with database session and mocked headers"""
+    # get_async_db hands out lazy sessions of the test session maker
+    app.dependency_overrides.clear()
     app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_async_session_factory] = lambda: AsyncTestingSessionLocal
     with TestClient(app, headers=mock_request_headers) as c:
         yield c
 
@@ -633,4 +665,134 @@ def mock_s3(monkeypatch):
         def delete_object(self, Bucket, Key):
             return {"ResponseMetadata": {"HTTPStatusCode": 200}}
 
-    monkeypatch.setattr("boto3.client", lambda service, **kwargs: MockS3Client())
\ No newline at end of file
+    monkeypatch.setattr("boto3.client", lambda service, **kwargs: MockS3Client())
+
+
+@pytest.fixture
+def smtp_server():
+    """Local SMTP server recording the messages it accepts"""
+    from aiosmtpd.controller import Controller
+    import socket
+
+    class RecordingHandler:
+        def __init__(self):
+            self.messages = []
+            self.replies = []  # replies to give instead of accepting, one per message
+
+        async def handle_DATA(self, server, session, envelope):
+            if self.replies:
+                return self.replies.pop(0)
+            self.messages.append(envelope)
+            return "250 Message accepted for delivery"
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    handler.settings = config.email_config.model_copy(update={
+        "MAIL_SERVER": "127.0.0.1",
+        "MAIL_PORT": port,
+        "MAIL_STARTTLS": False,
+        "MAIL_SSL_TLS": False,
+        "USE_CREDENTIALS": False,
+        "VALIDATE_CERTS": False,
+    })
+    yield handler
+    controller.stop()
+
+@pytest.fixture
+def make_delivery_worker(smtp_server):
+    """Build EmailDeliveryWorkers with one worker over a one connection pool to smtp_server"""
+    from book_api.services.notifications.delivery import EmailDeliveryWorker, SMTPConnectionPool
+
+    def make(**options) -> "EmailDeliveryWorker":
+        pool = SMTPConnectionPool(smtp_server.settings, size=1)
+        return EmailDeliveryWorker(pool, sender="books@example.com", workers=1, **options)
+    return make
+
+@pytest.fixture
+def scratch_session_factory(tmp_path) -> async_sessionmaker:
+    """Async session factory of an empty database of its own, for code that takes a session factory"""
+    path = tmp_path / "scratch.db"
+    Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}", poolclass=NullPool))
+    return async_sessionmaker(
+        bind=create_async_engine(f"sqlite+aiosqlite:///{path}", poolclass=NullPool),
+        expire_on_commit=False
+    )
+
+@pytest.fixture
+def add_scratch_user(scratch_session_factory: async_sessionmaker):
+    """Add users with a notification frequency to the scratch database, returning their ids"""
+    from book_api.models import User
+
+    async def add(username: str, frequency: str) -> int:
+        async with scratch_session_factory() as session:
+            user = User(
+                username=username,
+                email=f"{username}@example.com",
+                hashed_password="x",
+                notification_frequency=frequency
+            )
+            session.add(user)
+            await session.commit()
+            return user.id
+    return add
+
+@pytest.fixture
+def make_stream_bus():
+    """Build an EventBus on a fake Redis Streams transport, with one consumer for the "greet" handlers"""
+    from fakeredis import FakeAsyncRedis
+    from book_api.core.event_bus import EventBus, RedisStreamsTransport
+    from book_api.core.stream_consumer import RedisStreamConsumer
+
+    def make(handlers, **consumer_options):
+        transport = RedisStreamsTransport(FakeAsyncRedis(decode_responses=True), prefix="test-events")
+        bus = EventBus(transport=transport)
+        for handler in handlers:
+            bus.subscribe("greet", handler)
+        consumer = RedisStreamConsumer(bus, transport, "consumer-1", block=0.01, **consumer_options)
+        return bus, transport, consumer
+    return make
+
+@pytest.fixture
+def login_tokens(client: TestClient, user_data: dict, mock_request_headers: dict) -> dict:
+    """Sign up the test user and log in, returning the access and refresh tokens"""
+    client.post("/users/", json=user_data, headers=mock_request_headers)
+    response = client.post(
+        "/users/login",
+        data={"username": user_data["username"], "password": user_data["password"]},
+        headers=mock_request_headers
+    )
+    assert response.status_code == 200
+    return response.json()
+
+@pytest.fixture
+def opened_sessions(client: TestClient, mocker):
+    """Mock called once for every async session a request opens"""
+    from book_api.database import get_async_db
+
+    opened = mocker.Mock()
+
+    async def get_counted_async_db():
+        opened()
+        async with AsyncTestingSessionLocal() as async_db:
+            yield async_db
+
+    app.dependency_overrides[get_async_db] = get_counted_async_db
+    return opened
+
+@pytest.fixture
+def make_request():
+    """Build bare starlette Requests with the given headers from client 10.0.0.1"""
+    from starlette.requests import Request
+
+    def make(headers: dict) -> Request:
+        return Request({
+            "type": "http",
+            "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            "client": ("10.0.0.1", 1234),
+        })
+    return make
@@ -1,10 +1,12 @@
 import pytest
 from fastapi.testclient import TestClient
-from book_api.utils.book_utils import update_book_rating
 from typing import List
 from book_api import models
+from sqlalchemy import create_engine, select
 from sqlalchemy.orm import Session
 from fastapi import UploadFile
+from book_api.settings import config
+import json
 
 # -------- Test Classes --------
 
@@ -63,6 +65,345 @@ class TestAuth:
         assert response.status_code == 401
         assert "Device mismatch" in response.json()["detail"]
 
+    def test_principal_is_cached(self, client: TestClient, auth_headers: dict):
+        from book_api.auth import principal_cache
+
+        assert client.get("/books/", headers=auth_headers).status_code == 200
+        assert client.get("/books/", headers=auth_headers).status_code == 200
+        assert (principal_cache.misses, principal_cache.local_hits) == (1, 1)
+
+    def test_role_change_invalidates_principal(self, client: TestClient, db: Session, auth_headers: dict, admin_headers: dict, admin_data: dict):
+        db.query(models.User).filter(models.User.username == admin_data["username"]).update({"role": "admin"})
+        db.commit()
+        assert client.get("/admin/events", headers=auth_headers).status_code == 403
+
+        user_id = client.get("/users/me", headers=auth_headers).json()["id"]
+        response = client.put(f"/admin/users/{user_id}/role", json={"role": "admin"}, headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["role"] == "admin"
+
+        assert client.get("/admin/events", headers=auth_headers).status_code == 200
+
+    def test_profile_update_invalidates_principal(self, client: TestClient, auth_headers: dict):
+        from book_api.auth import principal_cache
+
+        client.get("/books/", headers=auth_headers)
+        response = client.put("/users/me", json={"email": "new@example.com"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert principal_cache.invalidations == 1
+
+        client.get("/books/", headers=auth_headers)
+        assert principal_cache.misses == 2
+
+    @pytest.mark.asyncio
+    async def test_orm_writes_invalidate_principal(self):
+        from sqlalchemy import select
+        from tests.conftest import AsyncTestingSessionLocal
+        from book_api.auth import principal_cache
+
+        async with AsyncTestingSessionLocal() as session:
+            user = models.User(username="reader", email="reader@example.com", hashed_password="x")
+            session.add(user)
+            await session.commit()
+            await principal_cache.set("reader", {"id": user.id, "username": "reader", "email": user.email, "role": "user"})
+
+            # fields the principal does not hold leave it cached
+            user.notification_frequency = "daily"
+            await session.commit()
+            assert await principal_cache.get("reader") is not None
+
+            user.username = "renamed"
+            await session.commit()
+            assert await principal_cache.get("reader") is None
+            assert principal_cache.invalidations == 2
+
+            # let the fill past the rename's tombstones
+            principal_cache.invalidated.clear()
+            await principal_cache.set("renamed", {"id": user.id, "username": "renamed", "email": user.email, "role": "user"})
+            await session.delete(user)
+            await session.commit()
+            assert await principal_cache.get("renamed") is None
+            assert principal_cache.invalidations == 3
+
+    def test_logout_drops_cached_token(self, client: TestClient, user_token: str, auth_headers: dict):
+        from book_api.auth import token_claims_cache
+
+        client.get("/books/", headers=auth_headers)
+        assert token_claims_cache.get(user_token) is not None
+
+        response = client.post("/users/logout", headers=auth_headers)
+        assert response.status_code == 200
+        assert token_claims_cache.get(user_token) is None
+
+    def test_expired_claims_are_not_reused(self, user_token: str):
+        import time
+        from jose import JWTError
+        from book_api.auth import decode_token, token_claims_cache
+
+        claims = decode_token(user_token)
+        token_claims_cache.set(user_token, {**claims, "exp": time.time() - 1})
+        assert decode_token(user_token)["exp"] == claims["exp"]
+
+        token_claims_cache.set("not-a-token", {"sub": "testuser", "exp": time.time() - 1})
+        with pytest.raises(JWTError):
+            decode_token("not-a-token")
+
+class TestPasswordHasher:
+    """Test bcrypt on the bounded password hashing pool"""
+
+    @pytest.mark.asyncio
+    async def test_hash_and_verify(self):
+        from book_api.core.password_hasher import PasswordHasher
+
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=1)
+        hashed = await hasher.hash("secret")
+        assert hashed.startswith("$2b$04$")
+        assert await hasher.verify("secret", hashed)
+        assert not await hasher.verify("wrong", hashed)
+
+        snapshot = hasher.snapshot()
+        assert (snapshot["completed"], snapshot["queued"], snapshot["rejected"]) == (3, 0, 0)
+        hasher.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_sheds_load_when_queue_is_full(self):
+        import asyncio
+        from book_api.core.password_hasher import PasswordHasher, PasswordHasherBusy
+
+        hasher = PasswordHasher(rounds=4, workers=1, max_queue=1)
+        running = [asyncio.create_task(hasher.hash("secret")) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert hasher.snapshot()["queued"] == 1
+
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.hash("secret")
+        await asyncio.gather(*running)
+
+        snapshot = hasher.snapshot()
+        assert (snapshot["completed"], snapshot["rejected"], snapshot["peak_queued"]) == (2, 1, 1)
+        hasher.shutdown()
+
+    def test_login_is_shed_with_503(self, client: TestClient, user_data: dict, mock_request_headers: dict, mocker):
+        from book_api.core.password_hasher import password_hasher, PasswordHasherBusy
+
+        client.post("/users/", json=user_data, headers=mock_request_headers)
+        mocker.patch.object(password_hasher, "verify", side_effect=PasswordHasherBusy())
+
+        response = client.post(
+            "/users/login",
+            data={"username": user_data["username"], "password": user_data["password"]},
+            headers=mock_request_headers
+        )
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(config.PASSWORD_HASH_RETRY_AFTER)
+
+class TestSessions:
+    """Test refresh tokens and session revocation"""
+
+    def test_refresh_rotates_tokens(self, client: TestClient, mock_request_headers: dict, login_tokens):
+        assert login_tokens["refresh_token"]
+
+        response = client.post("/users/refresh", json={"refresh_token": login_tokens["refresh_token"]}, headers=mock_request_headers)
+        assert response.status_code == 200
+        refreshed = response.json()
+        assert refreshed["refresh_token"] != login_tokens["refresh_token"]
+
+        headers = {"Authorization": f"Bearer {refreshed['access_token']}", **mock_request_headers}
+        assert client.get("/books/", headers=headers).status_code == 200
+
+    def test_reused_refresh_token_revokes_session(self, client: TestClient, mock_request_headers: dict, login_tokens):
+        refreshed = client.post("/users/refresh", json={"refresh_token": login_tokens["refresh_token"]}, headers=mock_request_headers).json()
+
+        response = client.post("/users/refresh", json={"refresh_token": login_tokens["refresh_token"]}, headers=mock_request_headers)
+        assert response.status_code == 401
+
+        # the thief and the owner share the session, both are logged out
+        headers = {"Authorization": f"Bearer {refreshed['access_token']}", **mock_request_headers}
+        assert client.get("/books/", headers=headers).status_code == 401
+        response = client.post("/users/refresh", json={"refresh_token": refreshed["refresh_token"]}, headers=mock_request_headers)
+        assert response.status_code == 401
+
+    def test_logout_revokes_session(self, client: TestClient, auth_headers: dict):
+        from book_api.core.sessions import session_store
+
+        assert client.get("/books/", headers=auth_headers).status_code == 200
+        assert session_store.snapshot()["bloom_hits"] == 0
+
+        assert client.post("/users/logout", headers=auth_headers).status_code == 200
+        assert client.get("/books/", headers=auth_headers).status_code == 401
+        assert session_store.snapshot()["confirmed"] == 1
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        from book_api.core.sessions import BloomFilter
+
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"revoked-{i}")
+
+        assert all(f"revoked-{i}" in bloom for i in range(1000))
+        false_positives = sum(f"active-{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+    @pytest.mark.asyncio
+    async def test_redis_store_shares_revocations(self):
+        from fakeredis import FakeAsyncRedis
+        from book_api.core.sessions import SessionStore
+
+        redis = FakeAsyncRedis(decode_responses=True)
+        store = SessionStore(redis, capacity=100)
+        other = SessionStore(redis, capacity=100)
+
+        sid, refresh_token = await store.create("reader")
+        rotated = await other.rotate(refresh_token)
+        assert rotated[:2] == (sid, "reader")
+        assert await other.rotate(refresh_token) is None
+
+        # the reuse revoked the session, the first store learns it on the next sync
+        assert await other.is_revoked(sid)
+        assert not await store.is_revoked(sid)
+        assert await store.sync_revocations() == 1
+        assert await store.is_revoked(sid)
+        assert await store.rotate(rotated[2]) is None
+
+    @pytest.mark.asyncio
+    async def test_local_store_drops_expired_sessions(self, mocker):
+        import time
+        from book_api.core.sessions import SessionStore
+
+        store = SessionStore(None, session_ttl=60, capacity=100)
+        for _ in range(3):
+            await store.create("reader")
+        sid, refresh_token = await store.create("writer")
+
+        clock = mocker.patch("book_api.core.sessions.time")
+        clock.time.return_value = time.time() + 30
+        assert await store.rotate(refresh_token) is not None
+        clock.time.return_value += 45
+        await store.sync_revocations()
+
+        # only the session refreshed since is left
+        assert list(store._sessions) == [sid]
+
+class TestRateLimits:
+    """Test per-user rate limit keys and the token bucket precheck"""
+
+    def test_limits_are_keyed_by_user(self, auth_headers: dict, mock_request_headers: dict, make_request):
+        from book_api.core.rate_limiter import get_rate_limit_key
+
+        assert get_rate_limit_key(make_request(auth_headers)) == "user:testuser"
+        assert get_rate_limit_key(make_request(mock_request_headers)) == "ip:10.0.0.1"
+        forged = {**mock_request_headers, "Authorization": "Bearer forged"}
+        assert get_rate_limit_key(make_request(forged)) == "ip:10.0.0.1"
+
+    @pytest.mark.asyncio
+    async def test_bucket_rejects_without_shared_storage(self, mocker):
+        from limits import parse
+        from book_api.core.rate_limiter import PrecheckedRateLimiter
+
+        shared = mocker.Mock()
+        shared.hit = mocker.AsyncMock(return_value=True)
+        limiter = PrecheckedRateLimiter(shared)
+        limit = parse("2/minute")
+
+        assert [await limiter.hit(limit, "user:reader", "/books") for _ in range(3)] == [True, True, False]
+        assert shared.hit.await_count == 2
+        assert limiter.snapshot() == {"buckets": 1, "local_rejections": 1, "shared_checks": 2}
+        # other keys have buckets of their own
+        assert await limiter.hit(limit, "user:writer", "/books")
+
+    @pytest.mark.asyncio
+    async def test_shared_storage_limits_across_processes(self):
+        from limits import parse
+        from limits.aio.storage import MemoryStorage
+        from limits.aio.strategies import MovingWindowRateLimiter
+        from book_api.core.rate_limiter import PrecheckedRateLimiter
+
+        shared = MovingWindowRateLimiter(MemoryStorage())
+        first, second = PrecheckedRateLimiter(shared), PrecheckedRateLimiter(shared)
+        limit = parse("2/minute")
+
+        assert await first.hit(limit, "user:reader", "/books")
+        assert await second.hit(limit, "user:reader", "/books")
+        # neither bucket is empty, the shared window is full
+        assert not await first.hit(limit, "user:reader", "/books")
+        assert first.snapshot()["local_rejections"] == 0
+
+    def test_redis_storage_is_asyncio(self):
+        from limits.aio.storage import RedisStorage
+        from book_api.core.rate_limiter import PrecheckedLimiter, get_rate_limit_key
+
+        limiter = PrecheckedLimiter(get_rate_limit_key, storage_uri="redis://localhost:6379/1", strategy="moving-window")
+
+        assert isinstance(limiter.storage, RedisStorage)
+        assert limiter.snapshot()["storage"] == "redis"
+
+class TestRequestGate:
+    """Test rejections before routing"""
+
+    def test_bad_token_opens_no_session(self, client: TestClient, mock_request_headers: dict, opened_sessions):
+
+        response = client.get("/reviews/", headers={**mock_request_headers, "Authorization": "Bearer forged"})
+        assert response.status_code == 401
+        assert response.json()["detail"] == "Could not validate credentials"
+        opened_sessions.assert_not_called()
+
+    def test_signup_is_the_only_public_route_on_users(self, client: TestClient, user_data: dict, mock_request_headers: dict):
+        stale = {**mock_request_headers, "Authorization": "Bearer stale"}
+
+        # a stale token sent along does not block signing up
+        assert client.post("/users/", json=user_data, headers=stale).status_code == 200
+        # the user listing on the same path is gated
+        response = client.get("/users/", headers=stale)
+        assert response.status_code == 401
+        assert response.json()["detail"] == "Could not validate credentials"
+
+    def test_revoked_session_opens_no_session(self, client: TestClient, auth_headers: dict, opened_sessions):
+        client.post("/users/logout", headers=auth_headers)
+        opened_sessions.reset_mock()
+
+        assert client.get("/reviews/", headers=auth_headers).status_code == 401
+        opened_sessions.assert_not_called()
+
+    def test_over_limit_opens_no_session(self, client: TestClient, auth_headers: dict, opened_sessions):
+        from book_api.core.rate_limiter import limiter
+
+        client.portal.call(limiter.reset)
+
+        # GET /reviews/ allows 30 requests a minute
+        try:
+            statuses = [client.get("/reviews/", headers=auth_headers).status_code for _ in range(31)]
+        finally:
+            client.portal.call(limiter.reset)
+        assert statuses == [200] * 30 + [429]
+        assert opened_sessions.call_count == 30
+
+    def test_limits_count_each_request_once(self, client: TestClient, auth_headers: dict):
+        from limits import parse
+        from book_api.core.rate_limiter import endpoint_scope, limiter
+        from book_api.routers.reviews import get_reviews
+
+        client.portal.call(limiter.reset)
+        checks = limiter.snapshot()["shared_checks"]
+        try:
+            for _ in range(3):
+                assert client.get("/reviews/", headers=auth_headers).status_code == 200
+            stats = client.portal.call(limiter.limiter.get_window_stats, parse("30/minute"), "user:testuser", endpoint_scope(get_reviews))
+        finally:
+            client.portal.call(limiter.reset)
+        # the endpoint is not wrapped, only the gate counted the requests
+        assert limiter.snapshot()["shared_checks"] - checks == 3
+        assert stats.remaining == 27
+
+    def test_public_paths_ignore_stale_tokens(self, client: TestClient, user_data: dict, mock_request_headers: dict):
+        client.post("/users/", json=user_data, headers=mock_request_headers)
+
+        response = client.post(
+            "/users/login",
+            data={"username": user_data["username"], "password": user_data["password"]},
+            headers={**mock_request_headers, "Authorization": "Bearer expired"}
+        )
+        assert response.status_code == 200
+
 class TestFollowers:
     """Test suite for follower operations"""
     
@@ -235,6 +576,149 @@ class TestBooks:
         assert response.status_code == 200
         assert response.json()["message"] == "Book deleted successfully"
 
+    def test_get_books_cursor_pagination(self, client: TestClient, auth_headers: dict, book_data: dict):
+        years = [2001, None, 2003, 2003, 1999]
+        for i, year in enumerate(years):
+            client.post("/books/", json={**book_data, "title": f"Book {i}", "year": year}, headers=auth_headers)
+
+        seen_years = []
+        params = {"order_by": "year", "per_page": 2, "include_total": "false"}
+        while True:
+            response = client.get("/books/", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            data = response.json()
+            assert data["total"] is None
+            seen_years.extend(book["year"] for book in data["items"])
+            if not data["next_cursor"]:
+                break
+            params["cursor"] = data["next_cursor"]
+
+        assert seen_years == [2003, 2003, 2001, 1999, None]
+
+    def test_get_books_invalid_cursor(self, client: TestClient, auth_headers: dict):
+        response = client.get("/books/", params={"cursor": "not-a-cursor"}, headers=auth_headers)
+        assert response.status_code == 400
+
+        # a cursor only works for the ordering it was issued for
+        from book_api.utils.pagination import encode_cursor
+        cursor = encode_cursor("year", 2001, 1)
+        response = client.get("/books/", params={"cursor": cursor, "order_by": "avg_rating"}, headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_search_books(self, client: TestClient, auth_headers: dict, book_data: dict):
+        books = [
+            {"title": "The Hobbit", "author": "J.R.R. Tolkien"},
+            {"title": "The Silmarillion", "author": "J.R.R. Tolkien"},
+            {"title": "Hobbit Hobbit Hobbit", "author": "Someone Else"},
+            {"title": "Dune", "author": "Frank Herbert"},
+        ]
+        for book in books:
+            client.post("/books/", json={**book_data, **book}, headers=auth_headers)
+
+        # terms match as prefixes across title and author
+        response = client.get("/books/", params={"q": "tolk silm"}, headers=auth_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 1
+        assert data["items"][0]["title"] == "The Silmarillion"
+
+        # results are ranked by relevance
+        response = client.get("/books/", params={"title_query": "hobb"}, headers=auth_headers)
+        titles = [book["title"] for book in response.json()["items"]]
+        assert titles == ["Hobbit Hobbit Hobbit", "The Hobbit"]
+
+        response = client.get("/books/", params={"author_query": "herb"}, headers=auth_headers)
+        assert [book["title"] for book in response.json()["items"]] == ["Dune"]
+
+    def test_search_books_follows_updates(self, client: TestClient, auth_headers: dict, book_data: dict):
+        book_id = client.post("/books/", json={**book_data, "title": "Old Name"}, headers=auth_headers).json()["id"]
+        client.put(f"/books/{book_id}", json={"title": "New Name"}, headers=auth_headers)
+
+        response = client.get("/books/", params={"q": "old"}, headers=auth_headers)
+        assert response.json()["items"] == []
+        response = client.get("/books/", params={"q": "new"}, headers=auth_headers)
+        assert [book["id"] for book in response.json()["items"]] == [book_id]
+
+        client.delete(f"/books/{book_id}", headers=auth_headers)
+        response = client.get("/books/", params={"q": "new"}, headers=auth_headers)
+        assert response.json()["items"] == []
+
+    def test_bulk_create_books(self, client: TestClient, auth_headers: dict, book_data: dict, db: Session, monkeypatch):
+        monkeypatch.setattr(config, "BULK_CHUNK_SIZE", 2)
+        books = [{**book_data, "title": f"Bulk Book {i}"} for i in range(5)]
+
+        response = client.post("/books/bulk", json=books, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        ids = [json.loads(line)["id"] for line in response.text.splitlines()]
+        assert len(ids) == 5
+
+        # the ids line up with the payload order
+        titles = dict(db.query(models.Book.id, models.Book.title).filter(models.Book.id.in_(ids)).all())
+        assert [titles[book_id] for book_id in ids] == [book["title"] for book in books]
+
+    def test_bulk_create_books_without_returning(self, client: TestClient, auth_headers: dict, book_data: dict, db: Session, monkeypatch):
+        from sqlalchemy import event
+        from tests.conftest import async_engine
+
+        # MySQL drivers have no executemany RETURNING
+        monkeypatch.setattr(async_engine.sync_engine.dialect, "insert_executemany_returning", False)
+        monkeypatch.setattr(config, "BULK_CHUNK_SIZE", 3)
+        inserts = []
+
+        def count_inserts(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO books "):
+                inserts.append(statement)
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", count_inserts)
+        try:
+            books = [{**book_data, "title": f"Bulk Book {i}"} for i in range(7)]
+            response = client.post("/books/bulk", json=books, headers=auth_headers)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", count_inserts)
+
+        assert response.status_code == 200
+        ids = [json.loads(line)["id"] for line in response.text.splitlines()]
+        # one multi-row INSERT per chunk
+        assert len(inserts) == 3
+        titles = dict(db.query(models.Book.id, models.Book.title).filter(models.Book.id.in_(ids)).all())
+        assert [titles[book_id] for book_id in ids] == [book["title"] for book in books]
+
+    def test_bulk_create_books_with_interleaved_ids(self, client: TestClient, auth_headers: dict, book_data: dict, db: Session, monkeypatch):
+        from sqlalchemy import text
+        from tests.conftest import async_engine, engine
+
+        monkeypatch.setattr(async_engine.sync_engine.dialect, "insert_executemany_returning", False)
+        # a concurrent insert takes an id between the statement's rows
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TRIGGER interleave AFTER INSERT ON books WHEN NEW.title = 'Bulk Book 0' BEGIN "
+                "INSERT INTO books (title, author, genre, page_count, created_at, updated_at, user_id) "
+                "VALUES ('Interleaved', 'Someone', 'Fiction', 1, NEW.created_at, NEW.updated_at, NEW.user_id); END"
+            ))
+        try:
+            books = [{**book_data, "title": f"Bulk Book {i}"} for i in range(3)]
+            response = client.post("/books/bulk", json=books, headers=auth_headers)
+        finally:
+            with engine.begin() as connection:
+                connection.execute(text("DROP TRIGGER interleave"))
+
+        assert response.status_code == 200
+        ids = [json.loads(line)["id"] for line in response.text.splitlines()]
+        titles = dict(db.query(models.Book.id, models.Book.title).all())
+        assert ids[1] - ids[0] == 2
+        assert [titles[book_id] for book_id in ids] == [book["title"] for book in books]
+
+    def test_bulk_create_books_limits(self, client: TestClient, auth_headers: dict, book_data: dict, db: Session, monkeypatch):
+        monkeypatch.setattr(config, "BULK_MAX_BOOKS", 2)
+        response = client.post("/books/bulk", json=[book_data] * 3, headers=auth_headers)
+        assert response.status_code == 413
+
+        # one invalid book rejects the whole payload
+        response = client.post("/books/bulk", json=[book_data, {**book_data, "page_count": 0}], headers=auth_headers)
+        assert response.status_code == 422
+        assert db.query(models.Book).count() == 0
+
 class TestReviews:
     """Test review-related functionality"""
 
@@ -308,9 +792,6 @@ class TestReviews:
         expected_avg = sum(review["rating"] for review in test_reviews) / len(test_reviews)
         expected_avg = round(expected_avg, 2)
 
-        # Give time for async event processing
-        await update_book_rating(db, book_id)
-
         # Verify the book's average rating
         book = db.query(models.Book).filter(models.Book.id == book_id).first()
         assert book.average_rating == expected_avg
@@ -332,6 +813,57 @@ class TestReviews:
         assert stats["total_reviews"] == 1
         assert str(review_data["rating"]) in str(stats["rating_distribution"])
 
+    def test_get_reviews_pagination(self, client: TestClient, auth_headers: dict, book_data: dict, db: Session):
+        user_id = client.get("/users/me", headers=auth_headers).json()["id"]
+        ratings = [3, 5, 1, 5, 4]
+        for i, rating in enumerate(ratings):
+            book_id = client.post("/books/", json={**book_data, "title": f"Book {i}"}, headers=auth_headers).json()["id"]
+            db.add(models.Review(rating=rating, book_id=book_id, user_id=user_id, likes_count=i))
+        db.commit()
+
+        seen = []
+        params = {"user_id": user_id, "order_by": "rating", "per_page": 2}
+        while True:
+            response = client.get("/reviews/", params=params, headers=auth_headers)
+            assert response.status_code == 200
+            data = response.json()
+            assert data["total"] == 5
+            assert len(data["items"]) <= 2
+            seen.extend(review["rating"] for review in data["items"])
+            if not data["next_cursor"]:
+                break
+            params["cursor"] = data["next_cursor"]
+        assert seen == [5, 5, 4, 3, 1]
+
+        response = client.get("/reviews/", params={"order_by": "likes", "per_page": 1}, headers=auth_headers)
+        assert response.json()["items"][0]["likes_count"] == 4
+
+        # a cursor only works for the ordering it was issued for
+        response = client.get("/reviews/", params={"cursor": data["next_cursor"] or params["cursor"], "order_by": "newest"}, headers=auth_headers)
+        assert response.status_code == 400
+
+    def test_review_changes_update_rating_aggregates(self, client: TestClient, auth_headers: dict, admin_headers: dict, book_data: dict, review_data: dict, db: Session):
+        book_id = client.post("/books/", json=book_data, headers=admin_headers).json()["id"]
+        review_id = client.post("/reviews/", json={**review_data, "rating": 4, "book_id": book_id}, headers=auth_headers).json()["id"]
+
+        stats = client.get(f"/reviews/book/{book_id}/stats", headers=auth_headers).json()
+        assert stats["total_reviews"] == 1
+        assert stats["average_rating"] == 4.0
+        assert stats["rating_distribution"]["4"] == 1
+
+        client.put(f"/reviews/{review_id}", json={"rating": 2}, headers=auth_headers)
+        stats = client.get(f"/reviews/book/{book_id}/stats", headers=auth_headers).json()
+        assert stats["average_rating"] == 2.0
+        assert stats["rating_distribution"]["4"] == 0
+        assert stats["rating_distribution"]["2"] == 1
+
+        client.delete(f"/reviews/{review_id}", headers=auth_headers)
+        book = db.query(models.Book).filter(models.Book.id == book_id).first()
+        assert (book.rating_count, book.rating_sum, book.rating_2_count, book.average_rating) == (0, 0, 0, 0.0)
+
+        response = client.get("/reviews/book/999999/stats", headers=auth_headers)
+        assert response.status_code == 404
+
     def test_like_review(self, client: TestClient, auth_headers: dict, admin_headers: dict, book_data: dict, review_data: dict):
         """Test liking a review"""
         # Create book as admin
@@ -1014,4 +1546,1102 @@ class TestFilesRouter:
         )
         
         assert response.status_code == 200
-        assert response.json()["message"] == "Book cover deleted successfully"
\ No newline at end of file
+        assert response.json()["message"] == "Book cover deleted successfully"
+
+
+class TestDatabase:
+    """Test database engine configuration"""
+
+    def test_async_database_url_mysql(self):
+        from book_api.database import get_async_database_url
+        url = get_async_database_url("mysql+mysqlconnector://user:secret@db:3306/books")
+        assert url == "mysql+aiomysql://user:secret@db:3306/books"
+
+    def test_async_database_url_sqlite(self):
+        from book_api.database import get_async_database_url
+        assert get_async_database_url("sqlite:///./books.db") == "sqlite+aiosqlite:///./books.db"
+
+    def test_async_database_url_unsupported(self):
+        from book_api.database import get_async_database_url
+        with pytest.raises(ValueError):
+            get_async_database_url("oracle://user:secret@db/books")
+
+
+class TestLibrary:
+    """Test library export and import"""
+
+    def test_export_library_ndjson(self, client: TestClient, auth_headers: dict, book_data: dict):
+        shelf_id = client.post("/shelves/", json={"name": "Favourites"}, headers=auth_headers).json()["id"]
+        empty_shelf_id = client.post("/shelves/", json={"name": "Empty"}, headers=auth_headers).json()["id"]
+        on_shelf = client.post("/books/", json={**book_data, "title": "On Shelf"}, headers=auth_headers).json()["id"]
+        client.post("/books/", json={**book_data, "title": "No Shelf"}, headers=auth_headers)
+        client.post(f"/shelves/{shelf_id}/books", json={"book_id": on_shelf, "reading_status": "READ"}, headers=auth_headers)
+
+        response = client.get("/library/export", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+
+        by_title = {row["title"]: row for row in rows if row["book_id"]}
+        assert by_title["On Shelf"]["shelf_name"] == "Favourites"
+        assert by_title["On Shelf"]["reading_status"] == "READ"
+        assert by_title["No Shelf"]["shelf_id"] is None
+        assert any(row["shelf_id"] == empty_shelf_id and row["book_id"] is None for row in rows)
+
+    def test_export_library_csv(self, client: TestClient, auth_headers: dict, book_data: dict):
+        client.post("/books/", json=book_data, headers=auth_headers)
+
+        response = client.get("/library/export", params={"format": "csv"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="library.csv"' in response.headers["content-disposition"]
+        lines = response.text.splitlines()
+        assert lines[0].startswith("book_id,title,author")
+        assert any(book_data["title"] in line for line in lines[1:])
+
+        response = client.get("/library/export", params={"format": "xml"}, headers=auth_headers)
+        assert response.status_code == 422
+
+class TestLibraryImport:
+    """Test importing Goodreads library exports"""
+
+    GOODREADS_CSV = (
+        "Book Id,Title,Author,Publisher,Number of Pages,Year Published,Date Read,Bookshelves,Exclusive Shelf\n"
+        "1,The Hobbit,J.R.R. Tolkien,Allen & Unwin,310,1937,2021/03/14,\"fantasy, read\",read\n"
+        "2,Dune,Frank Herbert,Chilton,412,1965,,\"to-read, fantasy, sci-fi\",to-read\n"
+        "3,No Pages,Someone,,,2001,,,to-read\n"
+        "4,Emma,Jane Austen,John Murray,474,1815,,currently-reading,currently-reading\n"
+    )
+
+    def test_import_library(self, client: TestClient, auth_headers: dict, db: Session, monkeypatch):
+        monkeypatch.setattr(config, "BULK_CHUNK_SIZE", 2)
+        files = {"file": ("goodreads_library_export.csv", self.GOODREADS_CSV.encode(), "text/csv")}
+
+        response = client.post("/library/import", files=files, headers=auth_headers)
+        assert response.status_code == 202
+        job_id = response.json()["id"]
+
+        response = client.get(f"/library/import/{job_id}", headers=auth_headers)
+        assert response.status_code == 200
+        job = response.json()
+        assert job["status"] == "completed"
+        assert job["rows_processed"] == 4
+        assert job["rows_failed"] == 1
+        assert job["books_created"] == 3
+        assert job["shelf_entries_created"] == 6
+        assert job["errors"][0]["row"] == 3
+
+        placements = db.query(models.Book.title, models.Shelf.name, models.book_shelf.c.reading_status, models.book_shelf.c.finished_at)\
+            .join(models.book_shelf, models.book_shelf.c.book_id == models.Book.id)\
+            .join(models.Shelf, models.Shelf.id == models.book_shelf.c.shelf_id)\
+            .all()
+        by_book = {}
+        for title, shelf, status, finished_at in placements:
+            by_book.setdefault(title, {})[shelf] = (status, finished_at)
+        assert by_book["The Hobbit"]["Read"][0] == "READ"
+        assert by_book["The Hobbit"]["Read"][1].year == 2021
+        assert set(by_book["Dune"]) == {"Want to Read", "fantasy", "sci-fi"}
+        assert by_book["Emma"]["Currently Reading"][0] == "CURRENTLY_READING"
+
+    def test_import_library_without_returning(self, client: TestClient, auth_headers: dict, db: Session, monkeypatch):
+        from sqlalchemy import event
+        from tests.conftest import async_engine
+
+        # MySQL drivers have no executemany RETURNING
+        monkeypatch.setattr(async_engine.sync_engine.dialect, "insert_executemany_returning", False)
+        monkeypatch.setattr(config, "BULK_CHUNK_SIZE", 2)
+        inserts = []
+
+        def record_inserts(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith(("INSERT INTO books ", "INSERT INTO book_shelf ")):
+                inserts.append(statement.split()[2])
+
+        event.listen(async_engine.sync_engine, "before_cursor_execute", record_inserts)
+        try:
+            files = {"file": ("goodreads_library_export.csv", self.GOODREADS_CSV.encode(), "text/csv")}
+            job_id = client.post("/library/import", files=files, headers=auth_headers).json()["id"]
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", record_inserts)
+
+        job = client.get(f"/library/import/{job_id}", headers=auth_headers).json()
+        assert job["books_created"] == 3
+        assert job["shelf_entries_created"] == 6
+        # one statement per chunk for the books and one for their shelf entries
+        assert inserts == ["books", "book_shelf", "books", "book_shelf"]
+
+        shelved = db.query(models.Book.title).join(models.book_shelf, models.book_shelf.c.book_id == models.Book.id).distinct().all()
+        assert {title for title, in shelved} == {"The Hobbit", "Dune", "Emma"}
+
+    def test_import_library_with_interleaved_ids(self, client: TestClient, auth_headers: dict, second_user_headers: dict, db: Session, monkeypatch):
+        from sqlalchemy import text
+        from tests.conftest import async_engine, engine
+
+        monkeypatch.setattr(async_engine.sync_engine.dialect, "insert_executemany_returning", False)
+        # another user's book takes an id between the chunk's rows
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE TRIGGER interleave AFTER INSERT ON books WHEN NEW.title = 'The Hobbit' BEGIN "
+                "INSERT INTO books (title, author, genre, page_count, created_at, updated_at, user_id) "
+                "SELECT 'Not Yours', 'Someone', 'Fiction', 1, NEW.created_at, NEW.updated_at, id FROM users WHERE username = 'testuser2'; END"
+            ))
+        try:
+            files = {"file": ("goodreads_library_export.csv", self.GOODREADS_CSV.encode(), "text/csv")}
+            job_id = client.post("/library/import", files=files, headers=auth_headers).json()["id"]
+        finally:
+            with engine.begin() as connection:
+                connection.execute(text("DROP TRIGGER interleave"))
+
+        assert client.get(f"/library/import/{job_id}", headers=auth_headers).json()["status"] == "completed"
+        shelved = (
+            db.query(models.Book.title, models.User.username)
+            .join(models.book_shelf, models.book_shelf.c.book_id == models.Book.id)
+            .join(models.User, models.User.id == models.Book.user_id)
+            .distinct().all()
+        )
+        assert set(shelved) == {("The Hobbit", "testuser"), ("Dune", "testuser"), ("Emma", "testuser")}
+
+    def test_import_library_missing_columns(self, client: TestClient, auth_headers: dict):
+        files = {"file": ("books.csv", b"Name,Pages\nDune,412\n", "text/csv")}
+        job_id = client.post("/library/import", files=files, headers=auth_headers).json()["id"]
+
+        job = client.get(f"/library/import/{job_id}", headers=auth_headers).json()
+        assert job["status"] == "failed"
+        assert "Title" in job["errors"][-1]["error"]
+
+        response = client.get(f"/library/import/{job_id + 1}", headers=auth_headers)
+        assert response.status_code == 404
+
+class TestAdmin:
+    """Test admin-only endpoints"""
+
+    def test_pool_stats_requires_admin(self, client: TestClient, auth_headers: dict):
+        response = client.get("/admin/db/pool", headers=auth_headers)
+        assert response.status_code == 403
+
+    def test_get_pool_stats(self, client: TestClient, db: Session, admin_headers: dict, admin_data: dict):
+        # Users always sign up with the user role, so promote the admin directly
+        db.query(models.User).filter(models.User.username == admin_data["username"]).update({"role": "admin"})
+        db.commit()
+
+        response = client.get("/admin/db/pool", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert {"primary", "primary_async"} <= set(data)
+        assert "histogram" in data["primary"]["wait_time"]
+        assert "timeouts" in data["primary"]
+
+    def test_get_event_stats(self, client: TestClient, db: Session, admin_headers: dict, admin_data: dict):
+        db.query(models.User).filter(models.User.username == admin_data["username"]).update({"role": "admin"})
+        db.commit()
+
+        response = client.get("/admin/events", headers=admin_headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["transport"] == "memory"
+        assert data["transport_stats"] == {}
+
+    def test_reconcile_ratings(self, client: TestClient, db: Session, auth_headers: dict, admin_headers: dict, admin_data: dict, book_data: dict, review_data: dict):
+        db.query(models.User).filter(models.User.username == admin_data["username"]).update({"role": "admin"})
+        db.commit()
+        book_id = client.post("/books/", json=book_data, headers=admin_headers).json()["id"]
+        client.post("/reviews/", json={**review_data, "rating": 5, "book_id": book_id}, headers=auth_headers)
+
+        # simulate drift
+        db.query(models.Book).filter(models.Book.id == book_id).update({"rating_count": 7, "rating_5_count": 0})
+        db.commit()
+
+        response = client.post("/admin/books/reconcile-ratings", headers=admin_headers)
+        assert response.status_code == 200
+        assert response.json()["repaired"] == 1
+
+        db.expire_all()
+        book = db.query(models.Book).filter(models.Book.id == book_id).first()
+        assert (book.rating_count, book.rating_sum, book.rating_5_count, book.average_rating) == (1, 5, 1, 5.0)
+
+        response = client.post("/admin/books/reconcile-ratings", headers=admin_headers)
+        assert response.json()["repaired"] == 0
+
+
+class TestCache:
+    """Test the tiered Redis/LRU cache"""
+
+    @pytest.mark.asyncio
+    async def test_tiered_cache_hits_and_misses(self):
+        from fakeredis import FakeAsyncRedis
+        from book_api.core.cache import TieredCache
+
+        cache = TieredCache("test", FakeAsyncRedis(decode_responses=True), maxsize=2, ttl=60, local_ttl=60)
+        assert await cache.get(1) is None
+        await cache.set(1, {"total_reviews": 3})
+        assert await cache.get(1) == {"total_reviews": 3}
+
+        # another process with an empty LRU reads through to Redis
+        cache.local.clear()
+        assert await cache.get(1) == {"total_reviews": 3}
+
+        await cache.delete(1)
+        assert await cache.get(1) is None
+
+        snapshot = cache.snapshot()
+        assert (snapshot["local_hits"], snapshot["redis_hits"], snapshot["misses"]) == (1, 1, 2)
+        assert snapshot["invalidations"] == 1
+
+    @pytest.mark.asyncio
+    async def test_tiered_cache_drops_late_fills(self):
+        from fakeredis import FakeAsyncRedis
+        from book_api.core.cache import TieredCache
+
+        redis = FakeAsyncRedis(decode_responses=True)
+        cache = TieredCache("test", redis, maxsize=2, ttl=60, local_ttl=60)
+        other = TieredCache("test", redis, maxsize=2, ttl=60, local_ttl=60)
+
+        # a read misses and loads the old value, a write invalidates before the read fills
+        assert await cache.get(1) is None
+        await cache.delete(1)
+        await cache.set(1, {"total_reviews": 3})
+        assert await cache.get(1) is None
+        # another process's late fill is kept out by the Redis tombstone
+        await other.set(1, {"total_reviews": 3})
+        assert await other.get(1) is None
+
+        # once the tombstone expired the key fills again
+        await redis.delete("test:1")
+        other.invalidated.clear()
+        await other.set(1, {"total_reviews": 4})
+        assert await cache.get(1) == {"total_reviews": 4}
+
+    @pytest.mark.asyncio
+    async def test_tiered_cache_survives_redis_errors(self):
+        from fakeredis import FakeAsyncRedis, FakeServer
+        from book_api.core.cache import TieredCache
+
+        server = FakeServer()
+        server.connected = False
+        cache = TieredCache("test", FakeAsyncRedis(server=server), maxsize=2, ttl=60, local_ttl=60)
+
+        await cache.set(1, "value")
+        assert await cache.get(1) == "value"
+        assert cache.snapshot()["errors"] == 1
+
+    def test_lru_evicts_least_recently_used(self):
+        from book_api.core.cache import LRUCache
+
+        lru = LRUCache(maxsize=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        assert lru.get("b") is None
+        assert (lru.get("a"), lru.get("c")) == (1, 3)
+
+    def test_review_stats_are_cached(self, client: TestClient, auth_headers: dict, admin_headers: dict, book_data: dict, review_data: dict):
+        from book_api.utils.book_utils import review_stats_cache
+
+        book_id = client.post("/books/", json=book_data, headers=admin_headers).json()["id"]
+        review_id = client.post("/reviews/", json={**review_data, "rating": 4, "book_id": book_id}, headers=auth_headers).json()["id"]
+        # the review's invalidation keeps fills out for a while, let its tombstone expire
+        review_stats_cache.invalidated.clear()
+
+        client.get(f"/reviews/book/{book_id}/stats", headers=auth_headers)
+        stats = client.get(f"/reviews/book/{book_id}/stats", headers=auth_headers).json()
+        assert stats["average_rating"] == 4.0
+        assert (review_stats_cache.misses, review_stats_cache.local_hits) == (1, 1)
+
+        # the update_book_rating event invalidates the entry
+        client.put(f"/reviews/{review_id}", json={"rating": 1}, headers=auth_headers)
+        stats = client.get(f"/reviews/book/{book_id}/stats", headers=auth_headers).json()
+        assert stats["average_rating"] == 1.0
+        assert review_stats_cache.misses == 2
+
+
+class TestEventBus:
+    """Test event dispatch"""
+
+    @pytest.mark.asyncio
+    async def test_queued_publish_returns_before_handlers_finish(self):
+        import asyncio
+        from book_api.core.event_bus import EventBus, Event
+
+        bus = EventBus(dispatch="queued", workers_per_event=2)
+        handled = []
+
+        async def slow_handler(event):
+            await asyncio.sleep(0.05)
+            handled.append(event.data["n"])
+
+        bus.subscribe("slow", slow_handler)
+        for n in range(4):
+            await bus.publish(Event("slow", {"n": n}))
+        assert handled == []
+
+        # drain waits for every queued event and stops the workers
+        await bus.drain(timeout=5)
+        assert sorted(handled) == [0, 1, 2, 3]
+        stats = bus.snapshot()["events"]["slow"]
+        assert {key: stats[key] for key in ("queued", "workers", "processed", "overflows")} == {
+            "queued": 0, "workers": 0, "processed": 4, "overflows": 0
+        }
+
+    @pytest.mark.asyncio
+    async def test_full_queue_falls_back_to_inline(self):
+        import asyncio
+        from book_api.core.event_bus import EventBus, Event
+
+        bus = EventBus(dispatch="queued", queue_size=1, workers_per_event=1, enqueue_timeout=0.01)
+        release = asyncio.Event()
+        handled = []
+
+        async def blocked_handler(event):
+            if event.data["n"] == 0:
+                await release.wait()
+            handled.append(event.data["n"])
+
+        bus.subscribe("blocked", blocked_handler)
+        await bus.publish(Event("blocked", {"n": 0}))
+        await asyncio.sleep(0)  # let the worker pick up the first event
+        await bus.publish(Event("blocked", {"n": 1}))
+
+        # the queue is full, so the publisher runs the third event itself
+        await bus.publish(Event("blocked", {"n": 2}))
+        assert handled == [2]
+        assert bus.overflows["blocked"] == 1
+
+        release.set()
+        await bus.drain(timeout=5)
+        assert sorted(handled) == [0, 1, 2]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_handlers_run_in_parallel(self):
+        import asyncio
+        import time
+        from book_api.core.event_bus import EventBus, Event
+
+        bus = EventBus(concurrent_handlers=True, max_concurrent_handlers=3)
+        running = []
+        peak = []
+
+        def make_handler(n):
+            async def handler(event):
+                running.append(n)
+                peak.append(len(running))
+                await asyncio.sleep(0.05)
+                running.remove(n)
+            handler.__qualname__ = f"handler_{n}"
+            return handler
+
+        for n in range(4):
+            bus.subscribe("fanout", make_handler(n))
+
+        start = time.perf_counter()
+        await bus.publish(Event("fanout", {}))
+        elapsed = time.perf_counter() - start
+
+        # the semaphore lets three run at once, the fourth waits for a slot
+        assert max(peak) == 3
+        assert elapsed < 0.15
+        handlers = bus.snapshot()["events"]["fanout"]["handlers"]
+        assert len(handlers) == 4
+        assert all(stats["calls"] == 1 and stats["latency"]["max_seconds"] >= 0.04 for stats in handlers.values())
+
+    @pytest.mark.asyncio
+    async def test_handler_timeout_does_not_stop_other_handlers(self):
+        import asyncio
+        from book_api.core.event_bus import EventBus, Event
+
+        bus = EventBus(concurrent_handlers=True, handler_timeout=0.05)
+        handled = []
+
+        async def stuck_handler(event):
+            await asyncio.sleep(10)
+
+        async def quick_handler(event):
+            handled.append(event.name)
+
+        bus.subscribe("mixed", stuck_handler)
+        bus.subscribe("mixed", quick_handler)
+        errors = await bus.run_handlers(Event("mixed", {}), bus.subscribers["mixed"])
+
+        assert isinstance(errors[0], asyncio.TimeoutError)
+        assert errors[1] is None
+        assert handled == ["mixed"]
+        stats = {name.rsplit(".", 1)[-1]: value for name, value in bus.snapshot()["events"]["mixed"]["handlers"].items()}
+        assert stats["stuck_handler"]["timeouts"] == 1
+        assert stats["stuck_handler"]["errors"] == 1
+        assert stats["quick_handler"]["errors"] == 0
+
+    def test_unknown_dispatch_mode(self):
+        from book_api.core.event_bus import EventBus
+
+        with pytest.raises(ValueError):
+            EventBus(dispatch="threads")
+
+    @pytest.mark.asyncio
+    async def test_user_created_creates_default_shelves(self, db: Session, mocker):
+        from tests.conftest import AsyncTestingSessionLocal
+        from book_api.core.event_bus import Event, handle_user_created
+
+        user = models.User(username="shelver", email="shelver@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        mocker.patch("book_api.core.event_bus.AsyncSessionLocal", AsyncTestingSessionLocal)
+        welcome = mocker.patch("book_api.core.event_bus.email_service.send_welcome_email", new_callable=mocker.AsyncMock)
+
+        event = Event("user_created", {"user_id": user.id, "email": user.email})
+        await handle_user_created(event)
+        # a redelivered event finds the shelves and adds none
+        await handle_user_created(event)
+
+        names = {shelf.name for shelf in db.query(models.Shelf).filter(models.Shelf.user_id == user.id)}
+        assert names == {"Read", "Currently Reading", "Want to Read"}
+        assert welcome.await_count == 2
+
+
+class TestOutbox:
+    """Test the transactional outbox and its relay"""
+
+    def test_create_user_writes_outbox_row(self, client, db, user_data, mock_request_headers):
+        response = client.post("/users/", json=user_data, headers=mock_request_headers)
+        assert response.status_code == 200
+
+        row = db.query(models.OutboxEvent).filter(models.OutboxEvent.event_name == "user_created").one()
+        assert row.payload == {"email": user_data["email"], "user_id": response.json()["id"]}
+        assert row.dispatched_at is None
+        assert row.idempotency_key
+
+    def test_follow_writes_outbox_row(self, client, db, auth_headers, test_follow_user, mock_request_headers):
+        user_to_follow = client.post("/users/", json=test_follow_user, headers=mock_request_headers).json()
+        response = client.post(f"/users/{user_to_follow['id']}/follow", headers=auth_headers)
+        assert response.status_code == 200
+
+        row = db.query(models.OutboxEvent).filter(models.OutboxEvent.event_name == "new_follower").one()
+        assert row.payload["email"] == test_follow_user["email"]
+
+    @pytest.mark.asyncio
+    async def test_relay_delivers_pending_rows(self, scratch_session_factory):
+        from book_api.core.event_bus import EventBus
+        from book_api.core.outbox import OutboxRelay, add_outbox_event
+
+        async with scratch_session_factory() as session:
+            add_outbox_event(session, "greet", {"n": 1}, idempotency_key="greet-1")
+            add_outbox_event(session, "greet", {"n": 2}, idempotency_key="greet-2")
+            await session.commit()
+
+        bus = EventBus()
+        received = []
+
+        async def handler(event):
+            received.append((event.data["n"], event.key))
+
+        bus.subscribe("greet", handler)
+        relay = OutboxRelay(scratch_session_factory, bus)
+        assert await relay.relay_once() == 2
+        assert received == [(1, "greet-1"), (2, "greet-2")]
+
+        # dispatched rows are not delivered again
+        assert await relay.relay_once() == 0
+        async with scratch_session_factory() as session:
+            rows = (await session.scalars(select(models.OutboxEvent))).all()
+            assert all(row.dispatched_at is not None and row.attempts == 1 for row in rows)
+
+    @pytest.mark.asyncio
+    async def test_relay_delivers_claimed_rows_concurrently(self, scratch_session_factory):
+        import asyncio
+        from book_api.core.event_bus import EventBus
+        from book_api.core.outbox import OutboxRelay, add_outbox_event
+
+        async with scratch_session_factory() as session:
+            for n in range(3):
+                add_outbox_event(session, "greet", {"n": n})
+            await session.commit()
+
+        bus = EventBus()
+        arrived = []
+        everyone = asyncio.Event()
+
+        async def handler(event):
+            # only finishes once every event of the batch is being delivered
+            arrived.append(event.data["n"])
+            if len(arrived) == 3:
+                everyone.set()
+            await asyncio.wait_for(everyone.wait(), timeout=5)
+
+        bus.subscribe("greet", handler)
+        relay = OutboxRelay(scratch_session_factory, bus, concurrency=3)
+        assert await relay.relay_once() == 3
+        async with scratch_session_factory() as session:
+            rows = (await session.scalars(select(models.OutboxEvent))).all()
+            assert all(row.dispatched_at is not None for row in rows)
+
+    @pytest.mark.asyncio
+    async def test_relay_retries_only_failed_handlers(self, scratch_session_factory):
+        from book_api.core.event_bus import EventBus
+        from book_api.core.outbox import OutboxRelay, add_outbox_event
+
+        async with scratch_session_factory() as session:
+            add_outbox_event(session, "greet", {"n": 1})
+            await session.commit()
+
+        bus = EventBus()
+        calls = {"ok": 0, "flaky": 0}
+
+        async def ok_handler(event):
+            calls["ok"] += 1
+
+        async def flaky_handler(event):
+            calls["flaky"] += 1
+            if calls["flaky"] == 1:
+                raise RuntimeError("smtp down")
+
+        bus.subscribe("greet", ok_handler)
+        bus.subscribe("greet", flaky_handler)
+        relay = OutboxRelay(scratch_session_factory, bus, retry_delay=0)
+
+        await relay.relay_once()
+        async with scratch_session_factory() as session:
+            row = await session.scalar(select(models.OutboxEvent))
+            assert row.dispatched_at is None
+            assert row.attempts == 1
+            assert "smtp down" in row.last_error
+
+        await relay.relay_once()
+        assert calls == {"ok": 1, "flaky": 2}
+        async with scratch_session_factory() as session:
+            row = await session.scalar(select(models.OutboxEvent))
+            assert row.dispatched_at is not None
+            assert row.last_error is None
+
+    @pytest.mark.asyncio
+    async def test_relay_gives_up_after_max_attempts(self, scratch_session_factory):
+        from book_api.core.event_bus import EventBus
+        from book_api.core.outbox import OutboxRelay, add_outbox_event
+
+        async with scratch_session_factory() as session:
+            add_outbox_event(session, "greet", {"n": 1})
+            await session.commit()
+
+        bus = EventBus()
+
+        async def failing_handler(event):
+            raise RuntimeError("always")
+
+        bus.subscribe("greet", failing_handler)
+        relay = OutboxRelay(scratch_session_factory, bus, max_attempts=2, retry_delay=0)
+        assert await relay.relay_once() == 1
+        assert await relay.relay_once() == 1
+        assert await relay.relay_once() == 0
+
+    @pytest.mark.asyncio
+    async def test_relay_commits_claim_before_delivery(self, scratch_session_factory):
+        from datetime import datetime
+        from book_api.core.event_bus import EventBus
+        from book_api.core.outbox import OutboxRelay, add_outbox_event
+
+        async with scratch_session_factory() as session:
+            add_outbox_event(session, "greet", {"n": 1})
+            await session.commit()
+
+        bus = EventBus()
+        relay = OutboxRelay(scratch_session_factory, bus, lease=60)
+        seen = []
+
+        async def handler(event):
+            # the claim is committed, another relay finds nothing due
+            async with scratch_session_factory() as session:
+                row = await session.scalar(select(models.OutboxEvent))
+                seen.append((row.attempts, row.available_at > datetime.utcnow(), row.dispatched_at))
+            assert await OutboxRelay(scratch_session_factory, bus).relay_once() == 0
+
+        bus.subscribe("greet", handler)
+        assert await relay.relay_once() == 1
+        assert seen == [(1, True, None)]
+        async with scratch_session_factory() as session:
+            assert (await session.scalar(select(models.OutboxEvent))).dispatched_at is not None
+
+    @pytest.mark.asyncio
+    async def test_relay_hands_events_to_a_broker_transport(self, scratch_session_factory):
+        from fakeredis import FakeAsyncRedis
+        from book_api.core.event_bus import EventBus, RedisStreamsTransport, decode_stream_event
+        from book_api.core.outbox import OutboxRelay, add_outbox_event
+
+        async with scratch_session_factory() as session:
+            add_outbox_event(session, "greet", {"n": 1}, idempotency_key="greet-1")
+            await session.commit()
+
+        transport = RedisStreamsTransport(FakeAsyncRedis(decode_responses=True), prefix="test-outbox")
+        bus = EventBus(transport=transport)
+        called = []
+
+        async def handler(event):
+            called.append(event)
+
+        bus.subscribe("greet", handler)
+        assert await OutboxRelay(scratch_session_factory, bus).relay_once() == 1
+
+        # the stream consumers run the handler, not the relay
+        assert called == []
+        [(_, fields)] = await transport.redis.xrange("test-outbox:greet")
+        event, attempts, delivered = decode_stream_event(fields)
+        assert (event.data, event.key, attempts, delivered) == ({"n": 1}, "greet-1", 0, [])
+        async with scratch_session_factory() as session:
+            assert (await session.scalar(select(models.OutboxEvent))).dispatched_at is not None
+
+
+class TestRedisStreams:
+    """Test the Redis Streams event transport and its consumers"""
+
+    @pytest.mark.asyncio
+    async def test_publish_adds_to_stream_and_consumer_handles_it(self, make_stream_bus):
+        from book_api.core.event_bus import Event
+
+        received = []
+
+        async def handler(event):
+            received.append((event.data["n"], event.key))
+
+        bus, transport, consumer = make_stream_bus([handler])
+        await consumer.ensure_groups()
+        await bus.publish(Event("greet", {"n": 1}, key="greet-1"))
+
+        # the publisher only adds the event, a consumer runs the handlers
+        assert received == []
+        assert await transport.redis.xlen("test-events:greet") == 1
+
+        assert await consumer.consume_once() == 1
+        assert received == [(1, "greet-1")]
+        assert (await transport.redis.xpending("test-events:greet", transport.group))["pending"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_handlers_are_retried_alone(self, make_stream_bus):
+        from book_api.core.event_bus import Event
+
+        calls = {"ok": 0, "flaky": 0}
+        keys = []
+
+        async def ok_handler(event):
+            calls["ok"] += 1
+
+        async def flaky_handler(event):
+            calls["flaky"] += 1
+            keys.append(event.key)
+            if calls["flaky"] == 1:
+                raise RuntimeError("smtp down")
+
+        bus, transport, consumer = make_stream_bus([ok_handler, flaky_handler], retry_delay=0)
+        await consumer.ensure_groups()
+        await bus.publish(Event("greet", {"n": 1}))
+
+        await consumer.consume_once()
+        assert await transport.redis.zcard(transport.retry_key) == 1
+
+        assert await consumer.requeue_due_retries() == 1
+        assert await consumer.consume_once() == 1
+        assert calls == {"ok": 1, "flaky": 2}
+        assert keys[0] is not None and keys[0] == keys[1]
+        assert await transport.redis.zcard(transport.retry_key) == 0
+
+    @pytest.mark.asyncio
+    async def test_exhausted_events_are_dead_lettered(self, make_stream_bus):
+        from book_api.core.event_bus import Event
+
+        async def failing_handler(event):
+            raise RuntimeError("always")
+
+        bus, transport, consumer = make_stream_bus([failing_handler], max_attempts=2, retry_delay=0)
+        await consumer.ensure_groups()
+        await bus.publish(Event("greet", {"n": 1}))
+
+        await consumer.consume_once()
+        await consumer.requeue_due_retries()
+        await consumer.consume_once()
+
+        assert await transport.redis.zcard(transport.retry_key) == 0
+        dead = await transport.redis.xrange(transport.dead_letter_stream)
+        assert len(dead) == 1
+        assert dead[0][1]["attempts"] == "2"
+        assert "always" in dead[0][1]["error"]
+
+    @pytest.mark.asyncio
+    async def test_stalled_events_are_claimed(self, make_stream_bus):
+        from book_api.core.event_bus import Event
+
+        received = []
+
+        async def handler(event):
+            received.append(event.data["n"])
+
+        bus, transport, consumer = make_stream_bus([handler], claim_idle=0)
+        await consumer.ensure_groups()
+        await bus.publish(Event("greet", {"n": 1}))
+
+        # another consumer reads the event and dies before acknowledging it
+        await transport.redis.xreadgroup(transport.group, "dead-consumer", {"test-events:greet": ">"})
+
+        assert await consumer.consume_once() == 0
+        assert await consumer.claim_stale() == 1
+        assert received == [1]
+        assert (await transport.redis.xpending("test-events:greet", transport.group))["pending"] == 0
+
+    def test_redis_transport_needs_redis_url(self, monkeypatch):
+        from book_api.core import event_bus as event_bus_module
+
+        monkeypatch.setattr(event_bus_module, "redis_client", None)
+        with pytest.raises(ValueError):
+            event_bus_module.create_transport("redis")
+
+
+class TestNotificationDigests:
+    """Test per-recipient notification digests"""
+
+    def test_update_notification_frequency(self, client, auth_headers):
+        response = client.put("/users/me", json={"notification_frequency": "daily"}, headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["notification_frequency"] == "daily"
+
+        response = client.put("/users/me", json={"notification_frequency": "weekly"}, headers=auth_headers)
+        assert response.status_code == 422
+
+    @pytest.mark.asyncio
+    async def test_queue_follows_preferences(self, scratch_session_factory, add_scratch_user):
+        from book_api.services.notifications.digest import DigestRouting, queue_for_digest
+
+        hourly = await add_scratch_user("hourly", "hourly")
+        instant = await add_scratch_user("instant", "instant")
+        muted = await add_scratch_user("muted", "off")
+
+        data = {"user_id": hourly, "follower_name": "alice"}
+        assert await queue_for_digest("new_follower", data, "follow-1", scratch_session_factory) is DigestRouting.QUEUED
+        # a redelivered event is only stored once
+        assert await queue_for_digest("new_follower", data, "follow-1", scratch_session_factory) is DigestRouting.QUEUED
+        assert await queue_for_digest("new_follower", {"user_id": instant}, "follow-2", scratch_session_factory) is DigestRouting.SEND
+        assert await queue_for_digest("new_follower", {"user_id": muted}, "follow-3", scratch_session_factory) is DigestRouting.SKIP
+        # events without a recipient id are sent right away
+        assert await queue_for_digest("new_follower", {"email": "old@example.com"}, "follow-4", scratch_session_factory) is DigestRouting.SEND
+        # a recipient deleted since the event was written gets nothing
+        assert await queue_for_digest("new_follower", {"user_id": 999, "email": "gone@example.com"}, "follow-5", scratch_session_factory) is DigestRouting.SKIP
+
+        async with scratch_session_factory() as session:
+            items = (await session.scalars(select(models.NotificationDigestItem))).all()
+            assert [(item.user_id, item.payload["follower_name"]) for item in items] == [(hourly, "alice")]
+
+    @pytest.mark.asyncio
+    async def test_flush_sends_one_digest_per_due_recipient(self, mocker, scratch_session_factory, add_scratch_user):
+        from datetime import datetime, timedelta
+        from book_api.services.notifications.digest import DigestFlusher, queue_for_digest
+        from book_api.services.notifications.email_service import email_service
+
+        send = mocker.patch.object(email_service, "send_notification_digest")
+        due = await add_scratch_user("due", "hourly")
+        waiting = await add_scratch_user("waiting", "daily")
+
+        for n in range(3):
+            await queue_for_digest("new_follower", {"user_id": due, "follower_name": f"fan{n}", "follower_profile_url": f"/users/{n}"}, None, scratch_session_factory)
+        await queue_for_digest("new_review", {"user_id": due, "book_title": "Dune", "reviewer_name": "bob", "review_url": "/reviews/1"}, None, scratch_session_factory)
+        await queue_for_digest("new_follower", {"user_id": waiting, "follower_name": "fan"}, None, scratch_session_factory)
+
+        # both users' items are two hours old, only the hourly window has passed
+        async with scratch_session_factory() as session:
+            await session.execute(
+                models.NotificationDigestItem.__table__.update().values(created_at=datetime.utcnow() - timedelta(hours=2))
+            )
+            await session.commit()
+
+        flusher = DigestFlusher(scratch_session_factory)
+        assert await flusher.flush_due() == 1
+
+        send.assert_called_once()
+        email, followers, reviews = send.call_args[0]
+        assert email == "due@example.com"
+        assert [follower["name"] for follower in followers] == ["fan0", "fan1", "fan2"]
+        assert reviews == [{"book_title": "Dune", "reviews": [{"reviewer_name": "bob", "review_url": "/reviews/1"}]}]
+
+        async with scratch_session_factory() as session:
+            items = (await session.scalars(select(models.NotificationDigestItem))).all()
+            assert [item.user_id for item in items] == [waiting]
+
+    @pytest.mark.asyncio
+    async def test_failed_send_keeps_items(self, mocker, scratch_session_factory, add_scratch_user):
+        from book_api.services.notifications.digest import DigestFlusher, queue_for_digest
+        from book_api.services.notifications.email_service import email_service
+
+        mocker.patch.object(email_service, "send_notification_digest", side_effect=RuntimeError("smtp down"))
+        user_id = await add_scratch_user("reader", "hourly")
+        await queue_for_digest("new_follower", {"user_id": user_id, "follower_name": "fan"}, None, scratch_session_factory)
+
+        # switching to instant notifications makes the waiting items due at once
+        async with scratch_session_factory() as session:
+            await session.execute(models.User.__table__.update().values(notification_frequency="instant"))
+            await session.commit()
+
+        flusher = DigestFlusher(scratch_session_factory)
+        assert await flusher.flush_due() == 0
+        async with scratch_session_factory() as session:
+            items = (await session.scalars(select(models.NotificationDigestItem))).all()
+            assert [(item.user_id, item.payload["follower_name"]) for item in items] == [(user_id, "fan")]
+
+    @pytest.mark.asyncio
+    async def test_items_are_taken_before_the_send(self, mocker, scratch_session_factory, add_scratch_user):
+        from book_api.services.notifications.digest import DigestFlusher, queue_for_digest
+        from book_api.services.notifications.email_service import email_service
+
+        waiting_during_send = []
+
+        async def send(*args):
+            # the taking transaction has committed, nothing is locked while the email goes out
+            async with scratch_session_factory() as session:
+                waiting_during_send.append(len((await session.scalars(select(models.NotificationDigestItem))).all()))
+
+        mocker.patch.object(email_service, "send_notification_digest", side_effect=send)
+        users = [await add_scratch_user(f"reader{n}", "instant") for n in range(3)]
+        async with scratch_session_factory() as session:
+            for user_id in users:
+                session.add(models.NotificationDigestItem(user_id=user_id, kind="new_follower", payload={"follower_name": "fan"}))
+            await session.commit()
+
+        assert await DigestFlusher(scratch_session_factory, concurrency=3).flush_due() == 3
+        assert len(waiting_during_send) == 3
+        assert waiting_during_send[0] < 3
+
+    @pytest.mark.asyncio
+    async def test_no_instant_email_for_deleted_recipient(self, mocker):
+        from book_api.core.event_bus import Event, handle_new_follower
+        from book_api.services.notifications.digest import DigestRouting
+        from book_api.services.notifications.email_service import email_service
+
+        mocker.patch("book_api.core.event_bus.queue_for_digest", return_value=DigestRouting.SKIP)
+        send = mocker.patch.object(email_service, "follower_notification")
+        await handle_new_follower(Event(name="new_follower", data={"user_id": 999, "email": "gone@example.com"}))
+        send.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_flush_drops_items_of_deleted_recipient(self, mocker, scratch_session_factory, add_scratch_user):
+        from book_api.services.notifications.digest import DigestFlusher, queue_for_digest
+        from book_api.services.notifications.email_service import email_service
+
+        send = mocker.patch.object(email_service, "send_notification_digest")
+        user_id = await add_scratch_user("gone", "hourly")
+        await queue_for_digest("new_follower", {"user_id": user_id, "follower_name": "fan"}, None, scratch_session_factory)
+
+        async with scratch_session_factory() as session:
+            await session.execute(models.User.__table__.delete().where(models.User.id == user_id))
+            await session.commit()
+
+        assert await DigestFlusher(scratch_session_factory).flush_recipient(user_id) == 1
+        send.assert_not_called()
+        async with scratch_session_factory() as session:
+            assert (await session.scalars(select(models.NotificationDigestItem))).all() == []
+
+    @pytest.mark.asyncio
+    async def test_rows_without_a_preference_stay_instant(self, scratch_session_factory):
+        from sqlalchemy import text
+
+        async with scratch_session_factory() as session:
+            # users created through the model opt into hourly digests
+            session.add(models.User(username="new", email="new@example.com", hashed_password="x"))
+            # rows the database fills in itself, like the ones from before digests, stay instant
+            await session.execute(text(
+                "INSERT INTO users (username, email, hashed_password, role, created_at, updated_at, followers_count, following_count) "
+                "VALUES ('old', 'old@example.com', 'x', 'user', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 0, 0)"
+            ))
+            await session.commit()
+            rows = (await session.execute(select(models.User.username, models.User.notification_frequency))).all()
+        assert dict(rows) == {"new": "hourly", "old": "instant"}
+
+
+class TestPoolMetrics:
+    """Test connection pool telemetry"""
+
+    def test_records_checkouts_and_wait_times(self, tmp_path):
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import QueuePool
+        from book_api.core.pool_metrics import PoolMetrics, instrumented_pool_class
+
+        metrics = PoolMetrics("test")
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=instrumented_pool_class(QueuePool, metrics),
+            pool_size=1,
+            max_overflow=0
+        )
+        metrics.attach(engine)
+
+        with engine.connect():
+            snapshot = metrics.snapshot()
+            assert snapshot["checked_out"] == 1
+
+        snapshot = metrics.snapshot()
+        assert snapshot["checked_out"] == 0
+        assert snapshot["checkouts"] == 1
+        assert snapshot["checkins"] == 1
+        assert snapshot["wait_time"]["count"] == 1
+        assert sum(bucket["count"] for bucket in snapshot["wait_time"]["histogram"]) == 1
+
+    def test_records_pool_timeouts(self, tmp_path):
+        from sqlalchemy import create_engine
+        from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+        from sqlalchemy.pool import QueuePool
+        from book_api.core.pool_metrics import PoolMetrics, instrumented_pool_class
+
+        metrics = PoolMetrics("test")
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'pool.db'}",
+            poolclass=instrumented_pool_class(QueuePool, metrics),
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05
+        )
+        metrics.attach(engine)
+
+        with engine.connect():
+            with pytest.raises(PoolTimeoutError):
+                engine.connect()
+
+        assert metrics.snapshot()["timeouts"] == 1
+
+
+class TestReadReplicaRouting:
+    """Test routing of read-only sessions to read replicas"""
+
+    @pytest.fixture
+    def routed_engines(self, tmp_path):
+        from book_api.models import Base
+        engines = {}
+        for name in ("primary", "replica"):
+            engines[name] = create_engine(f"sqlite:///{tmp_path / name}.db")
+            Base.metadata.create_all(bind=engines[name])
+            with Session(engines[name]) as session:
+                session.add(models.User(username=f"{name}_user", email=f"{name}@example.com", hashed_password="x"))
+                session.commit()
+        return engines
+
+    @pytest.fixture
+    def routing_session(self, routed_engines):
+        from book_api.core.db_routing import ReplicaSet, routing_session_class
+        return routing_session_class(
+            "TestRoutingSession",
+            routed_engines["primary"],
+            ReplicaSet([routed_engines["replica"]])
+        )
+
+    def test_read_only_session_uses_replica(self, routing_session):
+        with routing_session() as session:
+            session.info["read_only"] = True
+            assert session.query(models.User).one().username == "replica_user"
+
+    def test_default_session_uses_primary(self, routing_session):
+        with routing_session() as session:
+            assert session.query(models.User).one().username == "primary_user"
+
+    def test_read_after_write_uses_primary(self, routing_session):
+        with routing_session() as session:
+            session.info["read_only"] = True
+            session.add(models.User(username="new_user", email="new@example.com", hashed_password="x"))
+            session.flush()
+
+            usernames = {user.username for user in session.query(models.User).all()}
+            assert usernames == {"primary_user", "new_user"}
+
+    def test_round_robin_selection(self, routed_engines):
+        from book_api.core.db_routing import ReplicaSet
+        replicas = ReplicaSet([routed_engines["primary"], routed_engines["replica"]])
+        assert [replicas.choose() for _ in range(4)] == [
+            routed_engines["primary"],
+            routed_engines["replica"],
+            routed_engines["primary"],
+            routed_engines["replica"]
+        ]
+
+    def test_least_connections_selection(self, routed_engines):
+        from book_api.core.db_routing import ReplicaSet
+        replicas = ReplicaSet([routed_engines["primary"], routed_engines["replica"]], "least_connections")
+        with routed_engines["primary"].connect():
+            assert replicas.choose() is routed_engines["replica"]
+class TestLazySessions:
+    """Test sessions that are created on first use"""
+
+    def test_session_created_on_first_use(self):
+        from tests.conftest import TestingSessionLocal
+        from book_api.core.lazy_session import LazySession
+
+        db = LazySession(TestingSessionLocal, {"read_only": True})
+        db.info["tag"] = "test"
+        assert not db.is_open
+        assert db.created == 0
+
+        db.query(models.User).all()
+        assert db.is_open
+        assert db.created == 1
+        assert db.session.info["read_only"] is True
+        assert db.session.info["tag"] == "test"
+
+        db.close()
+        assert not db.is_open
+        assert db.info["tag"] == "test"
+
+    def test_session_released_before_serialization(self):
+        from fastapi import APIRouter, Depends, FastAPI
+        from pydantic import BaseModel, field_validator
+        from tests.conftest import AsyncTestingSessionLocal
+        from book_api.core.lazy_session import ReleasingRoute
+        from book_api.database import get_async_db, get_async_session_factory
+
+        sessions = []
+        open_while_serializing = []
+
+        class UserCount(BaseModel):
+            count: int
+
+            @field_validator("count")
+            @classmethod
+            def record_session(cls, value):
+                open_while_serializing.append(sessions[0].is_open)
+                return value
+
+        router = APIRouter(route_class=ReleasingRoute)
+
+        @router.get("/count", response_model=UserCount)
+        async def count_users(db=Depends(get_async_db)):
+            sessions.append(db)
+            result = await db.execute(select(models.User))
+            return {"count": len(result.all())}
+
+        app = FastAPI()
+        app.include_router(router)
+        app.dependency_overrides[get_async_session_factory] = lambda: AsyncTestingSessionLocal
+
+        response = TestClient(app).get("/count")
+        assert response.status_code == 200
+        assert sessions[0].created == 1
+        assert open_while_serializing == [False]
+
+    def test_rejected_request_creates_no_session(self, client: TestClient, auth_headers: dict, mocker):
+        from tests.conftest import AsyncTestingSessionLocal
+        from book_api.main import app
+        from book_api.database import get_async_session_factory
+
+        # the first request caches the principal
+        assert client.get("/books/", headers=auth_headers).status_code == 200
+
+        factory = mocker.Mock(side_effect=AsyncTestingSessionLocal)
+        app.dependency_overrides[get_async_session_factory] = lambda: factory
+
+        response = client.get("/books/not-a-number", headers=auth_headers)
+        assert response.status_code == 422
+        factory.assert_not_called()
+
+    def test_introspection_creates_no_session(self, client: TestClient, auth_headers: dict, mocker):
+        from tests.conftest import TestingSessionLocal
+        from book_api.main import app
+        from book_api.database import get_db
+
+        factory = mocker.patch("book_api.database.SessionLocal", side_effect=TestingSessionLocal)
+        app.dependency_overrides.pop(get_db)
+
+        response = client.post("/graphql", headers=auth_headers, json={"query": "{ __schema { queryType { name } } }"})
+        assert response.status_code == 200
+        assert response.json()["data"]["__schema"]["queryType"]["name"] == "Query"
+        factory.assert_not_called()
+
+        response = client.post("/graphql", headers=auth_headers, json={"query": "{ getCommentsForReview(reviewId: 1) { id } }"})
+        assert response.status_code == 200
+        assert response.json()["data"]["getCommentsForReview"] == []
+        factory.assert_called_once()
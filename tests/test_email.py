@@ -1,5 +1,9 @@
 import pytest
+import asyncio
+import time
+from jinja2 import UndefinedError
 from book_api.services.notifications.email_service import email_service
+from book_api.services.notifications.templates import EmailTemplates
 
 
 class TestEmailService:
@@ -61,4 +65,213 @@ class TestEmailService:
         assert message.subject == "New Review"
         assert message.recipients == ["test@example"]
         assert "New Review" in message.body
-        assert "The Tale of Two Cities" in message.body
\ No newline at end of file
+        assert "The Tale of Two Cities" in message.body
+
+    @pytest.mark.asyncio
+    async def test_notification_digest(self, mocker):
+        mock_send = mocker.patch.object(email_service.fastmail, "send_message")
+        followers = [{"name": f"fan{n}", "profile_url": f"http://test.com/users/{n}"} for n in range(12)]
+        reviews = [{"book_title": "Dune", "reviews": [{"reviewer_name": "bob", "review_url": "http://test.com/reviews/1"}]}]
+
+        await email_service.send_notification_digest("test@example.com", followers, reviews)
+
+        mock_send.assert_called_once()
+        message = mock_send.call_args[0][0]
+        assert message.subject == "Your BookReads updates: 12 new followers and 1 new review"
+        assert message.recipients == ["test@example.com"]
+        assert "fan9" in message.body
+        assert "fan10" not in message.body
+        assert "and 2 others" in message.body
+        assert "Dune" in message.body
+
+
+def make_message(recipient: str = "reader@example.com", subject: str = "New Review"):
+    from fastapi_mail import MessageSchema
+
+    return MessageSchema(subject=subject, recipients=[recipient], body="<p>Hello</p>", subtype="html")
+
+
+class TestEmailDelivery:
+
+    @pytest.mark.asyncio
+    async def test_batches_share_one_connection(self, smtp_server, make_delivery_worker):
+        worker = make_delivery_worker()
+        worker.start()
+        for n in range(5):
+            await worker.submit(make_message(f"reader{n}@example.com"))
+        await worker.stop(timeout=10)
+
+        assert len(smtp_server.messages) == 5
+        assert worker.pool.connects == 1
+        assert worker.snapshot()["sent"] == 5
+
+    @pytest.mark.asyncio
+    async def test_transient_failure_is_retried(self, smtp_server, make_delivery_worker):
+        smtp_server.replies = ["451 Try again later"]
+        worker = make_delivery_worker(retry_delay=0.01)
+        worker.start()
+        await worker.submit(make_message())
+
+        # stop waits for the queue, so wait for the retry to be queued first
+        for _ in range(100):
+            if smtp_server.messages:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop(timeout=10)
+
+        assert len(smtp_server.messages) == 1
+        assert worker.retried == 1
+        assert worker.failed == 0
+
+    @pytest.mark.asyncio
+    async def test_permanent_failure_is_dropped(self, smtp_server, make_delivery_worker):
+        smtp_server.replies = ["550 No such user"]
+        worker = make_delivery_worker(retry_delay=0.01)
+        worker.start()
+        await worker.submit(make_message("missing@example.com"))
+        await worker.submit(make_message())
+        await worker.stop(timeout=10)
+
+        # the refused message does not cost the next one its connection
+        assert worker.failed == 1
+        assert worker.retried == 0
+        assert len(smtp_server.messages) == 1
+        assert worker.pool.connects == 1
+
+    @pytest.mark.asyncio
+    async def test_submit_waits_for_the_send(self, smtp_server, make_delivery_worker):
+        worker = make_delivery_worker()
+        worker.start()
+        await worker.submit(make_message(), wait=True)
+        assert len(smtp_server.messages) == 1
+
+        # a transient failure is retried before the waiting caller is answered
+        smtp_server.replies = ["451 Try again later"]
+        await worker.submit(make_message(), wait=True)
+        assert len(smtp_server.messages) == 2
+        assert worker.retried == 1
+
+        # a permanent one is raised to the caller
+        smtp_server.replies = ["550 No such user"]
+        with pytest.raises(Exception, match="No such user"):
+            await worker.submit(make_message(), wait=True)
+        await worker.stop(timeout=10)
+        assert worker.failed == 1
+
+    @pytest.mark.asyncio
+    async def test_waiting_callers_share_a_batch(self, smtp_server, make_delivery_worker):
+        worker = make_delivery_worker(retry_delay=0.01)
+        worker.start()
+        await asyncio.gather(*(worker.submit(make_message(f"reader{n}@example.com"), wait=True) for n in range(5)))
+        await worker.stop(timeout=10)
+
+        assert len(smtp_server.messages) == 5
+        assert worker.batches == 1
+
+    @pytest.mark.asyncio
+    async def test_sends_text_with_html_alternative(self, smtp_server, make_delivery_worker):
+        from email import message_from_bytes
+        from fastapi_mail import MessageSchema
+
+        worker = make_delivery_worker()
+        worker.start()
+        await worker.submit(MessageSchema(
+            subject="Welcome",
+            recipients=["reader@example.com"],
+            bcc=["audit@example.com"],
+            body="Hello",
+            alternative_body="<p>Hello</p>",
+            subtype="plain",
+            multipart_subtype="alternative"
+        ), wait=True)
+        await worker.stop(timeout=10)
+
+        envelope = smtp_server.messages[0]
+        message = message_from_bytes(envelope.content)
+        assert envelope.rcpt_tos == ["reader@example.com", "audit@example.com"]
+        assert message["From"] == "books@example.com"
+        assert message["Bcc"] is None
+        assert message.get_content_type() == "multipart/alternative"
+        assert [part.get_content_type() for part in message.get_payload()] == ["text/plain", "text/html"]
+
+    @pytest.mark.asyncio
+    async def test_throttled_domain_does_not_hold_a_connection(self, smtp_server, make_delivery_worker):
+        worker = make_delivery_worker(rate_limits={"slow.com": 1})
+        worker.start()
+        for recipient in ("a@slow.com", "b@slow.com", "c@example.com"):
+            await worker.submit(make_message(recipient))
+
+        # b@slow.com waits a second for a token, with the connection back in the pool
+        await asyncio.sleep(0.2)
+        assert [message.rcpt_tos for message in smtp_server.messages] == [["a@slow.com"], ["c@example.com"]]
+        assert worker.pool.in_use == 0
+
+        await worker.stop(timeout=10)
+        assert len(smtp_server.messages) == 3
+
+    def test_rate_limits_by_recipient_domain(self, make_delivery_worker):
+        worker = make_delivery_worker(rate_limits={"gmail.com": 5, "default": 20})
+
+        assert worker._bucket("gmail.com").rate == 5
+        assert worker._bucket("example.com") is worker._bucket("yahoo.com")
+        assert worker._bucket("example.com").rate == 20
+
+    @pytest.mark.asyncio
+    async def test_token_bucket_waits_for_tokens(self):
+        from book_api.core.rate_limiter import TokenBucket
+
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+
+        # the first token is there, the other two take 1/20s each
+        assert time.monotonic() - start >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_email_service_queues_while_delivery_runs(self, smtp_server, mocker, make_delivery_worker):
+        worker = make_delivery_worker()
+        mocker.patch("book_api.services.notifications.email_service.email_delivery", worker)
+        mock_send = mocker.patch.object(email_service.fastmail, "send_message")
+
+        worker.start()
+        await email_service.send_welcome_email("test@example.com")
+        await worker.stop(timeout=10)
+
+        mock_send.assert_not_called()
+        assert len(smtp_server.messages) == 1
+        assert smtp_server.messages[0].rcpt_tos == ["test@example.com"]
+
+
+class TestEmailTemplates:
+
+    @pytest.mark.asyncio
+    async def test_sends_text_and_html_alternatives(self, mocker):
+        mock_send = mocker.patch.object(email_service.fastmail, "send_message")
+
+        await email_service.follower_notification(
+            "test@example.com",
+            "<b>Mallory</b>",
+            "http://test.com/profile/1"
+        )
+
+        message = mock_send.call_args[0][0]
+        assert message.multipart_subtype.value == "alternative"
+        assert "<b>Mallory</b>" in message.body
+        assert "&lt;b&gt;Mallory&lt;/b&gt;" in message.alternative_body
+        assert "<b>Mallory</b>" not in message.alternative_body
+
+    def test_cached_render_is_reused(self):
+        templates = EmailTemplates(globals={"frontend_url": "http://test.com"})
+
+        first = templates.render("welcome", {}, cache_key="welcome")
+        second = templates.render("welcome", {}, cache_key="welcome")
+
+        assert second is first
+        assert templates.render("welcome", {}) is not first
+
+    def test_missing_variable_raises(self):
+        templates = EmailTemplates(globals={"frontend_url": "http://test.com"})
+
+        with pytest.raises(UndefinedError):
+            templates.render("new_follower", {"follower": "TestFollower"})
@@ -363,4 +363,41 @@ class TestGraphQLAuthentication:
             assert any(
                 text in error_message
                 for text in ["validate", "credentials", "authentication"]
-            ), f"Expected auth error message, got: {error_message}"
\ No newline at end of file
+            ), f"Expected auth error message, got: {error_message}"
+
+    def test_revoked_session(self, client: TestClient, auth_headers: dict):
+        """Test that tokens of a logged out session are rejected"""
+        query = """
+        query {
+            getCommentsForReview(reviewId: 1) {
+                id
+            }
+        }
+        """
+        client.post("/users/logout", headers=auth_headers)
+
+        response = client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": query}
+        )
+
+        assert response.status_code == 401
+        assert "credentials" in response.json()["detail"].lower()
+
+    def test_deleted_user(self, client: TestClient, db, user_data: dict, auth_headers: dict):
+        """Test that tokens of a deleted user are rejected before the operation runs"""
+        from book_api.models import User
+
+        client.post("/graphql", headers=auth_headers, json={"query": "{ __typename }"})
+        db.delete(db.query(User).filter(User.username == user_data["username"]).one())
+        db.commit()
+
+        response = client.post(
+            "/graphql",
+            headers=auth_headers,
+            json={"query": "{ getCommentsForReview(reviewId: 1) { id } }"}
+        )
+
+        assert response.status_code == 401
+        assert "credentials" in response.json()["detail"].lower()